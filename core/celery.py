@@ -0,0 +1,29 @@
+"""
+Celery application for the core project.
+
+Workers are started with ``celery -A core worker``; task settings are
+read from the ``CELERY_*`` Django settings.
+"""
+
+import os
+
+from celery import Celery
+from celery.signals import worker_init
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+app = Celery("core")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def check_shared_cache(**kwargs):
+    from core.serving import shared_cache
+
+    try:
+        # Workers write beside the server processes.
+        shared_cache(2)
+    except ValueError as e:
+        # Celery only logs what signal handlers raise.
+        raise SystemExit(str(e))
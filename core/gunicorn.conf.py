@@ -0,0 +1,49 @@
+"""Gunicorn configuration of ``manage.py serve``.
+
+Workers serve requests on a fixed pool of threads, each keeping its
+database connection between requests, so the server holds at most
+workers x threads connections.
+"""
+
+import os
+
+wsgi_app = "core.wsgi:application"
+bind = os.environ.get("SERVE_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("SERVE_WORKERS", 2 * (os.cpu_count() or 1)))
+threads = int(os.environ.get("SERVE_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.environ.get("SERVE_TIMEOUT", 30))
+graceful_timeout = timeout
+keepalive = 5
+# Recycle workers now and then, staggered, to bound memory growth.
+max_requests = int(os.environ.get("SERVE_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    import django
+
+    django.setup()
+    from core.serving import connection_budget, shared_cache
+
+    try:
+        connection_budget(server.cfg.workers, server.cfg.threads)
+        shared_cache(server.cfg.workers)
+    except ValueError as e:
+        # Gunicorn reports RuntimeError and exits.
+        raise RuntimeError(str(e))
+
+
+def post_worker_init(worker):
+    from core.serving import warm_up
+    from sensor import latest
+    from sensor.spool import get_spool
+
+    # Runs after the application is loaded and before the worker
+    # accepts connections. Only threaded workers have a pool.
+    executor = getattr(worker, "tpool", None)
+    opened = warm_up(executor, worker.cfg.threads if executor else 1)
+    worker.log.info("Warmed up with %d database connections.", opened)
+    latest.ensure_warm()
+    # Recover and drain what earlier workers left in the spool.
+    get_spool()
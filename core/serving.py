@@ -0,0 +1,126 @@
+"""Worker start-up for ``manage.py serve``.
+
+Each server worker warms up before it accepts traffic: it imports the
+modules on the request path, resolves the URL configuration and, when
+connections persist across requests, opens one database connection
+for each of its threads. The first requests a worker serves then no
+longer pay for imports and connection set-up.
+"""
+
+import importlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.urls import get_resolver
+
+HOT_MODULES = (
+    "rest_framework.renderers",
+    "rest_framework.parsers",
+    "sensor.views",
+    "sensor.serializers",
+    "sensor.decoder",
+    "sensor.ingest",
+    "sensor.queries",
+    "sensor.response_cache",
+)
+
+
+def connection_budget(workers, threads):
+    """Check that ``workers`` x ``threads`` fit the connection limit.
+
+    Args:
+        workers (int): Server processes.
+        threads (int): Threads per process, each holding a connection.
+    Returns:
+        int: The number of database connections the server may hold.
+    Raises:
+        ValueError: If it exceeds ``SERVE_MAX_DB_CONNECTIONS``.
+    """
+    connections = workers * threads
+    if connections > settings.SERVE_MAX_DB_CONNECTIONS:
+        raise ValueError(
+            f"{workers} workers x {threads} threads need {connections} "
+            "database connections, more than SERVE_MAX_DB_CONNECTIONS "
+            f"({settings.SERVE_MAX_DB_CONNECTIONS})."
+        )
+    return connections
+
+
+def shared_cache(processes):
+    """Check that the sensor caches are shared by ``processes`` processes.
+
+    The response cache and the latest-reading index are invalidated by
+    whichever process writes, so every process reading them must see
+    the same cache.
+
+    Args:
+        processes (int): Processes reading and writing the caches.
+    Raises:
+        ValueError: If there is more than one and a sensor cache is
+            local to each process.
+    """
+    if processes < 2:
+        return
+    aliases = sorted(
+        {settings.SENSOR_RESPONSE_CACHE, settings.SENSOR_LATEST_CACHE}
+    )
+    local = [
+        alias for alias in aliases if isinstance(caches[alias], LocMemCache)
+    ]
+    if local:
+        raise ValueError(
+            f"The {', '.join(local)} cache is local to each process and "
+            f"would go stale across {processes} processes; set "
+            "CACHE_BACKEND and CACHE_LOCATION to a shared cache such as "
+            "Redis."
+        )
+
+
+def on_threads(executor, threads, function):
+    """Run ``function`` once on each of ``threads`` executor threads.
+
+    The calls wait for each other, so no thread runs two of them.
+
+    Returns:
+        list: The results, in completion order.
+    """
+    barrier = threading.Barrier(threads)
+
+    def call():
+        barrier.wait(timeout=30)
+        return function()
+
+    futures = [executor.submit(call) for _ in range(threads)]
+    return [future.result() for future in futures]
+
+
+def open_connection():
+    connection.ensure_connection()
+    return connection
+
+
+def warm_up(executor=None, threads=1):
+    """Prepare a server worker for traffic.
+
+    Args:
+        executor (concurrent.futures.Executor, optional): The pool the
+            worker serves requests on. Defaults to the calling thread.
+        threads (int): Threads of ``executor`` to open connections on.
+    Returns:
+        int: The number of database connections opened.
+    """
+    for name in HOT_MODULES:
+        importlib.import_module(name)
+    # Imports the URLconf and the views it routes to.
+    get_resolver().url_patterns
+
+    if not connection.settings_dict["CONN_MAX_AGE"]:
+        # Connections would be closed as the first request starts.
+        return 0
+    if executor is None:
+        open_connection()
+        return 1
+    return len(on_threads(executor, threads, open_connection))
@@ -0,0 +1,30 @@
+"""
+Production settings, used by ``manage.py serve``.
+
+Select them with ``DJANGO_SETTINGS_MODULE=core.settings_production``.
+Database connections are kept open between requests and checked
+before they are reused, instead of being opened for every request.
+The cache defaults to Redis, shared by the server workers, the
+subscriber and the Celery workers.
+"""
+
+import os
+
+from core.settings import *  # noqa: F401,F403
+from core.settings import CACHES, DATABASES
+
+DEBUG = os.environ.get("DJANGO_DEBUG") == "1"
+
+DATABASES["default"]["CONN_MAX_AGE"] = int(
+    os.environ.get("DB_CONN_MAX_AGE", 600)
+)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = (
+    os.environ.get("DB_CONN_HEALTH_CHECKS", "1") == "1"
+)
+
+CACHES["default"] = {
+    "BACKEND": os.environ.get(
+        "CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"
+    ),
+    "LOCATION": os.environ.get("CACHE_LOCATION", "redis://localhost:6379/0"),
+}
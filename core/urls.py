@@ -19,9 +19,11 @@ from django.contrib import admin
 from django.urls import include, path
 
 from core.helper import schema_view
+from core.metrics import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("sensor.urls")),
     path("docs/", schema_view.with_ui("swagger"), name="swagger"),
+    path("metrics/", metrics_view, name="metrics"),
 ]
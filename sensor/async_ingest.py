@@ -0,0 +1,148 @@
+"""Batched writer for the async (ASGI) ingest path.
+
+Requests decode their envelope on the event loop and hand the record
+to an ``AsyncBatchWriter``. A single writer task drains the queue and
+writes whatever accumulated while the previous batch was being
+committed, so concurrent requests share one transaction instead of
+each holding a worker thread for their own.
+
+The process has one writer, running on an event loop of its own
+thread. Requests reach it from whichever loop serves them: the
+long-lived loop of an ASGI server, or the one ``async_to_sync`` creates
+for every request when the view is served over WSGI, so batching and
+the writer's thread and connection are shared either way.
+
+Writes run on a thread owned by the writer rather than on the shared
+thread of ``sync_to_async(thread_sensitive=True)``: the request cycle
+of every other coroutine also hops onto that thread, and would queue
+behind the database round trips of a batch.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+from .ingest import save_records
+
+
+def _write(records):
+    # Bracket the batch like Django brackets a request, so the writer
+    # thread honours CONN_MAX_AGE too.
+    close_old_connections()
+    try:
+        return save_records(records)
+    finally:
+        close_old_connections()
+
+
+class AsyncBatchWriter:
+    """Queue records from many coroutines and write them in batches.
+
+    The queue is bounded by ``max_queue_size``: once it is full,
+    ``write`` waits for room, which pushes back on the callers instead of
+    buffering without limit. Each caller is resumed only after the batch
+    holding its record has committed, or with the exception that made
+    the write fail.
+    """
+
+    def __init__(self, max_batch_size=500, max_latency=0.0, max_queue_size=0):
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = asyncio.Queue(max_queue_size)
+        self._task = None
+        self._executor = ThreadPoolExecutor(
+            1, thread_name_prefix="sensor-writer"
+        )
+
+    async def write(self, record):
+        """Queue ``record`` and wait until it is durable.
+
+        Returns:
+            SensorRecord: The record; its ``pk`` is ``None`` if it was a
+            duplicate.
+        Raises:
+            Exception: Whatever the batch write raised.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch_size and self.max_latency > 0:
+                await asyncio.sleep(self.max_latency)
+                self._drain(batch)
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        """Write a batch of ``(record, future)`` pairs and resolve them."""
+        try:
+            await sync_to_async(
+                _write, thread_sensitive=False, executor=self._executor
+            )([record for record, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for record, future in batch:
+            if not future.done():
+                future.set_result(record)
+
+
+_writer = None
+_loop = None
+_lock = threading.Lock()
+metrics.ASYNC_DEPTH.set_function(
+    lambda: _writer.queue.qsize() if _writer is not None else 0
+)
+
+
+def get_writer():
+    """Return the process's batch writer, starting its loop thread."""
+    global _writer, _loop
+    with _lock:
+        if _writer is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name="sensor-writer-loop",
+                daemon=True,
+            ).start()
+            _writer = AsyncBatchWriter(
+                max_batch_size=settings.SENSOR_BULK_CREATE_BATCH_SIZE,
+                max_latency=settings.SENSOR_ASYNC_MAX_LATENCY,
+                max_queue_size=settings.SENSOR_ASYNC_QUEUE_SIZE,
+            )
+        return _writer
+
+
+async def write(record):
+    """Hand ``record`` to the process's writer and wait until it is durable.
+
+    Returns:
+        SensorRecord: The record; its ``pk`` is ``None`` if it was a
+        duplicate.
+    Raises:
+        Exception: Whatever the batch write raised.
+    """
+    writer = get_writer()
+    return await asyncio.wrap_future(
+        asyncio.run_coroutine_threadsafe(writer.write(record), _loop)
+    )
@@ -0,0 +1,313 @@
+"""Bulk loading of archived Pub/Sub envelopes with ``COPY``.
+
+Archives are NDJSON files, optionally gzipped, holding one push
+envelope per line, exactly as ``POST /api/sensor/`` receives them.
+Lines are decoded in chunks by a pool of processes with the same
+``decode_envelope`` mapping as the ingest endpoints, and every chunk is
+loaded by the parent in one transaction through ``COPY``.
+
+With deduplication, a chunk is first copied into a temporary staging
+table and then inserted with ``ON CONFLICT DO NOTHING``, so envelopes
+already stored under the same message id are skipped. Without it the
+chunk is copied straight into ``SensorRecord``, which is faster but
+fails on the first duplicate.
+"""
+
+import collections
+import gzip
+import io
+import itertools
+import json
+import multiprocessing
+import os
+from datetime import datetime
+
+from django.db import connection, connections, transaction
+
+from .decoder import decode_envelope, error_detail
+from .models import DeadLetter, SensorRecord
+from .partitions import create_partition, list_partitions, month_start
+
+COLUMNS = (
+    "sensor_id",
+    "human_presence",
+    "dwell_time",
+    "timestamp",
+    "message_id",
+)
+STAGING_TABLE = "sensor_backfill_staging"
+
+_ESCAPES = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+)
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).translate(_ESCAPES)
+
+
+def open_archive(path):
+    """Open an NDJSON archive for binary reading, gunzipping ``.gz``."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_chunks(paths, chunk_size, checkpoint=None):
+    """Split archives into chunks of lines, skipping loaded ones.
+
+    Args:
+        paths (list[str]): Archive files, loaded in this order.
+        chunk_size (int): Lines per chunk.
+        checkpoint (Checkpoint, optional): Lines of each file already
+            loaded by an earlier run.
+    Yields:
+        tuple: ``(path, end, lines)`` where ``end`` is the number of
+        lines of ``path`` read once the chunk is loaded.
+    """
+    for path in paths:
+        done = checkpoint.lines(path) if checkpoint else 0
+        with open_archive(path) as f:
+            lines = enumerate(f, start=1)
+            for _ in itertools.islice(lines, done):
+                pass
+            while True:
+                chunk = list(itertools.islice(lines, chunk_size))
+                if not chunk:
+                    break
+                yield path, chunk[-1][0], [line for _, line in chunk]
+
+
+def decode_chunk(lines):
+    """Decode a chunk of envelope lines into ``COPY`` text.
+
+    Runs in the worker processes.
+
+    Returns:
+        dict: ``copy`` (the rows in ``COPY`` text format), ``rows``,
+        ``months`` (the month starts the rows fall in), ``first`` and
+        ``last`` (the oldest and newest timestamps) and ``invalid``, a
+        list of ``(line, error)`` for the lines that failed decoding.
+    """
+    out = io.StringIO()
+    rows = 0
+    months = set()
+    first = last = None
+    invalid = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = decode_envelope(line)
+        except (KeyError, TypeError, ValueError) as e:
+            invalid.append((line.decode("utf-8", "replace"), error_detail(e)))
+            continue
+        out.write("\t".join(_copy_value(row[c]) for c in COLUMNS) + "\n")
+        rows += 1
+        timestamp = row["timestamp"]
+        months.add(month_start(timestamp))
+        first = timestamp if first is None else min(first, timestamp)
+        last = timestamp if last is None else max(last, timestamp)
+    return {
+        "copy": out.getvalue(),
+        "rows": rows,
+        "months": months,
+        "first": first,
+        "last": last,
+        "invalid": invalid,
+    }
+
+
+class Checkpoint:
+    """Progress of a backfill, persisted as JSON after every chunk.
+
+    Holds the number of lines loaded per archive and the definitions
+    of indexes dropped for the load, so an interrupted run can resume
+    and still restore them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {"files": {}, "deferred_indexes": []}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state.update(json.load(f))
+
+    def lines(self, archive):
+        return self.state["files"].get(os.path.abspath(archive), 0)
+
+    def advance(self, archive, lines, first=None, last=None):
+        """Record a loaded chunk and widen the loaded time range."""
+        self.state["files"][os.path.abspath(archive)] = lines
+        if first is not None:
+            start, end = self.loaded_range or (first, last)
+            self.state["range"] = [
+                min(start, first).isoformat(),
+                max(end, last).isoformat(),
+            ]
+        self.save()
+
+    @property
+    def loaded_range(self):
+        """Oldest and newest timestamp loaded, or ``None``."""
+        if not self.state.get("range"):
+            return None
+        return tuple(datetime.fromisoformat(v) for v in self.state["range"])
+
+    @property
+    def deferred_indexes(self):
+        return self.state["deferred_indexes"]
+
+    @deferred_indexes.setter
+    def deferred_indexes(self, definitions):
+        self.state["deferred_indexes"] = definitions
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.path)
+
+
+def drop_indexes():
+    """Drop the secondary indexes of ``SensorRecord``.
+
+    Unique and primary key indexes are kept: deduplication relies on
+    them. Dropping an index of the partitioned table drops it from
+    every partition.
+
+    Returns:
+        list[str]: The ``CREATE INDEX`` statements to restore them.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT idx.relname, pg_get_indexdef(idx.oid)
+            FROM pg_index
+            JOIN pg_class idx ON idx.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = %s::regclass
+            AND NOT pg_index.indisunique
+            AND NOT pg_index.indisprimary
+            ORDER BY idx.relname
+            """,
+            [SensorRecord._meta.db_table],
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {quote(name)}")
+    return [definition for _, definition in indexes]
+
+
+def create_indexes(definitions):
+    with connection.cursor() as cursor:
+        for definition in definitions:
+            cursor.execute(definition)
+
+
+class Loader:
+    """Load decoded chunks into ``SensorRecord`` with ``COPY``.
+
+    Args:
+        dedupe (bool): Skip rows whose ``(message_id, timestamp)`` is
+            already stored, at the cost of a staging table round trip.
+    """
+
+    def __init__(self, dedupe=True):
+        self.dedupe = dedupe
+        self.partitions = set(list_partitions())
+
+    def _copy(self, cursor, table, data):
+        quote = connection.ops.quote_name
+        cursor.copy_expert(
+            f"COPY {quote(table)} "
+            f"({', '.join(quote(column) for column in COLUMNS)}) "
+            "FROM STDIN",
+            io.StringIO(data),
+        )
+
+    def _ensure_partitions(self, months):
+        for month in sorted(months - self.partitions):
+            create_partition(month)
+            self.partitions.add(month)
+
+    def load(self, chunk):
+        """Write one decoded chunk in a single transaction.
+
+        Returns:
+            int: The number of rows inserted.
+        """
+        if chunk["rows"]:
+            self._ensure_partitions(chunk["months"])
+        quote = connection.ops.quote_name
+        table = quote(SensorRecord._meta.db_table)
+        columns = ", ".join(quote(column) for column in COLUMNS)
+        inserted = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            if chunk["rows"] and self.dedupe:
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE IF NOT EXISTS "
+                    f"{quote(STAGING_TABLE)} AS SELECT {columns} "
+                    f"FROM {table} WITH NO DATA"
+                )
+                cursor.execute(f"TRUNCATE {quote(STAGING_TABLE)}")
+                self._copy(cursor, STAGING_TABLE, chunk["copy"])
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) "
+                    f"SELECT {columns} FROM {quote(STAGING_TABLE)} "
+                    "ON CONFLICT DO NOTHING"
+                )
+                inserted = cursor.rowcount
+            elif chunk["rows"]:
+                self._copy(cursor, SensorRecord._meta.db_table, chunk["copy"])
+                inserted = chunk["rows"]
+            DeadLetter.objects.bulk_create(
+                DeadLetter(reason=DeadLetter.INVALID, payload=line, error=e)
+                for line, e in chunk["invalid"]
+            )
+        return inserted
+
+
+def decode_chunks(chunks, workers):
+    """Decode ``(path, end, lines)`` chunks, in order, on ``workers``.
+
+    Yields:
+        tuple: ``(path, end, decoded)`` with the result of
+        ``decode_chunk``.
+    """
+    if workers <= 1:
+        for path, end, lines in chunks:
+            yield path, end, decode_chunk(lines)
+        return
+
+    # Keep a bounded number of chunks in flight: Pool.imap would read
+    # whole archives into memory ahead of the loader.
+    pending = collections.deque()
+    # The workers only decode; drop the connection rather than share it.
+    connections.close_all()
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        for path, end, lines in chunks:
+            pending.append(
+                (path, end, pool.apply_async(decode_chunk, (lines,)))
+            )
+            if len(pending) > 2 * workers:
+                path, end, result = pending.popleft()
+                yield path, end, result.get()
+        while pending:
+            path, end, result = pending.popleft()
+            yield path, end, result.get()
+
+
+def analyze():
+    table = connection.ops.quote_name(SensorRecord._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {table}")
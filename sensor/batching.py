@@ -0,0 +1,202 @@
+"""Micro-batching of Pub/Sub messages for the streaming subscriber."""
+
+import threading
+import time
+
+from django.db import close_old_connections, connections
+
+from . import metrics, spool
+from .decoder import InvalidRecord, decode_envelope
+from .ingest import save_records
+from .models import SensorRecord
+from .pressure import TRANSIENT_ERRORS
+
+
+def ack(message):
+    """Ack a Pub/Sub message, timing and counting it."""
+    with metrics.ACK.time():
+        message.ack()
+    metrics.ACKED.inc()
+
+
+def nack(message):
+    metrics.NACKED.inc()
+    message.nack()
+
+
+class MessageBatcher:
+    """Collect Pub/Sub messages into micro-batches written in one INSERT.
+
+    Valid messages are buffered until either ``max_batch_size`` of them
+    are pending or the oldest one has waited ``max_latency`` seconds.
+    A batch is acked only once its transaction commits, or once it is
+    spooled when the database is unavailable (see ``sensor.spool``);
+    if the write fails otherwise the whole batch is nacked so Pub/Sub
+    redelivers it. Invalid messages never enter a batch and are nacked
+    straight away, as are messages that arrive after ``stop``.
+
+    Args:
+        max_batch_size (int): Pending messages that trigger a flush.
+        max_latency (float): Seconds the oldest message may wait.
+        write (callable, optional): Called with the records of a batch.
+            Defaults to ``save_records``; the Celery pipeline passes a
+            function that enqueues them instead.
+        on_invalid (callable, optional): Called with ``(message, error)``
+            for a message that fails decoding. The message is acked if it
+            returns, so the payload is not redelivered.
+        gate (PressureGate, optional): Throttles the messages held. Each
+            buffered message takes a slot until its batch is written,
+            and ``add`` blocks while none is free, so that the source's
+            flow control stops delivering while the database is slow.
+    """
+
+    def __init__(
+        self,
+        max_batch_size=500,
+        max_latency=1.0,
+        write=None,
+        on_invalid=None,
+        gate=None,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.write = write
+        self.on_invalid = on_invalid
+        self.gate = gate
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer = threading.Thread(target=self._run, daemon=True)
+
+    def __call__(self, message):
+        """Streaming pull callback: decode, validate and buffer a message."""
+        try:
+            row = decode_envelope(message.data)
+        except InvalidRecord as e:
+            print(f"Invalid data: {e.errors}")
+            metrics.SUBSCRIBER_MESSAGES["invalid"].inc()
+            self.reject(message, e)
+            return
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            metrics.SUBSCRIBER_MESSAGES["invalid"].inc()
+            self.reject(message, e)
+            return
+        # A streaming pull redelivers under the same Pub/Sub message id.
+        row["message_id"] = getattr(message, "message_id", None) or row[
+            "message_id"
+        ]
+        self.add(message, SensorRecord(**row))
+
+    def reject(self, message, error):
+        """Hand an undecodable message to ``on_invalid``, or nack it."""
+        if self.on_invalid is not None:
+            try:
+                self.on_invalid(message, error)
+            except Exception as e:
+                print(f"Error dead-lettering message: {e}")
+            else:
+                ack(message)
+                return
+        nack(message)
+
+    def add(self, message, record):
+        """Buffer a validated record, flushing if the batch is full."""
+        if self.gate is not None:
+            while not self.gate.acquire(timeout=0.5):
+                if self._stopped.is_set():
+                    nack(message)
+                    return
+        with self._lock:
+            if self._stopped.is_set():
+                if self.gate is not None:
+                    self.gate.release()
+                nack(message)
+                return
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((message, record))
+            metrics.BATCHER_DEPTH.inc()
+            full = len(self._pending) >= self.max_batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every pending record and ack or nack their messages.
+
+        Returns:
+            int: The number of records written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._oldest = None
+            if not batch:
+                return 0
+            metrics.BATCHER_DEPTH.dec(len(batch))
+            records = [record for _, record in batch]
+            close_old_connections()
+            started = time.perf_counter()
+            try:
+                if self.write is None:
+                    save_records(records)
+                    metrics.record_saved(metrics.SUBSCRIBER_MESSAGES, records)
+                else:
+                    self.write(records)
+                    metrics.SUBSCRIBER_ENQUEUED.inc(len(records))
+            except Exception as e:
+                self._release(len(batch), failed=e)
+                if (
+                    self.write is None
+                    and isinstance(e, TRANSIENT_ERRORS)
+                    and spool.spool_records(records)
+                ):
+                    metrics.SUBSCRIBER_MESSAGES["spooled"].inc(len(batch))
+                    for message, _ in batch:
+                        ack(message)
+                    return 0
+                print(f"Error writing batch of {len(batch)} messages: {e}")
+                metrics.SUBSCRIBER_MESSAGES["error"].inc(len(batch))
+                for message, _ in batch:
+                    nack(message)
+                return 0
+            for message, _ in batch:
+                ack(message)
+            self._release(len(batch), time.perf_counter() - started)
+            return len(batch)
+
+    def _release(self, count, latency=None, failed=None):
+        if self.gate is not None:
+            self.gate.release(
+                count,
+                latency=latency,
+                failed=isinstance(failed, TRANSIENT_ERRORS),
+            )
+
+    def flush_if_due(self):
+        """Flush when the oldest pending message exceeded ``max_latency``."""
+        with self._lock:
+            oldest = self._oldest
+        if oldest is None:
+            return 0
+        if time.monotonic() - oldest >= self.max_latency:
+            return self.flush()
+        return 0
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        """Stop the latency timer and flush whatever is still pending."""
+        self._stopped.set()
+        if self._timer.is_alive():
+            self._timer.join()
+        self.flush()
+
+    def _run(self):
+        interval = max(min(self.max_latency / 4, 0.25), 0.005)
+        while not self._stopped.wait(interval):
+            self.flush_if_due()
+        connections.close_all()
@@ -0,0 +1,356 @@
+"""Workloads and result handling of ``manage.py bench_suite``.
+
+Each workload returns a summary dict with the operation count,
+throughput and p50/p95/p99 latency in milliseconds. Summaries are
+keyed by workload name in the suite's JSON output, and ``compare``
+checks them against a saved baseline.
+"""
+
+import json
+import math
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, RequestFactory, override_settings
+
+from . import spool
+from .batching import MessageBatcher
+from .dedupe import recent_messages
+from .ingest import save_records
+from .models import SensorRecord
+
+METRICS = (
+    # (metric, direction): +1 when higher is worse, -1 when lower is.
+    ("p95_ms", 1),
+    ("p99_ms", 1),
+    ("throughput", -1),
+)
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Summarize per-operation latencies, in seconds, of one workload."""
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(ordered) / elapsed, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+def bench_post(fleet, count):
+    """``POST /api/sensor/``, one push envelope per request."""
+    client = Client()
+    bodies = [json.dumps(envelope) for envelope in fleet.envelopes(count)]
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for body in bodies:
+        sent = time.perf_counter()
+        response = client.post(
+            "/api/sensor/", body, content_type="application/json"
+        )
+        latencies.append(time.perf_counter() - sent)
+        errors += response.status_code != 201
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def _settle(messages, started):
+    latencies = [message.settled - message.received for message in messages]
+    errors = sum(not message.acked for message in messages)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_process_sensor_data(fleet, count):
+    """``process_sensor_data`` called inline with fake Pub/Sub messages."""
+    from .tasks import process_sensor_data
+
+    messages = list(fleet.messages(count))
+    started = time.perf_counter()
+    for message in messages:
+        message.received = time.perf_counter()
+        process_sensor_data(message)
+    return _settle(messages, started)
+
+
+def bench_batcher(fleet, count, max_batch_size=500, max_latency=0.05):
+    """The streaming subscriber's ``MessageBatcher``, receipt to ack."""
+    messages = list(fleet.messages(count))
+    batcher = MessageBatcher(
+        max_batch_size=max_batch_size, max_latency=max_latency
+    )
+    batcher.start()
+    started = time.perf_counter()
+    for message in messages:
+        message.received = time.perf_counter()
+        batcher(message)
+    batcher.stop()
+    return _settle(messages, started)
+
+
+def seed(fleet, size, chunk=10000):
+    """Grow the ``SensorRecord`` table to ``size`` rows of ``fleet``."""
+    missing = size - SensorRecord.objects.count()
+    while missing > 0:
+        save_records(list(fleet.records(min(chunk, missing))))
+        missing -= chunk
+
+
+def query_shapes(fleet):
+    """Representative read requests over the data ``fleet`` produced.
+
+    Returns:
+        dict: Shape name mapped to ``(path, params)``.
+    """
+    end = fleet.now
+    hour = {
+        "start_time": (end - timedelta(hours=1)).isoformat(),
+        "end_time": end.isoformat(),
+    }
+    day = {
+        "start_time": (end - timedelta(days=1)).isoformat(),
+        "end_time": end.isoformat(),
+    }
+    sensor = {"sensor_id": fleet.sensor_ids[0]}
+    return {
+        "latest": ("/api/sensor/", {}),
+        "sensor_latest": ("/api/sensor/", sensor),
+        "sensor_range": ("/api/sensor/", {**sensor, **hour}),
+        "time_range": ("/api/sensor/", hour),
+        "cursor": ("/api/sensor/", {"cursor": ""}),
+        "columnar": ("/api/sensor/", {"format": "columnar"}),
+        "aggregate_raw": ("/api/sensor/aggregate/", day),
+        "aggregate_rollup": (
+            "/api/sensor/aggregate/",
+            {**day, "source": "rollup"},
+        ),
+        "latest_state": ("/api/sensor/latest/", {}),
+    }
+
+
+def bench_query(path, params, repeat, cached=False):
+    """Time ``repeat`` GETs of one query shape.
+
+    Unless ``cached``, every request carries a unique, otherwise ignored
+    parameter so that it misses the response cache.
+    """
+    client = Client()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(repeat):
+        query = params if cached else {**params, "_bench": i}
+        sent = time.perf_counter()
+        response = client.get(path, query)
+        latencies.append(time.perf_counter() - sent)
+        errors += response.status_code != 200
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def wsgi_requests(fleet, count, method="post"):
+    """WSGI environs of ``count`` requests against ``fleet``'s data.
+
+    ``post`` pushes one envelope per request; ``get`` lists a sensor's
+    readings, missing the response cache.
+    """
+    factory = RequestFactory()
+    if method == "post":
+        return [
+            factory.post(
+                "/api/sensor/",
+                json.dumps(envelope),
+                content_type="application/json",
+            ).environ
+            for envelope in fleet.envelopes(count)
+        ]
+    sensor_ids = fleet.sensor_ids
+    return [
+        factory.get(
+            "/api/sensor/",
+            {"sensor_id": sensor_ids[i % len(sensor_ids)], "_bench": i},
+        ).environ
+        for i in range(count)
+    ]
+
+
+def bench_wsgi(environs, concurrency=1, conn_max_age=0, expected=200):
+    """Serve requests through the WSGI application on threads.
+
+    Unlike the test client, the application runs the request signals
+    that close a thread's database connection or keep it for the next
+    request, as a threaded server would.
+
+    Args:
+        environs (list[dict]): The requests, from ``wsgi_requests``.
+        concurrency (int): Threads serving them.
+        conn_max_age (int): ``CONN_MAX_AGE`` during the run.
+        expected (int): Status code of a successful request.
+    Returns:
+        dict: The summary, with ``connections`` opened in the run.
+    """
+    application = WSGIHandler()
+    latencies = []
+    errors = []
+    opened = []
+
+    def created(sender, **kwargs):
+        opened.append(sender)
+
+    def serve(share):
+        for environ in share:
+            sent = time.perf_counter()
+            response = application(environ, lambda status, headers: None)
+            response.close()
+            latencies.append(time.perf_counter() - sent)
+            if response.status_code != expected:
+                errors.append(response.status_code)
+        connection.close()
+
+    # Connections of all threads share the settings dict.
+    previous = connection.settings_dict["CONN_MAX_AGE"]
+    connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+    connection_created.connect(created)
+    threads = [
+        threading.Thread(target=serve, args=(environs[i::concurrency],))
+        for i in range(concurrency)
+    ]
+    try:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        connection_created.disconnect(created)
+        connection.settings_dict["CONN_MAX_AGE"] = previous
+    summary = summarize(latencies, elapsed, len(errors))
+    summary["connections"] = len(opened)
+    return summary
+
+
+@contextmanager
+def isolated():
+    """Run a benchmark on a throwaway database, cache and spool.
+
+    The configured database, the shared cache and the spool directory
+    hold live state that a benchmark would pollute, and be skewed by.
+    """
+    opened = []
+
+    def track(sender, connection, **kwargs):
+        opened.append(connection)
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    connection_created.connect(track)
+    try:
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem."
+                    "LocMemCache",
+                    "LOCATION": "sensor-bench",
+                }
+            },
+            SENSOR_SPOOL_DIR=directory,
+        ):
+            spool.reset()
+            recent_messages.clear()
+            try:
+                yield
+            finally:
+                spool.reset()
+                recent_messages.clear()
+    finally:
+        connection_created.disconnect(track)
+        # Threads that outlive the run, like the async writer's, would
+        # keep the test database from being dropped.
+        for conn in opened:
+            if conn is not connection and conn.connection is not None:
+                conn.connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def slow_database(delay, match=None):
+    """Add latency to database queries, simulating a slow database.
+
+    Applies to the connections this thread already opened and to every
+    connection opened by any thread inside the block.
+
+    Args:
+        delay (float | callable): Seconds added to each query, or a
+            function returning them, called per query, to vary the
+            latency while the block runs.
+        match (str, optional): Only delay queries containing it, e.g.
+            ``"INSERT"``.
+    """
+    wrapped = []
+
+    def add_latency(execute, sql, params, many, context):
+        if match is None or match in sql:
+            time.sleep(delay() if callable(delay) else delay)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(add_latency)
+        wrapped.append(connection)
+
+    for conn in connections.all(initialized_only=True):
+        install(None, conn)
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for conn in wrapped:
+            if add_latency in conn.execute_wrappers:
+                conn.execute_wrappers.remove(add_latency)
+
+
+def compare(results, baseline, tolerance):
+    """Compare suite results with a baseline run.
+
+    Args:
+        results (dict): Workload name mapped to its summary.
+        baseline (dict): The same, from an earlier run.
+        tolerance (float): Allowed relative change, e.g. ``0.2``.
+    Returns:
+        list[dict]: One entry per metric of every workload present in
+        both runs, with ``name``, ``metric``, ``baseline``, ``current``,
+        ``change`` (relative) and ``regressed``.
+    """
+    rows = []
+    for name in sorted(results.keys() & baseline.keys()):
+        for metric, direction in METRICS:
+            before = baseline[name][metric]
+            after = results[name][metric]
+            change = (after - before) / before if before else 0.0
+            rows.append(
+                {
+                    "name": name,
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "change": round(change, 4),
+                    "regressed": change * direction > tolerance,
+                }
+            )
+    return rows
@@ -0,0 +1,252 @@
+"""Fast-path decoding of Pub/Sub envelopes into ``SensorRecord`` rows.
+
+Both ingestion paths receive the same payload: a push envelope whose
+``message.data`` is base64-encoded JSON using the device field names
+(``v0``, ``v11``, ``v18``, ``Time``). This module turns such envelopes
+into model-ready dicts without instantiating ``SensorRecordSerializer``
+per reading, while reporting validation failures with the same messages
+and codes the serializer would.
+"""
+
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.fields import IntegerField
+from rest_framework.settings import api_settings
+from rest_framework.utils import humanize_datetime
+
+from . import metrics
+
+_MISSING = object()
+_MAX_STRING_LENGTH = 1000
+_INT_MIN = -2147483648
+_INT_MAX = 2147483647
+_MAX_MESSAGE_ID_LENGTH = 100
+_RE_DECIMAL = IntegerField.re_decimal
+
+_REQUIRED = ErrorDetail("This field is required.", code="required")
+_NULL = ErrorDetail("This field may not be null.", code="null")
+_MAX_STRING = ErrorDetail("String value too large.", code="max_string_length")
+_INVALID_INT = ErrorDetail("A valid integer is required.", code="invalid")
+_INT_TOO_SMALL = ErrorDetail(
+    f"Ensure this value is greater than or equal to {_INT_MIN}.",
+    code="min_value",
+)
+_INT_TOO_LARGE = ErrorDetail(
+    f"Ensure this value is less than or equal to {_INT_MAX}.",
+    code="max_value",
+)
+_INVALID_FLOAT = ErrorDetail("A valid number is required.", code="invalid")
+_FLOAT_OVERFLOW = ErrorDetail(
+    "Integer value too large to convert to float", code="overflow"
+)
+_DATETIME_FORMATS = humanize_datetime.datetime_formats(
+    api_settings.DATETIME_INPUT_FORMATS
+)
+_INVALID_DATETIME = ErrorDetail(
+    "Datetime has wrong format. Use one of these formats instead: "
+    f"{_DATETIME_FORMATS}.",
+    code="invalid",
+)
+_DATE_NOT_DATETIME = ErrorDetail(
+    "Expected a datetime but got a date.", code="date"
+)
+_MESSAGE_ID_TOO_LONG = ErrorDetail(
+    f"Ensure this field has no more than {_MAX_MESSAGE_ID_LENGTH} "
+    "characters.",
+    code="max_length",
+)
+
+
+class InvalidRecord(ValueError):
+    """Raised when a decoded reading fails validation.
+
+    ``errors`` has the same shape as ``SensorRecordSerializer.errors``:
+    a dict mapping each failing field to a list of ``ErrorDetail``.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class _Invalid(Exception):
+    def __init__(self, detail):
+        self.detail = detail
+
+
+def _to_int(value):
+    if type(value) is int:
+        result = value
+    else:
+        if isinstance(value, str) and len(value) > _MAX_STRING_LENGTH:
+            raise _Invalid(_MAX_STRING)
+        try:
+            result = int(_RE_DECIMAL.sub("", str(value)))
+        except (ValueError, TypeError):
+            raise _Invalid(_INVALID_INT)
+    if result > _INT_MAX:
+        raise _Invalid(_INT_TOO_LARGE)
+    if result < _INT_MIN:
+        raise _Invalid(_INT_TOO_SMALL)
+    return result
+
+
+def _to_bool(value):
+    return bool(value)
+
+
+def _to_float(value):
+    if type(value) is float:
+        return value
+    if isinstance(value, str) and len(value) > _MAX_STRING_LENGTH:
+        raise _Invalid(_MAX_STRING)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise _Invalid(_INVALID_FLOAT)
+    except OverflowError:
+        raise _Invalid(_FLOAT_OVERFLOW)
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, datetime.date):
+        raise _Invalid(_DATE_NOT_DATETIME)
+    else:
+        try:
+            parsed = parse_datetime(value)
+        except (ValueError, TypeError):
+            parsed = None
+        if parsed is None:
+            raise _Invalid(_INVALID_DATETIME)
+    if not settings.USE_TZ:
+        if timezone.is_aware(parsed):
+            return timezone.make_naive(parsed, datetime.timezone.utc)
+        return parsed
+    current = timezone.get_current_timezone()
+    if parsed.tzinfo is None:
+        return timezone.make_aware(parsed, current)
+    return parsed.astimezone(current)
+
+
+_CONVERTERS = (
+    ("sensor_id", "v0", _to_int),
+    ("human_presence", "v11", _to_bool),
+    ("dwell_time", "v18", _to_float),
+    ("timestamp", "Time", _to_datetime),
+)
+
+
+def validate_reading(sensor_data):
+    """Convert a decoded device payload into a model-ready row.
+
+    Args:
+        sensor_data (dict): The JSON object carried in ``message.data``.
+    Returns:
+        dict: ``SensorRecord`` field values.
+    Raises:
+        InvalidRecord: If any field is missing or malformed.
+    """
+    row = {}
+    errors = None
+    for field, key, convert in _CONVERTERS:
+        value = sensor_data.get(key, _MISSING)
+        try:
+            if value is _MISSING:
+                raise _Invalid(_REQUIRED)
+            if value is None and field != "human_presence":
+                raise _Invalid(_NULL)
+            row[field] = convert(value)
+        except _Invalid as e:
+            if errors is None:
+                errors = {}
+            errors[field] = [e.detail]
+    if errors:
+        raise InvalidRecord(errors)
+    return row
+
+
+def decode_data(data):
+    """Decode the base64 ``message.data`` field into the device payload.
+
+    Raises:
+        binascii.Error: If ``data`` is not valid base64.
+        UnicodeDecodeError: If the decoded bytes are not UTF-8.
+        json.JSONDecodeError: If the decoded text is not JSON.
+    """
+    return json.loads(base64.b64decode(data).decode("utf-8"))
+
+
+def message_id(message):
+    """Return the Pub/Sub message id of an envelope's ``message``.
+
+    Push deliveries carry it as both ``messageId`` and ``message_id``.
+
+    Raises:
+        InvalidRecord: If the id is longer than the column allows.
+    """
+    value = message.get("messageId", message.get("message_id"))
+    if value is None:
+        return None
+    value = str(value)
+    if len(value) > _MAX_MESSAGE_ID_LENGTH:
+        raise InvalidRecord({"message_id": [_MESSAGE_ID_TOO_LONG]})
+    return value
+
+
+def decode_envelope(envelope):
+    """Decode and validate one push envelope.
+
+    Args:
+        envelope (dict | bytes | str): The push envelope, either parsed or
+            as the raw JSON body delivered by Pub/Sub.
+    Returns:
+        dict: ``SensorRecord`` field values, including the ``message_id``
+        that identifies redeliveries of the same message.
+    Raises:
+        InvalidRecord: If the payload decodes but fails validation.
+        KeyError, TypeError, ValueError: If the envelope is malformed.
+    """
+    with metrics.DECODE.time():
+        if isinstance(envelope, (bytes, bytearray, str)):
+            envelope = json.loads(envelope)
+        message = envelope["message"]
+        sensor_data = decode_data(message["data"])
+    if not isinstance(sensor_data, dict):
+        raise TypeError("Sensor payload must be a JSON object.")
+    with metrics.VALIDATE.time():
+        row = validate_reading(sensor_data)
+        row["message_id"] = message_id(message)
+    return row
+
+
+def decode_many(envelopes):
+    """Decode an iterable of envelopes, isolating failures per item.
+
+    Args:
+        envelopes (Iterable[dict | bytes | str]): Push envelopes.
+    Yields:
+        tuple: ``(row, None)`` for a valid envelope or ``(None, error)``
+        where ``error`` is the raised exception.
+    """
+    for envelope in envelopes:
+        try:
+            yield decode_envelope(envelope), None
+        except (KeyError, TypeError, ValueError) as e:
+            yield None, e
+
+
+def error_detail(error):
+    """Render a ``decode_many`` error for an API response."""
+    if isinstance(error, InvalidRecord):
+        return error.errors
+    if isinstance(error, KeyError):
+        return f"Missing field: {error}"
+    return str(error)
@@ -0,0 +1,68 @@
+"""In-process filter of recently written Pub/Sub message ids.
+
+Redeliveries usually arrive shortly after the original. Remembering
+the most recent ids lets ``save_records`` drop them before they cost a
+database round trip; the unique constraint on ``SensorRecord`` still
+catches every duplicate the filter has forgotten or never saw.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class RecentKeys:
+    """A bounded, thread-safe LRU set with hit and miss counters.
+
+    Args:
+        capacity (int): Number of keys kept before the least recently
+            seen ones are evicted.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def seen(self, key):
+        """Return whether ``key`` is remembered, counting a hit or miss."""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add_many(self, keys):
+        """Remember ``keys``, evicting the oldest beyond ``capacity``."""
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the counters as ``{"hits", "misses", "size"}``."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._keys),
+            }
+
+
+recent_messages = RecentKeys(settings.SENSOR_DEDUPE_CACHE_SIZE)
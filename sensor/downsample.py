@@ -0,0 +1,240 @@
+"""Shape-preserving downsampling of one sensor's readings for charts.
+
+The reducers consume readings in timestamp order, one at a time, and
+only keep a bounded amount of state, so a series can be reduced in a
+single pass over a server-side cursor however long its range is. The
+range is split into buckets of equal duration:
+
+- ``LTTB`` keeps one ``dwell_time`` reading per bucket with the
+  Largest-Triangle-Three-Buckets rule, holding two buckets of readings;
+- ``MinMax`` keeps the lowest and highest ``dwell_time`` reading of
+  every bucket, so spikes are never averaged away;
+- ``Transitions`` keeps the ``human_presence`` change points. A state
+  that lasts across a bucket boundary keeps its exact start; flickers
+  inside one bucket are reduced to at most one dip.
+
+Points are ``(x, value, timestamp)`` tuples where ``x`` is the
+timestamp in epoch seconds.
+"""
+
+from collections import deque
+
+METHODS = ("lttb", "minmax")
+
+
+class _Buckets:
+    """Map epoch seconds to one of ``count`` buckets over a range."""
+
+    def __init__(self, start, end, count):
+        self.start = start.timestamp()
+        self.width = max(end.timestamp() - self.start, 1e-6) / count
+        self.last = count - 1
+
+    def __call__(self, x):
+        return min(max(int((x - self.start) / self.width), 0), self.last)
+
+
+def _average(points):
+    return (
+        sum(point[0] for point in points) / len(points),
+        sum(point[1] for point in points) / len(points),
+    )
+
+
+def _largest_triangle(points, a, c):
+    """Pick the point forming the largest triangle with ``a`` and ``c``."""
+    ax, ay = a[0], a[1]
+    cx, cy = c
+    return max(
+        points,
+        key=lambda p: abs((ax - cx) * (p[1] - ay) - (ax - p[0]) * (cy - ay)),
+    )
+
+
+class LTTB:
+    """Largest-Triangle-Three-Buckets, streamed bucket by bucket.
+
+    The first and last readings are always kept; the others are split
+    into ``points - 2`` time buckets, each contributing the reading
+    that forms the largest triangle with the previously kept reading
+    and the average of the next non-empty bucket.
+    """
+
+    def __init__(self, start, end, points):
+        self.bucket = _Buckets(start, end, max(points - 2, 1))
+        self.result = []
+        self.current = []
+        self.following = []
+        self.following_bucket = None
+
+    def _select(self, anchor):
+        self.result.append(
+            _largest_triangle(self.current, self.result[-1], anchor)
+        )
+
+    def add(self, point):
+        if not self.result:
+            self.result.append(point)
+            return
+        bucket = self.bucket(point[0])
+        if self.following and bucket != self.following_bucket:
+            if self.current:
+                self._select(_average(self.following))
+            self.current = self.following
+            self.following = []
+        self.following.append(point)
+        self.following_bucket = bucket
+
+    def finish(self):
+        if not self.following:
+            # Only the first reading was seen.
+            return self.result
+        last = self.following.pop()
+        if self.current:
+            self._select(
+                _average(self.following) if self.following else last[:2]
+            )
+        if self.following:
+            self.current = self.following
+            self._select(last[:2])
+        self.result.append(last)
+        return self.result
+
+
+class MinMax:
+    """Keep the lowest and highest reading of each time bucket."""
+
+    def __init__(self, start, end, points):
+        self.bucket = _Buckets(start, end, max(points // 2, 1))
+        self.result = []
+        self.current = None
+        self.low = self.high = None
+
+    def _emit(self):
+        if self.low is self.high:
+            self.result.append(self.low)
+        else:
+            self.result.extend(sorted((self.low, self.high)))
+
+    def add(self, point):
+        bucket = self.bucket(point[0])
+        if bucket != self.current:
+            if self.current is not None:
+                self._emit()
+            self.current = bucket
+            self.low = self.high = point
+        elif point[1] < self.low[1]:
+            self.low = point
+        elif point[1] > self.high[1]:
+            self.high = point
+
+    def finish(self):
+        if self.current is not None:
+            self._emit()
+            self.current = None
+        return self.result
+
+
+class Transitions:
+    """Keep the presence change points, at most three per time bucket.
+
+    Of the changes within one bucket, the first and the last are kept,
+    plus the one before the last when that is needed for the states to
+    alternate, i.e. when the bucket ends in the state it first entered
+    after dipping out of it.
+    """
+
+    def __init__(self, start, end, points):
+        self.bucket = _Buckets(start, end, max(points // 3, 1))
+        self.result = []
+        self.state = None
+        self.current = None
+        self.first = None
+        self.last = deque(maxlen=2)
+        self.changes = 0
+
+    def _emit(self):
+        if not self.changes:
+            return
+        self.result.append(self.first)
+        if self.changes >= 3 and self.last[-1][1] == self.first[1]:
+            self.result.extend(self.last)
+        elif self.changes >= 2:
+            self.result.append(self.last[-1])
+
+    def add(self, point):
+        bucket = self.bucket(point[0])
+        if bucket != self.current:
+            self._emit()
+            self.current = bucket
+            self.first = None
+            self.last.clear()
+            self.changes = 0
+        if point[1] == self.state:
+            return
+        self.state = point[1]
+        self.changes += 1
+        if self.first is None:
+            self.first = point
+        self.last.append(point)
+
+    def finish(self):
+        self._emit()
+        self.changes = 0
+        return self.result
+
+
+def downsample(rows, start, end, points, method="lttb"):
+    """Reduce a sensor's readings to about ``points`` per series.
+
+    When the range holds no more than ``points`` readings they are
+    returned as they are.
+
+    Args:
+        rows (Iterable[tuple]): ``(timestamp, dwell_time,
+            human_presence)`` in timestamp order.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        points (int): Target number of ``dwell_time`` points.
+        method (str): ``lttb`` or ``minmax``, for ``dwell_time``.
+    Returns:
+        dict: ``readings`` (the number read), ``dwell_time`` and
+        ``human_presence``, lists of ``(timestamp, value)`` pairs; the
+        presence series only holds the points where it changes.
+    """
+    reducer = LTTB if method == "lttb" else MinMax
+    dwell = reducer(start, end, points)
+    presence = Transitions(start, end, points)
+    buffered = []
+    readings = 0
+    for timestamp, dwell_time, present in rows:
+        readings += 1
+        x = timestamp.timestamp()
+        point = (x, dwell_time, timestamp)
+        if buffered is not None:
+            buffered.append((point, (x, present, timestamp)))
+            if len(buffered) <= points:
+                continue
+            for dwell_point, presence_point in buffered:
+                dwell.add(dwell_point)
+                presence.add(presence_point)
+            buffered = None
+            continue
+        dwell.add(point)
+        presence.add((x, present, timestamp))
+
+    if buffered is not None:
+        # Few enough readings to send them all.
+        dwell_points = [dwell_point for dwell_point, _ in buffered]
+        changes = []
+        for presence_point in (point for _, point in buffered):
+            if not changes or presence_point[1] != changes[-1][1]:
+                changes.append(presence_point)
+    else:
+        dwell_points = dwell.finish()
+        changes = presence.finish()
+    return {
+        "readings": readings,
+        "dwell_time": [(point[2], point[1]) for point in dwell_points],
+        "human_presence": [(point[2], point[1]) for point in changes],
+    }
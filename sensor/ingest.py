@@ -0,0 +1,128 @@
+"""Helpers shared by the HTTP and Pub/Sub ingestion paths."""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import latest, metrics, response_cache
+from .dedupe import recent_messages
+from .models import SensorRecord
+from .rollups import apply_rollups
+from .sessions import apply_sessions
+
+_COLUMNS = (
+    "sensor_id",
+    "human_presence",
+    "dwell_time",
+    "timestamp",
+    "message_id",
+)
+
+_INSERT = """
+    INSERT INTO {table} ({columns}) VALUES {values}
+    ON CONFLICT DO NOTHING
+    RETURNING id, {columns}
+"""
+
+
+def skip_duplicates(records):
+    """Drop records whose message id was recently written or is repeated.
+
+    Args:
+        records (Iterable[SensorRecord]): Unsaved records.
+    Returns:
+        list[SensorRecord]: The records that still need an INSERT.
+    """
+    unique = []
+    batch_ids = set()
+    for record in records:
+        key = record.message_id
+        if key is not None:
+            if key in batch_ids or recent_messages.seen(key):
+                continue
+            batch_ids.add(key)
+        unique.append(record)
+    return unique
+
+
+def insert_records(records, batch_size):
+    """INSERT ``records``, ignoring those that already exist.
+
+    Rows conflicting with the ``(message_id, timestamp)`` constraint are
+    skipped by the database. The rows ``RETURNING`` yields, in no
+    guaranteed order, are matched back to ``records`` by their values:
+    the constraint makes them unique unless ``message_id`` is null, and
+    records equal in every column are interchangeable.
+
+    Returns:
+        list[SensorRecord]: The inserted records, with ``pk`` set.
+    """
+    quote = connection.ops.quote_name
+    placeholder = "(" + ", ".join(["%s"] * len(_COLUMNS)) + ")"
+    created = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            params = []
+            for record in batch:
+                params.extend(getattr(record, column) for column in _COLUMNS)
+            cursor.execute(
+                _INSERT.format(
+                    table=quote(SensorRecord._meta.db_table),
+                    columns=", ".join(quote(column) for column in _COLUMNS),
+                    values=", ".join([placeholder] * len(batch)),
+                ),
+                params,
+            )
+            inserted = defaultdict(list)
+            for row in cursor.fetchall():
+                inserted[row[1:]].append(row[0])
+            for record in batch:
+                pks = inserted.get(
+                    tuple(getattr(record, column) for column in _COLUMNS)
+                )
+                if pks:
+                    record.pk = pks.pop()
+                    created.append(record)
+    return created
+
+
+def save_records(records, batch_size=None):
+    """Write sensor records in a single transaction, dropping duplicates.
+
+    Every ingest path writes through here so that derived tables, such
+    as the rollups and presence sessions, are updated in the same
+    transaction, and the latest state and response caches once it
+    commits. Redelivered messages are recognised by their
+    ``message_id``, first in the in-process ``recent_messages`` filter
+    and then by the unique constraint, and only newly inserted rows
+    reach the derived tables.
+
+    Args:
+        records (list[SensorRecord]): Unsaved, validated model instances.
+        batch_size (int, optional): Rows per INSERT statement. Defaults to
+            ``SENSOR_BULK_CREATE_BATCH_SIZE``.
+    Returns:
+        list[SensorRecord]: The created records. Duplicates are left
+        with ``pk`` set to ``None``.
+    """
+    records = skip_duplicates(records)
+    if not records:
+        return []
+    with metrics.WRITE.time(), transaction.atomic():
+        created = insert_records(
+            records, batch_size or settings.SENSOR_BULK_CREATE_BATCH_SIZE
+        )
+        apply_rollups(created)
+        apply_sessions(created)
+        transaction.on_commit(
+            lambda: recent_messages.add_many(
+                record.message_id
+                for record in records
+                if record.message_id is not None
+            )
+        )
+        transaction.on_commit(lambda: latest.update(created))
+        transaction.on_commit(lambda: response_cache.invalidate(created))
+    return created
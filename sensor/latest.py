@@ -0,0 +1,170 @@
+"""Write-through cache of the latest reading of every sensor.
+
+Each sensor's latest state lives under its own cache key, next to an
+index of the known sensor ids; neither expires. The ingest paths
+update both after their transaction commits, so reads never go to the
+database once the cache is warm. Server workers warm it at start-up.
+
+Loading from the database is O(sensors), not O(readings): Postgres has
+no skip scan, so the sensor ids are enumerated with a recursive query
+that probes the ``(sensor_id, timestamp)`` index once per sensor, and
+each sensor's latest row is a ``LIMIT 1`` lookup in the same index.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from .models import SensorRecord
+
+INDEX_KEY = "sensor:latest:ids"
+KEY = "sensor:latest:{}"
+
+_SENSOR_IDS = """
+    WITH RECURSIVE ids AS (
+        (SELECT sensor_id FROM {table} ORDER BY sensor_id LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT sensor_id FROM {table}
+            WHERE sensor_id > ids.sensor_id
+            ORDER BY sensor_id LIMIT 1
+        )
+        FROM ids WHERE ids.sensor_id IS NOT NULL
+    )
+    SELECT sensor_id FROM ids WHERE sensor_id IS NOT NULL
+"""
+
+_LATEST = """
+    SELECT ids.sensor_id, r.human_presence, r.dwell_time, r."timestamp"
+    FROM ({ids}) AS ids (sensor_id)
+    CROSS JOIN LATERAL (
+        SELECT human_presence, dwell_time, "timestamp"
+        FROM {table}
+        WHERE sensor_id = ids.sensor_id
+        ORDER BY "timestamp" DESC, id DESC
+        LIMIT 1
+    ) AS r
+"""
+
+
+def _cache():
+    return caches[settings.SENSOR_LATEST_CACHE]
+
+
+def _load(sensor_ids=None):
+    """Read the latest row per sensor from the database."""
+    table = connection.ops.quote_name(SensorRecord._meta.db_table)
+    if sensor_ids is None:
+        ids, params = _SENSOR_IDS.format(table=table), []
+    else:
+        ids, params = "SELECT unnest(%s::bigint[])", [list(sensor_ids)]
+    with connection.cursor() as cursor:
+        cursor.execute(_LATEST.format(ids=ids, table=table), params)
+        return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+
+def warm():
+    """Reload every sensor's latest state from the database.
+
+    Returns:
+        dict: Sensor id mapped to ``(human_presence, dwell_time,
+        timestamp)``.
+    """
+    states = _load()
+    cache = _cache()
+    cache.set_many({KEY.format(i): state for i, state in states.items()}, None)
+    cache.set(INDEX_KEY, sorted(states), None)
+    return states
+
+
+def ensure_warm():
+    """Warm the cache unless another process already did."""
+    if _cache().get(INDEX_KEY) is None:
+        warm()
+
+
+def update(records):
+    """Write the newest of ``records`` per sensor through to the cache.
+
+    Readings older than the cached state are ignored, so late or
+    redelivered messages do not move a sensor back in time.
+
+    Args:
+        records (Iterable[SensorRecord]): Records that were just committed.
+    """
+    newest = {}
+    for record in records:
+        current = newest.get(record.sensor_id)
+        if current is None or record.timestamp >= current.timestamp:
+            newest[record.sensor_id] = record
+    if not newest:
+        return
+
+    cache = _cache()
+    keys = {KEY.format(i): i for i in newest}
+    cached = cache.get_many(list(keys))
+    changed = {}
+    for key, sensor_id in keys.items():
+        record = newest[sensor_id]
+        state = cached.get(key)
+        if state is None or record.timestamp >= state[2]:
+            changed[key] = (
+                record.human_presence,
+                record.dwell_time,
+                record.timestamp,
+            )
+    if changed:
+        cache.set_many(changed, None)
+
+    # The index never expires, so a sensor lost to another process
+    # adding a different one at the same time would stay unlisted:
+    # check that ours stuck.
+    for _ in range(3):
+        index = cache.get(INDEX_KEY)
+        if index is None or newest.keys() <= set(index):
+            break
+        cache.set(INDEX_KEY, sorted(set(index) | newest.keys()), None)
+
+
+def get_latest(sensor_ids=None):
+    """Return the latest state of the given sensors, or of all of them.
+
+    Args:
+        sensor_ids (list[int], optional): Sensors to look up. Defaults to
+            every known sensor.
+    Returns:
+        list[dict]: One entry per sensor with a reading, ordered by id.
+    """
+    cache = _cache()
+    index = cache.get(INDEX_KEY)
+    if index is None:
+        # Only when the cache was lost; workers warm it at start-up.
+        states = warm()
+    else:
+        wanted = index if sensor_ids is None else sensor_ids
+        keys = {KEY.format(i): i for i in wanted}
+        states = {
+            keys[key]: state
+            for key, state in cache.get_many(list(keys)).items()
+        }
+        missing = [i for i in wanted if i not in states]
+        if missing:
+            loaded = _load(missing)
+            cache.set_many(
+                {KEY.format(i): state for i, state in loaded.items()}, None
+            )
+            states.update(loaded)
+
+    if sensor_ids is not None:
+        states = {i: states[i] for i in sensor_ids if i in states}
+    return [
+        {
+            "sensor_id": sensor_id,
+            "human_presence": presence,
+            "dwell_time": dwell_time,
+            "timestamp": timestamp,
+        }
+        for sensor_id, (presence, dwell_time, timestamp) in sorted(
+            states.items()
+        )
+    ]
@@ -0,0 +1,141 @@
+"""Synthetic sensor fleets for benchmarks and load tests.
+
+Readings use the device payload format (``serial``, ``Time``, ``v0`` …
+``v18``). Presence per sensor follows a two-state Markov chain, so a
+room stays occupied for a while and ``v18`` (dwell time) grows while it
+is occupied and resets when it empties, as real devices report it.
+"""
+
+import base64
+import json
+import random
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from .models import SensorRecord
+from .sources import ReplayMessage
+
+
+class SensorFleet:
+    """A reproducible fleet of proximity sensors.
+
+    Args:
+        sensors (int): Number of sensors in the fleet.
+        seed (int): Random seed; equal seeds give equal readings.
+        start (datetime, optional): Time of the first reading. Defaults
+            to 2024-01-01 UTC.
+        interval (timedelta): Reporting interval of each sensor.
+        occupancy (float): Long-run share of time a sensor sees someone.
+        mean_stay (int): Mean number of readings a presence state lasts.
+    """
+
+    first_sensor_id = 100000
+
+    def __init__(
+        self,
+        sensors=100,
+        seed=0,
+        start=None,
+        interval=timedelta(seconds=10),
+        occupancy=0.3,
+        mean_stay=30,
+    ):
+        self.random = random.Random(seed)
+        self.sensor_ids = [self.first_sensor_id + i for i in range(sensors)]
+        self.now = start or datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        self.interval = interval
+        # Leave and enter probabilities giving the requested occupancy.
+        self.p_leave = 1 / mean_stay
+        self.p_enter = self.p_leave * occupancy / (1 - occupancy)
+        self.present = {
+            sensor_id: self.random.random() < occupancy
+            for sensor_id in self.sensor_ids
+        }
+        self.dwell = dict.fromkeys(self.sensor_ids, 0.0)
+        self.sequence = 0
+
+    def _step(self, sensor_id):
+        present = self.present[sensor_id]
+        if present:
+            present = self.random.random() >= self.p_leave
+        else:
+            present = self.random.random() < self.p_enter
+        self.present[sensor_id] = present
+        if present:
+            self.dwell[sensor_id] += self.interval.total_seconds()
+        else:
+            self.dwell[sensor_id] = 0.0
+        return present
+
+    def readings(self, count):
+        """Yield ``count`` device payloads, oldest first.
+
+        Sensors report in turn, each once per ``interval``, with up to a
+        second of jitter.
+        """
+        spacing = self.interval / len(self.sensor_ids)
+        for _ in range(count):
+            sensor_id = self.sensor_ids[self.sequence % len(self.sensor_ids)]
+            self.sequence += 1
+            self.now += spacing
+            present = self._step(sensor_id)
+            jitter = timedelta(microseconds=self.random.randrange(1000000))
+            yield {
+                "serial": f"{sensor_id:012d}",
+                "application": 11,
+                "Time": (self.now + jitter).isoformat(),
+                "Type": "xkgw",
+                "device": f"Sensor{sensor_id}",
+                "v0": sensor_id,
+                "v1": round(self.random.uniform(0, 1), 2),
+                "v2": round(self.random.uniform(0, 2), 2),
+                "v3": round(self.random.uniform(0, 1), 2),
+                "v4": 0,
+                "v5": round(self.random.uniform(0, 1), 2),
+                "v6": 0,
+                "v7": self.random.randrange(30000),
+                "v8": 0.1,
+                "v9": self.random.randrange(10**8),
+                "v10": 0,
+                "v11": int(present),
+                "v12": round(self.random.uniform(0, 2), 2),
+                "v13": 0,
+                "v14": round(self.random.uniform(0, 1), 2),
+                "v15": 10010,
+                "v16": sensor_id,
+                "v17": self.random.randrange(30000),
+                "v18": round(self.dwell[sensor_id], 2),
+            }
+
+    def envelopes(self, count):
+        """Yield ``count`` Pub/Sub push envelopes."""
+        for reading in self.readings(count):
+            data = base64.b64encode(json.dumps(reading).encode("utf-8"))
+            message_id = str(self.random.getrandbits(52))
+            yield {
+                "message": {
+                    "data": data.decode("ascii"),
+                    "messageId": message_id,
+                    "message_id": message_id,
+                    "publishTime": reading["Time"],
+                },
+                "subscription": "projects/bench/subscriptions/sensor",
+            }
+
+    def messages(self, count):
+        """Yield ``count`` streaming pull messages settled in memory."""
+        for envelope in self.envelopes(count):
+            yield ReplayMessage(
+                json.dumps(envelope).encode("utf-8"),
+                envelope["message"]["messageId"],
+            )
+
+    def records(self, count):
+        """Yield ``count`` unsaved ``SensorRecord`` instances."""
+        for reading in self.readings(count):
+            yield SensorRecord(
+                sensor_id=reading["v0"],
+                human_presence=bool(reading["v11"]),
+                dwell_time=reading["v18"],
+                timestamp=datetime.fromisoformat(reading["Time"]),
+            )
@@ -0,0 +1,128 @@
+import os
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from sensor import latest, response_cache
+from sensor.backfill import (
+    Checkpoint,
+    Loader,
+    analyze,
+    create_indexes,
+    decode_chunks,
+    drop_indexes,
+    read_chunks,
+)
+from sensor.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Load archived Pub/Sub push envelopes (NDJSON, optionally "
+        "gzipped) into SensorRecord with COPY."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archives", nargs="+", help="Archive files.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Decoding processes. 1 decodes in the loading process.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50000,
+            help="Envelopes decoded and loaded per transaction.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Progress file. An existing one resumes after the last "
+            "loaded chunk.",
+        )
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help="Drop the secondary indexes for the load and rebuild "
+            "them afterwards.",
+        )
+        parser.add_argument(
+            "--no-dedupe",
+            action="store_false",
+            dest="dedupe",
+            help="COPY straight into the table. Faster, but the load "
+            "fails on envelopes that are already stored.",
+        )
+        parser.add_argument(
+            "--skip-rollups",
+            action="store_true",
+            help="Do not rebuild the rollups and presence sessions over "
+            "the loaded range.",
+        )
+
+    def handle(self, *args, **options):
+        for path in options["archives"]:
+            if not os.path.exists(path):
+                raise CommandError(f"{path} does not exist.")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        checkpoint = Checkpoint(options["checkpoint"])
+        if options["defer_indexes"] and not checkpoint.deferred_indexes:
+            checkpoint.deferred_indexes = drop_indexes()
+            self.stdout.write(
+                f"Dropped {len(checkpoint.deferred_indexes)} indexes."
+            )
+
+        loader = Loader(dedupe=options["dedupe"])
+        chunks = read_chunks(
+            options["archives"], options["chunk_size"], checkpoint
+        )
+        started = time.perf_counter()
+        loaded = skipped = invalid = 0
+        try:
+            for path, end, chunk in decode_chunks(chunks, options["workers"]):
+                inserted = loader.load(chunk)
+                checkpoint.advance(path, end, chunk["first"], chunk["last"])
+                loaded += inserted
+                skipped += chunk["rows"] - inserted
+                invalid += len(chunk["invalid"])
+                rate = loaded / (time.perf_counter() - started)
+                self.stdout.write(
+                    f"{path}:{end} loaded {loaded:,} rows "
+                    f"({rate:,.0f} rows/s), {skipped:,} duplicates, "
+                    f"{invalid:,} invalid"
+                )
+        except DatabaseError as e:
+            raise CommandError(
+                f"Load failed: {e}. Rerun with the same --checkpoint to "
+                "resume after the last loaded chunk."
+            )
+
+        if checkpoint.deferred_indexes:
+            self.stdout.write("Rebuilding indexes...")
+            create_indexes(checkpoint.deferred_indexes)
+            checkpoint.deferred_indexes = []
+        analyze()
+        if checkpoint.loaded_range and not options["skip_rollups"]:
+            self.stdout.write("Rebuilding rollups and sessions...")
+            rebuild_rollups(*checkpoint.loaded_range)
+            call_command(
+                "rebuild_sessions",
+                since=checkpoint.loaded_range[0],
+                stdout=self.stdout,
+            )
+        response_cache.invalidate_history()
+        latest.warm()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {loaded:,} rows in {elapsed:.1f}s "
+                f"({loaded / elapsed:,.0f} rows/s); {skipped:,} duplicates "
+                f"and {invalid:,} invalid envelopes skipped."
+            )
+        )
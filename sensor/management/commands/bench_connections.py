@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+
+from sensor import benchmarks
+from sensor.loadgen import SensorFleet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request latency with a database connection per request "
+        "and with persistent connections, in a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Requests per workload and connection mode.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Threads serving requests, as a worker's thread pool.",
+        )
+        parser.add_argument(
+            "--conn-max-age",
+            type=int,
+            default=600,
+            help="CONN_MAX_AGE of the persistent mode.",
+        )
+        parser.add_argument("--sensors", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with benchmarks.isolated():
+            self.run(options)
+
+    def run(self, options):
+        fleet = SensorFleet(sensors=options["sensors"])
+        benchmarks.seed(fleet, 10000)
+        self.stdout.write(
+            f"{'workload':<20} {'connections':>11} {'ops/s':>10} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        for method, expected in (("post", 201), ("get", 200)):
+            p50 = {}
+            for mode, max_age in (
+                ("per-request", 0),
+                ("persistent", options["conn_max_age"]),
+            ):
+                environs = benchmarks.wsgi_requests(
+                    fleet, options["requests"], method
+                )
+                summary = benchmarks.bench_wsgi(
+                    environs, options["concurrency"], max_age, expected
+                )
+                p50[mode] = summary["p50_ms"]
+                self.stdout.write(
+                    f"{method + ' ' + mode:<20} "
+                    f"{summary['connections']:>11} "
+                    f"{summary['throughput']:>10,.0f} "
+                    f"{summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+                    f"{summary['p99_ms']:>9.2f} {summary['errors']:>7}"
+                )
+            self.stdout.write(
+                f"{method}: persistent connections save "
+                f"{p50['per-request'] - p50['persistent']:.2f} ms per "
+                "request at p50."
+            )
@@ -0,0 +1,81 @@
+import base64
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from sensor.decoder import decode_data, decode_many
+from sensor.serializers import SensorRecordSerializer
+
+
+def serializer_path(envelopes):
+    """The per-reading decode + ``ModelSerializer`` validation pass."""
+    for envelope in envelopes:
+        sensor_data = decode_data(envelope["message"]["data"])
+        serializer = SensorRecordSerializer(
+            data={
+                "sensor_id": sensor_data["v0"],
+                "human_presence": bool(sensor_data["v11"]),
+                "dwell_time": sensor_data["v18"],
+                "timestamp": sensor_data["Time"],
+            }
+        )
+        serializer.is_valid()
+
+
+def decoder_path(envelopes):
+    for _ in decode_many(envelopes):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Compare decode + validation throughput of the ingest paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        start = datetime(2022, 11, 8, tzinfo=timezone.utc)
+        envelopes = []
+        for i in range(options["rows"]):
+            reading = {
+                "Time": (start + timedelta(seconds=i)).isoformat(),
+                "v0": random.randint(100000, 100100),
+                "v11": random.randint(0, 1),
+                "v18": round(random.uniform(0, 30), 2),
+            }
+            envelopes.append(
+                {
+                    "message": {
+                        "data": base64.b64encode(
+                            json.dumps(reading).encode("utf-8")
+                        ).decode("utf-8")
+                    }
+                }
+            )
+
+        results = {}
+        for name, func in (
+            ("serializer", serializer_path),
+            ("decoder", decoder_path),
+        ):
+            best = min(
+                self._time(func, envelopes) for _ in range(options["repeat"])
+            )
+            results[name] = len(envelopes) / best
+            self.stdout.write(f"{name:>10}: {results[name]:>12,.0f} rows/s")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"speedup: {results['decoder'] / results['serializer']:.1f}x"
+            )
+        )
+
+    @staticmethod
+    def _time(func, envelopes):
+        started = time.perf_counter()
+        func(envelopes)
+        return time.perf_counter() - started
@@ -0,0 +1,86 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from sensor.models import SensorRecord
+from sensor.renderers import (
+    ColumnarJSONRenderer,
+    MessagePackRenderer,
+    rows_to_columns,
+    rows_to_records,
+)
+from sensor.serializers import SensorRecordSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare serialization time and payload size of the read "
+        "endpoint's response formats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rows = [
+            (
+                i,
+                random.randint(100000, 100100),
+                random.random() < 0.5,
+                round(random.uniform(0, 30), 2),
+                start + timedelta(seconds=i),
+            )
+            for i in range(options["rows"])
+        ]
+
+        def serializer():
+            # Model instances are what the ORM hands the serializer.
+            records = [
+                SensorRecord(
+                    id=row_id,
+                    sensor_id=sensor_id,
+                    human_presence=presence,
+                    dwell_time=dwell_time,
+                    timestamp=timestamp,
+                )
+                for row_id, sensor_id, presence, dwell_time, timestamp in rows
+            ]
+            data = SensorRecordSerializer(records, many=True).data
+            return JSONRenderer().render({"data": data})
+
+        def records():
+            return JSONRenderer().render({"data": rows_to_records(rows)})
+
+        def columnar():
+            return ColumnarJSONRenderer().render(
+                {"data": rows_to_columns(rows)}
+            )
+
+        def msgpack():
+            return MessagePackRenderer().render(
+                {"data": rows_to_columns(rows)}
+            )
+
+        self.stdout.write(
+            f"{'format':>12} {'ms/page':>10} {'bytes':>10} {'rows/s':>12}"
+        )
+        for name, func in (
+            ("serializer", serializer),
+            ("json", records),
+            ("columnar", columnar),
+            ("msgpack", msgpack),
+        ):
+            best = float("inf")
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                payload = func()
+                best = min(best, time.perf_counter() - started)
+            self.stdout.write(
+                f"{name:>12} {best * 1000:>10.2f} {len(payload):>10,} "
+                f"{len(rows) / best:>12,.0f}"
+            )
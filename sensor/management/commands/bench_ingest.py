@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from sensor.benchmarks import isolated, slow_database
+
+BENCH_SENSOR_ID = 999999
+
+
+def make_body(i, timestamp):
+    data = {"v0": BENCH_SENSOR_ID, "v11": i % 2, "v18": 1.5, "Time": timestamp}
+    return json.dumps(
+        {
+            "message": {
+                "data": base64.b64encode(json.dumps(data).encode()).decode()
+            }
+        }
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare latency and throughput of the sync ingest endpoint, "
+        "served by a fixed pool of worker threads as under WSGI, with "
+        "the async endpoint under the same client concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Worker threads serving the sync endpoint.",
+        )
+        parser.add_argument(
+            "--db-latency",
+            type=float,
+            default=0.0,
+            help="Milliseconds added to every query, to model the round "
+            "trip to a database on another host.",
+        )
+
+    def handle(self, *args, **options):
+        start = datetime.now(timezone.utc)
+        bodies = [
+            make_body(i, (start + timedelta(microseconds=i)).isoformat())
+            for i in range(options["requests"])
+        ]
+        delay = options["db_latency"] / 1000
+        # Never touch the configured database and cache: the requests
+        # write sessions, rollups and the latest readings too.
+        with isolated():
+            with slow_database(delay) if delay else nullcontext():
+                self.stdout.write(
+                    f"{'path':>6} {'req/s':>10} {'p50 ms':>10} "
+                    f"{'p99 ms':>10} {'errors':>8}"
+                )
+                for name, bench in (
+                    ("wsgi", self.sync),
+                    ("asgi", self.async_),
+                ):
+                    started = time.perf_counter()
+                    latencies, errors = asyncio.run(bench(bodies, options))
+                    elapsed = time.perf_counter() - started
+                    latencies.sort()
+                    p99 = latencies[int(len(latencies) * 0.99) - 1]
+                    self.stdout.write(
+                        f"{name:>6} {len(bodies) / elapsed:>10,.0f} "
+                        f"{statistics.median(latencies) * 1000:>10.1f} "
+                        f"{p99 * 1000:>10.1f} {errors:>8}"
+                    )
+
+    async def drive(self, bodies, concurrency, send):
+        """Send ``bodies`` from ``concurrency`` closed-loop clients."""
+        pending = iter(bodies)
+        latencies = []
+        errors = 0
+
+        async def client():
+            nonlocal errors
+            for body in pending:
+                started = time.perf_counter()
+                response = await send(body)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != 201
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return latencies, errors
+
+    async def sync(self, bodies, options):
+        loop = asyncio.get_running_loop()
+        client = Client()
+        pool = ThreadPoolExecutor(options["workers"])
+
+        def post(body):
+            return client.post(
+                "/api/sensor/", body, content_type="application/json"
+            )
+
+        try:
+            return await self.drive(
+                bodies,
+                options["concurrency"],
+                lambda body: loop.run_in_executor(pool, post, body),
+            )
+        finally:
+            pool.shutdown()
+
+    async def async_(self, bodies, options):
+        client = AsyncClient()
+        return await self.drive(
+            bodies,
+            options["concurrency"],
+            lambda body: client.post(
+                "/api/sensor/async/", body, content_type="application/json"
+            ),
+        )
@@ -0,0 +1,148 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from sensor import benchmarks
+from sensor.loadgen import SensorFleet
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ingestion and queries against a synthetic sensor fleet "
+        "in a throwaway database, write the results as JSON and "
+        "optionally compare them with a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sensors", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--ingest",
+            type=int,
+            default=1000,
+            help="Messages sent through each ingest path.",
+        )
+        parser.add_argument(
+            "--sizes",
+            default="10000,100000",
+            help="Comma-separated table sizes the queries run at.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=50,
+            help="Requests per query shape and table size.",
+        )
+        parser.add_argument("--output", help="File to write results to.")
+        parser.add_argument(
+            "--baseline", help="Results file of an earlier run."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Relative p95/p99 increase or throughput drop counted "
+            "as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["sizes"].split(","))
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        # Never touch the configured database and cache: the suite fills
+        # them and would otherwise pollute (and be skewed by) real data.
+        with benchmarks.isolated():
+            results = self.run(options, sizes)
+
+        report = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "sensors": options["sensors"],
+                "seed": options["seed"],
+                "ingest": options["ingest"],
+                "sizes": sizes,
+                "repeat": options["repeat"],
+            },
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            self.check_baseline(
+                results, baseline["results"], options["tolerance"]
+            )
+
+    def run(self, options, sizes):
+        fleet = SensorFleet(sensors=options["sensors"], seed=options["seed"])
+        results = {}
+        self.stdout.write(
+            f"{'workload':<32} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'errors':>7}"
+        )
+
+        for name, bench in (
+            ("ingest.post", benchmarks.bench_post),
+            (
+                "ingest.process_sensor_data",
+                benchmarks.bench_process_sensor_data,
+            ),
+            ("ingest.batcher", benchmarks.bench_batcher),
+        ):
+            results[name] = bench(fleet, options["ingest"])
+            self.report(name, results[name])
+
+        for size in sizes:
+            benchmarks.seed(fleet, size)
+            shapes = benchmarks.query_shapes(fleet)
+            for shape, (path, params) in shapes.items():
+                name = f"query.{shape}@{size}"
+                results[name] = benchmarks.bench_query(
+                    path, params, options["repeat"]
+                )
+                self.report(name, results[name])
+            name = f"query.sensor_range_cached@{size}"
+            results[name] = benchmarks.bench_query(
+                *shapes["sensor_range"], options["repeat"], cached=True
+            )
+            self.report(name, results[name])
+        return results
+
+    def report(self, name, summary):
+        self.stdout.write(
+            f"{name:<32} {summary['throughput']:>10,.0f} "
+            f"{summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+            f"{summary['p99_ms']:>9.2f} {summary['errors']:>7}"
+        )
+
+    def check_baseline(self, results, baseline, tolerance):
+        rows = benchmarks.compare(results, baseline, tolerance)
+        regressions = [row for row in rows if row["regressed"]]
+        for row in regressions:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"{row['name']} {row['metric']}: {row['baseline']} -> "
+                    f"{row['current']} ({row['change']:+.0%})"
+                )
+            )
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} metrics regressed by more than "
+                f"{tolerance:.0%}."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"No regressions in {len(rows)} metrics compared with the "
+                "baseline."
+            )
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from sensor.queries import query_shapes
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the read endpoints' query shapes and fail if any "
+        "of them falls back to a sequential scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--disable-seqscan",
+            action="store_true",
+            help="Set enable_seqscan=off so small tables still show whether "
+            "an index can serve each shape.",
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if options["disable_seqscan"]:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            for name, queryset in query_shapes().items():
+                plan = queryset.explain()
+                if "Seq Scan" in plan:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"{name}:\n{plan}"))
+                elif options["verbosity"] > 1:
+                    self.stdout.write(f"{name}:\n{plan}")
+
+        if failures:
+            raise CommandError(
+                "Sequential scan in query shapes: " + ", ".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("All query shapes use indexes."))
@@ -0,0 +1,70 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sensor.pressure import TRANSIENT_ERRORS
+from sensor.spool import Spool, SpoolDrainer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the readings spooled in SENSOR_SPOOL_DIR into SensorRecord, "
+        "oldest segment first, recovering those of processes that died."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain what is sealed now and exit, instead of draining "
+            "every --interval seconds until SIGTERM or SIGINT.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between drains.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows per INSERT statement.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.SENSOR_SPOOL_DIR:
+            raise CommandError("SENSOR_SPOOL_DIR is not set.")
+        spool = Spool(
+            settings.SENSOR_SPOOL_DIR,
+            settings.SENSOR_SPOOL_SEGMENT_BYTES,
+            settings.SENSOR_SPOOL_SEAL_AGE,
+            settings.SENSOR_SPOOL_MAX_BYTES,
+        )
+        drainer = SpoolDrainer(spool, batch_size=options["batch_size"])
+        if options["once"]:
+            try:
+                created = drainer.drain()
+            except TRANSIENT_ERRORS as e:
+                raise CommandError(f"Drain failed: {e}. Rerun to resume.")
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Drained the spool: {created:,} records created, "
+                    f"{spool.depth()} segments left."
+                )
+            )
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stop.set())
+        self.stdout.write(f"Draining {spool.directory}")
+        while not stop.wait(options["interval"]):
+            try:
+                created = drainer.drain()
+            except TRANSIENT_ERRORS as e:
+                self.stderr.write(f"Error draining the spool: {e}")
+                continue
+            if created:
+                self.stdout.write(f"Created {created:,} records.")
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sensor.partitions import (
+    add_months,
+    create_partition,
+    expire_default_rows,
+    expire_partition,
+    list_partitions,
+    month_start,
+    partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-create upcoming SensorRecord partitions and expire old ones "
+        "into the hourly rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=3,
+            help="Number of future months to keep partitions for.",
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            help="Keep raw readings for this many whole months before the "
+            "current one. Older partitions are downsampled and dropped. "
+            "Nothing is dropped when omitted.",
+        )
+
+    def handle(self, *args, **options):
+        if options["ahead"] < 0:
+            raise CommandError("--ahead must not be negative.")
+        current = month_start(timezone.now())
+        existing = set(list_partitions())
+
+        for offset in range(options["ahead"] + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                create_partition(month)
+                existing.add(month)
+                self.stdout.write(f"Created {partition_name(month)}")
+
+        retention = options["retention_months"]
+        if retention is not None:
+            if retention < 0:
+                raise CommandError("--retention-months must not be negative.")
+            cutoff = add_months(current, -retention)
+            for month in sorted(existing):
+                if add_months(month, 1) <= cutoff:
+                    expire_partition(month)
+                    self.stdout.write(f"Dropped {partition_name(month)}")
+            deleted = expire_default_rows(cutoff)
+            if deleted:
+                self.stdout.write(
+                    f"Deleted {deleted} expired rows from the default "
+                    "partition"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Partitions are up to date."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from sensor.rollups import parse_bound, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild or backfill the sensor rollup tables from raw readings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start",
+            type=parse_bound,
+            help="ISO 8601 start of the range. Defaults to the oldest "
+            "reading.",
+        )
+        parser.add_argument(
+            "--end",
+            type=parse_bound,
+            help="ISO 8601 end of the range. Defaults to the newest reading.",
+        )
+
+    def handle(self, *args, **options):
+        windows = rebuild_rollups(start=options["start"], end=options["end"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt rollups for {windows} day(s).")
+        )
@@ -0,0 +1,83 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.serving import connection_budget, shared_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the API with Gunicorn: several worker processes, each "
+        "warmed up and keeping its database connections open."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bind",
+            default=os.environ.get("SERVE_BIND", "0.0.0.0:8000"),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=int(
+                os.environ.get("SERVE_WORKERS", 2 * (os.cpu_count() or 1))
+            ),
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=int(os.environ.get("SERVE_THREADS", 4)),
+            help="Request threads per worker, each with its own "
+            "persistent database connection.",
+        )
+        parser.add_argument(
+            "--asgi",
+            action="store_true",
+            help="Serve core.asgi with Uvicorn workers, for the async "
+            "ingest endpoint. Django closes database connections "
+            "after every ASGI request, so they are not kept open.",
+        )
+
+    def handle(self, *args, **options):
+        gunicorn = shutil.which("gunicorn")
+        if gunicorn is None:
+            raise CommandError("gunicorn is not installed.")
+        try:
+            shared_cache(options["workers"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        argv = [
+            gunicorn,
+            "--config",
+            str(settings.BASE_DIR / "core" / "gunicorn.conf.py"),
+            "--bind",
+            options["bind"],
+            "--workers",
+            str(options["workers"]),
+        ]
+        if options["asgi"]:
+            argv += [
+                "--worker-class",
+                "uvicorn.workers.UvicornWorker",
+                "core.asgi:application",
+            ]
+            os.environ["DB_CONN_MAX_AGE"] = "0"
+        else:
+            try:
+                connection_budget(options["workers"], options["threads"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            argv += ["--threads", str(options["threads"])]
+
+        if settings.DATABASES["default"]["CONN_MAX_AGE"] == 0:
+            self.stderr.write(
+                "Database connections are closed after every request; "
+                "use DJANGO_SETTINGS_MODULE=core.settings_production to "
+                "keep them open."
+            )
+        self.stdout.write(" ".join(argv))
+        self.stdout.flush()
+        # Replace this process so that signals reach the Gunicorn master.
+        os.execv(gunicorn, argv)
@@ -1,12 +1,145 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from sensor.tasks import start_subscriber
+from core.metrics import start_http_server
+from core.serving import shared_cache
+from sensor.supervisor import Supervisor
+
+PIPELINES = ("inline", "celery")
+
+
+def run_subscriber(index, options):
+    # Imported here so that every worker creates its own gRPC client
+    # after the fork.
+    from sensor.benchmarks import summarize
+    from sensor.sources import PubSubSource, ReplaySource
+    from sensor.tasks import start_subscriber
+
+    if options["metrics_port"]:
+        start_http_server(options["metrics_port"] + index)
+    if options["replay"]:
+        source = ReplaySource.from_files(
+            options["replay"],
+            speed=options["speed"],
+            max_messages=options["max_messages"],
+            shard=(index, options["workers"]),
+        )
+    else:
+        source = PubSubSource(
+            max_messages=options["max_messages"],
+            max_bytes=options["max_bytes"],
+        )
+    start_subscriber(
+        source,
+        max_batch_size=options["max_batch_size"],
+        max_latency=options["max_latency"],
+        pipeline=options["pipeline"],
+    )
+    if options["replay"] and source.latencies:
+        summary = summarize(source.latencies, source.elapsed, source.nacked)
+        print(
+            f"Worker {index} replayed {source.delivered:,} messages in "
+            f"{summary['seconds']:.1f}s ({summary['throughput']:,.0f}/s): "
+            f"{source.acked:,} acked, {source.nacked:,} nacked; p50 "
+            f"{summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+            f"p99 {summary['p99_ms']:.1f} ms to settle."
+        )
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Starting Pub/Sub subscriber..."))
-        start_subscriber()
-        self.stdout.write(
-            self.style.SUCCESS("Subscriber started successfully.")
+    help = (
+        "Stream sensor readings from Pub/Sub, or replay captured push "
+        "envelopes, in micro-batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-batch-size",
+            type=int,
+            default=500,
+            help="Flush a batch once this many messages are pending.",
+        )
+        parser.add_argument(
+            "--max-latency",
+            type=float,
+            default=1.0,
+            help="Flush a batch once its oldest message waited this many "
+            "seconds.",
         )
+        parser.add_argument(
+            "--max-messages",
+            type=int,
+            default=1000,
+            help="Pub/Sub flow control: outstanding message limit, per "
+            "worker.",
+        )
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=100 * 1024 * 1024,
+            help="Pub/Sub flow control: outstanding bytes limit, per worker.",
+        )
+        parser.add_argument(
+            "--pipeline",
+            choices=PIPELINES,
+            default="inline",
+            help="inline: write batches from the subscriber. celery: "
+            "enqueue them for the sensor-writes Celery workers.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of subscriber processes. With more than one, the "
+            "command supervises them and restarts any that exit.",
+        )
+        parser.add_argument(
+            "--shutdown-timeout",
+            type=float,
+            default=30.0,
+            help="Seconds a worker may spend draining on SIGTERM before "
+            "it is killed.",
+        )
+        parser.add_argument(
+            "--replay",
+            nargs="+",
+            metavar="ARCHIVE",
+            help="Replay push envelopes from NDJSON archives (optionally "
+            "gzipped) instead of pulling from Pub/Sub, and stop once "
+            "they are written. Workers share the archives.",
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            help="With --replay, replay at this multiple of the pace the "
+            "envelopes were published at. Defaults to as fast as "
+            "possible.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Serve Prometheus metrics on this port; worker N listens "
+            "on the port plus N.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options["speed"] is not None and options["speed"] <= 0:
+            raise CommandError("--speed must be positive.")
+        try:
+            # The subscriber writes beside the server processes.
+            shared_cache(options["workers"] + 1)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS("Starting subscriber..."))
+        if options["workers"] == 1:
+            run_subscriber(0, options)
+        else:
+            Supervisor(
+                run_subscriber,
+                options["workers"],
+                args=(options,),
+                shutdown_timeout=options["shutdown_timeout"],
+                finite=bool(options["replay"]),
+            ).run()
+        self.stdout.write(self.style.SUCCESS("Subscriber stopped."))
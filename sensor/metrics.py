@@ -0,0 +1,156 @@
+"""Metrics of the ingest and query paths; see ``core.metrics``.
+
+``sensor_stage_seconds`` splits the time of a reading or a query into
+its stages:
+
+- ``decode``: base64 and JSON decoding of a push envelope;
+- ``validate``: field validation of the decoded reading;
+- ``write``: the database transaction of ``save_records``;
+- ``ack``: acknowledging a Pub/Sub message;
+- ``cache``: the response cache lookup of a ``GET``;
+- ``query``: the view body of a ``GET`` that missed the cache;
+- ``render``: rendering that response before it is cached;
+- ``spool``: appending readings to the local spool, ``fsync`` included.
+
+``sensor_messages_total`` counts readings by ``source`` (``http``,
+``async``, ``batch``, ``pubsub``, ``subscriber``, ``celery``, and
+``spool`` for the spool drainer) and ``outcome`` (``accepted``,
+``duplicate``, ``invalid``, ``error``, ``shed`` when a push is refused
+under backpressure, ``spooled`` when a reading is spooled instead, and
+``enqueued`` when the subscriber hands a batch to Celery).
+"""
+
+from core.metrics import Counter, Gauge, Histogram
+
+from .dedupe import recent_messages
+
+STAGE_SECONDS = Histogram(
+    "sensor_stage_seconds",
+    "Seconds spent in each stage of handling a reading or query.",
+    ["stage"],
+)
+HANDLER_SECONDS = Histogram(
+    "sensor_handler_seconds",
+    "Seconds spent in a request or message handler, end to end.",
+    ["handler"],
+)
+MESSAGES = Counter(
+    "sensor_messages_total",
+    "Sensor readings received, by source and outcome.",
+    ["source", "outcome"],
+)
+PUBSUB_SETTLED = Counter(
+    "sensor_pubsub_settled_total",
+    "Pub/Sub messages acked or nacked.",
+    ["result"],
+)
+QUEUE_DEPTH = Gauge(
+    "sensor_queue_depth",
+    "Readings accepted but not yet handed to the database.",
+    ["queue"],
+)
+RESPONSE_CACHE = Counter(
+    "sensor_response_cache_total",
+    "Response cache lookups of the read endpoints.",
+    ["result"],
+)
+DEDUPE_LOOKUPS = Counter(
+    "sensor_dedupe_lookups_total",
+    "Lookups of the recent message id filter.",
+    ["result"],
+)
+DEDUPE_SIZE = Gauge(
+    "sensor_dedupe_size",
+    "Message ids held by the recent message id filter.",
+)
+WRITE_LIMIT = Gauge(
+    "sensor_write_limit",
+    "Writes a pressure gate currently admits at once.",
+    ["gate"],
+)
+WRITES_IN_FLIGHT = Gauge(
+    "sensor_writes_in_flight",
+    "Writes, or subscriber messages, holding a pressure gate slot.",
+    ["gate"],
+)
+WRITES_SHED = Counter(
+    "sensor_writes_shed_total",
+    "Writes refused by a pressure gate.",
+    ["gate"],
+)
+SPOOL_BYTES = Gauge(
+    "sensor_spool_bytes",
+    "Bytes of spooled readings not yet drained into the database.",
+)
+SPOOL_SEGMENTS = Gauge(
+    "sensor_spool_segments",
+    "Spool segments not yet drained into the database.",
+)
+SPOOL_DRAINED = Counter(
+    "sensor_spool_drained_total",
+    "Spooled readings loaded into the database.",
+)
+
+
+def messages(source):
+    """Return the ``sensor_messages_total`` series of ``source``.
+
+    Returns:
+        dict: Outcome name mapped to its counter series.
+    """
+    return {
+        outcome: MESSAGES.labels(source=source, outcome=outcome)
+        for outcome in (
+            "accepted",
+            "duplicate",
+            "invalid",
+            "error",
+            "shed",
+            "spooled",
+        )
+    }
+
+
+def record_saved(counters, records):
+    """Count ``records`` passed to ``save_records`` as accepted or not."""
+    created = sum(record.pk is not None for record in records)
+    counters["accepted"].inc(created)
+    counters["duplicate"].inc(len(records) - created)
+
+
+DECODE = STAGE_SECONDS.labels(stage="decode")
+VALIDATE = STAGE_SECONDS.labels(stage="validate")
+WRITE = STAGE_SECONDS.labels(stage="write")
+ACK = STAGE_SECONDS.labels(stage="ack")
+CACHE = STAGE_SECONDS.labels(stage="cache")
+QUERY = STAGE_SECONDS.labels(stage="query")
+RENDER = STAGE_SECONDS.labels(stage="render")
+SPOOL = STAGE_SECONDS.labels(stage="spool")
+
+ACKED = PUBSUB_SETTLED.labels(result="acked")
+NACKED = PUBSUB_SETTLED.labels(result="nacked")
+CACHE_HIT = RESPONSE_CACHE.labels(result="hit")
+CACHE_MISS = RESPONSE_CACHE.labels(result="miss")
+BATCHER_DEPTH = QUEUE_DEPTH.labels(queue="batcher")
+ASYNC_DEPTH = QUEUE_DEPTH.labels(queue="async")
+
+DEDUPE_LOOKUPS.labels(result="hit").set_function(lambda: recent_messages.hits)
+DEDUPE_LOOKUPS.labels(result="miss").set_function(
+    lambda: recent_messages.misses
+)
+DEDUPE_SIZE.labels().set_function(lambda: len(recent_messages))
+
+HTTP_MESSAGES = messages("http")
+ASYNC_MESSAGES = messages("async")
+BATCH_MESSAGES = messages("batch")
+PUBSUB_MESSAGES = messages("pubsub")
+SUBSCRIBER_MESSAGES = messages("subscriber")
+CELERY_MESSAGES = messages("celery")
+SPOOL_MESSAGES = messages("spool")
+SUBSCRIBER_ENQUEUED = MESSAGES.labels(source="subscriber", outcome="enqueued")
+
+POST_HANDLER = HANDLER_SECONDS.labels(handler="post")
+ASYNC_POST_HANDLER = HANDLER_SECONDS.labels(handler="async_post")
+BATCH_POST_HANDLER = HANDLER_SECONDS.labels(handler="batch_post")
+GET_HANDLER = HANDLER_SECONDS.labels(handler="get")
+PUBSUB_HANDLER = HANDLER_SECONDS.labels(handler="pubsub")
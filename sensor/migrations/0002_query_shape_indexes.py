@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-18 07:09
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sensor", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="sensorrecord",
+            name="sensor_id",
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="sensorrecord",
+            name="timestamp",
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name="sensorrecord",
+            index=models.Index(
+                fields=["sensor_id", "-timestamp", "-id"],
+                name="sensor_sensor_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sensorrecord",
+            index=models.Index(
+                fields=["timestamp", "id"], name="sensor_ts_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sensorrecord",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                fields=["timestamp"], name="sensor_ts_brin"
+            ),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.0 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sensor", "0002_query_shape_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SensorHourRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sensor_id", models.IntegerField()),
+                ("bucket", models.DateTimeField()),
+                ("readings", models.IntegerField()),
+                ("present", models.IntegerField()),
+                ("dwell_time_sum", models.FloatField()),
+                ("dwell_time_max", models.FloatField()),
+            ],
+            options={
+                "ordering": ["sensor_id", "bucket"],
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="SensorMinuteRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sensor_id", models.IntegerField()),
+                ("bucket", models.DateTimeField()),
+                ("readings", models.IntegerField()),
+                ("present", models.IntegerField()),
+                ("dwell_time_sum", models.FloatField()),
+                ("dwell_time_max", models.FloatField()),
+            ],
+            options={
+                "ordering": ["sensor_id", "bucket"],
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="sensorhourrollup",
+            constraint=models.UniqueConstraint(
+                fields=("sensor_id", "bucket"),
+                name="sensor_sensorhourrollup_bucket_uniq",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="sensorminuterollup",
+            constraint=models.UniqueConstraint(
+                fields=("sensor_id", "bucket"),
+                name="sensor_sensorminuterollup_bucket_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,116 @@
+from django.db import migrations
+
+# Postgres requires the partition key in every unique constraint, so the
+# primary key becomes (id, timestamp). The id column keeps its own
+# sequence because identity columns are not supported on partitioned
+# tables before Postgres 17.
+FORWARD = """
+DROP INDEX sensor_sensor_ts_idx, sensor_ts_id_idx, sensor_ts_brin;
+ALTER TABLE sensor_sensorrecord RENAME TO sensor_sensorrecord_unpartitioned;
+ALTER TABLE sensor_sensorrecord_unpartitioned
+    DROP CONSTRAINT sensor_sensorrecord_pkey;
+
+CREATE SEQUENCE sensor_sensorrecord_partitioned_id_seq;
+CREATE TABLE sensor_sensorrecord (
+    id bigint NOT NULL
+        DEFAULT nextval('sensor_sensorrecord_partitioned_id_seq'),
+    sensor_id integer NOT NULL,
+    human_presence boolean NOT NULL,
+    dwell_time double precision NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+ALTER SEQUENCE sensor_sensorrecord_partitioned_id_seq
+    OWNED BY sensor_sensorrecord.id;
+
+CREATE TABLE sensor_sensorrecord_default
+    PARTITION OF sensor_sensorrecord DEFAULT;
+
+DO $$
+DECLARE
+    month timestamp;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE(
+                (SELECT min("timestamp") FROM sensor_sensorrecord_unpartitioned),
+                now()
+            ) AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC')
+                + interval '2 months',
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF sensor_sensorrecord '
+            'FOR VALUES FROM (%L) TO (%L)',
+            'sensor_sensorrecord_p' || to_char(month, 'YYYYMM'),
+            month::text || '+00',
+            (month + interval '1 month')::text || '+00'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO sensor_sensorrecord
+    (id, sensor_id, human_presence, dwell_time, "timestamp")
+SELECT id, sensor_id, human_presence, dwell_time, "timestamp"
+FROM sensor_sensorrecord_unpartitioned;
+SELECT setval(
+    'sensor_sensorrecord_partitioned_id_seq',
+    COALESCE((SELECT max(id) FROM sensor_sensorrecord), 0) + 1,
+    false
+);
+DROP TABLE sensor_sensorrecord_unpartitioned;
+ALTER SEQUENCE sensor_sensorrecord_partitioned_id_seq
+    RENAME TO sensor_sensorrecord_id_seq;
+
+CREATE INDEX sensor_sensor_ts_idx
+    ON sensor_sensorrecord (sensor_id, "timestamp" DESC, id DESC);
+CREATE INDEX sensor_ts_id_idx ON sensor_sensorrecord ("timestamp", id);
+CREATE INDEX sensor_ts_brin ON sensor_sensorrecord USING brin ("timestamp");
+"""
+
+BACKWARD = """
+DROP INDEX sensor_sensor_ts_idx, sensor_ts_id_idx, sensor_ts_brin;
+ALTER TABLE sensor_sensorrecord RENAME TO sensor_sensorrecord_partitioned;
+
+CREATE TABLE sensor_sensorrecord_plain (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    sensor_id integer NOT NULL,
+    human_presence boolean NOT NULL,
+    dwell_time double precision NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL
+);
+INSERT INTO sensor_sensorrecord_plain
+    (id, sensor_id, human_presence, dwell_time, "timestamp")
+SELECT id, sensor_id, human_presence, dwell_time, "timestamp"
+FROM sensor_sensorrecord_partitioned;
+DROP TABLE sensor_sensorrecord_partitioned CASCADE;
+ALTER TABLE sensor_sensorrecord_plain RENAME TO sensor_sensorrecord;
+ALTER TABLE sensor_sensorrecord
+    RENAME CONSTRAINT sensor_sensorrecord_plain_pkey
+    TO sensor_sensorrecord_pkey;
+ALTER SEQUENCE sensor_sensorrecord_plain_id_seq
+    RENAME TO sensor_sensorrecord_id_seq;
+SELECT setval(
+    'sensor_sensorrecord_id_seq',
+    COALESCE((SELECT max(id) FROM sensor_sensorrecord), 0) + 1,
+    false
+);
+
+CREATE INDEX sensor_sensor_ts_idx
+    ON sensor_sensorrecord (sensor_id, "timestamp" DESC, id DESC);
+CREATE INDEX sensor_ts_id_idx ON sensor_sensorrecord ("timestamp", id);
+CREATE INDEX sensor_ts_brin ON sensor_sensorrecord USING brin ("timestamp");
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sensor", "0003_rollups"),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sensor", "0004_partition_sensorrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sensorrecord",
+            name="message_id",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="sensorrecord",
+            constraint=models.UniqueConstraint(
+                fields=("message_id", "timestamp"), name="sensor_message_uniq"
+            ),
+        ),
+    ]
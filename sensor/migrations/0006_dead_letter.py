@@ -0,0 +1,47 @@
+# Generated by Django 5.0 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sensor", "0005_message_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeadLetter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "message_id",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("invalid", "Invalid payload"),
+                            ("write_failed", "Write failed"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("payload", models.TextField()),
+                ("error", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
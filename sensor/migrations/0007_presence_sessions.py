@@ -0,0 +1,65 @@
+# Generated by Django 5.0 on 2026-10-18 07:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sensor", "0006_dead_letter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PresenceSession",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sensor_id", models.IntegerField()),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                ("readings", models.IntegerField()),
+                ("peak_dwell", models.FloatField()),
+                ("open", models.BooleanField(default=True)),
+            ],
+            options={
+                "ordering": ["sensor_id", "start"],
+                "indexes": [
+                    models.Index(
+                        fields=["sensor_id", "start"],
+                        name="sensor_session_idx",
+                    ),
+                    models.Index(
+                        fields=["start"], name="sensor_session_start_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="SessionState",
+            fields=[
+                (
+                    "sensor_id",
+                    models.IntegerField(primary_key=True, serialize=False),
+                ),
+                ("last_timestamp", models.DateTimeField(null=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="sensor.presencesession",
+                    ),
+                ),
+            ],
+        ),
+    ]
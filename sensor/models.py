@@ -1,13 +1,122 @@
 """Database models."""
 
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 
 class SensorRecord(models.Model):
-    sensor_id = models.IntegerField(db_index=True)
+    sensor_id = models.IntegerField()
     human_presence = models.BooleanField()
     dwell_time = models.FloatField()
-    timestamp = models.DateTimeField(db_index=True)
+    timestamp = models.DateTimeField()
+    # Pub/Sub message id, used to drop redeliveries.
+    message_id = models.CharField(max_length=100, null=True, blank=True)
 
     class Meta:
         ordering = ["-timestamp"]
+        constraints = [
+            # Partitioned tables require the partition key in every
+            # unique constraint; redeliveries repeat the timestamp too.
+            models.UniqueConstraint(
+                fields=["message_id", "timestamp"],
+                name="sensor_message_uniq",
+            )
+        ]
+        indexes = [
+            # One sensor over a time range, newest first.
+            models.Index(
+                fields=["sensor_id", "-timestamp", "-id"],
+                name="sensor_sensor_ts_idx",
+            ),
+            # Unfiltered pages in (timestamp, id) keyset order.
+            models.Index(fields=["timestamp", "id"], name="sensor_ts_id_idx"),
+            # Compact index for range scans over append-mostly data.
+            BrinIndex(fields=["timestamp"], name="sensor_ts_brin"),
+        ]
+
+
+class SensorRollup(models.Model):
+    """Per-sensor reading totals for one time bucket."""
+
+    sensor_id = models.IntegerField()
+    bucket = models.DateTimeField()
+    readings = models.IntegerField()
+    present = models.IntegerField()
+    dwell_time_sum = models.FloatField()
+    dwell_time_max = models.FloatField()
+
+    class Meta:
+        abstract = True
+        ordering = ["sensor_id", "bucket"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["sensor_id", "bucket"],
+                name="%(app_label)s_%(class)s_bucket_uniq",
+            )
+        ]
+
+
+class SensorMinuteRollup(SensorRollup):
+    pass
+
+
+class SensorHourRollup(SensorRollup):
+    pass
+
+
+class PresenceSession(models.Model):
+    """A visit: consecutive readings of one sensor detecting presence.
+
+    ``start`` and ``end`` are the timestamps of the first and last of
+    those readings.
+    """
+
+    sensor_id = models.IntegerField()
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    readings = models.IntegerField()
+    peak_dwell = models.FloatField()
+    # No reading without presence has ended the visit yet.
+    open = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["sensor_id", "start"]
+        indexes = [
+            models.Index(
+                fields=["sensor_id", "start"], name="sensor_session_idx"
+            ),
+            models.Index(fields=["start"], name="sensor_session_start_idx"),
+        ]
+
+
+class SessionState(models.Model):
+    """How far session maintenance has folded in one sensor's readings."""
+
+    sensor_id = models.IntegerField(primary_key=True)
+    last_timestamp = models.DateTimeField(null=True)
+    session = models.ForeignKey(
+        PresenceSession,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+
+
+class DeadLetter(models.Model):
+    """A payload the ingest pipeline gave up on, kept for inspection."""
+
+    INVALID = "invalid"
+    WRITE_FAILED = "write_failed"
+    REASONS = [
+        (INVALID, "Invalid payload"),
+        (WRITE_FAILED, "Write failed"),
+    ]
+
+    message_id = models.CharField(max_length=100, null=True, blank=True)
+    reason = models.CharField(max_length=20, choices=REASONS)
+    payload = models.TextField()
+    error = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
@@ -0,0 +1,137 @@
+"""Keyset pagination over the ``(timestamp, id)`` ordering."""
+
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+ORDERING = ("-timestamp", "-id")
+REVERSE_ORDERING = ("timestamp", "id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def model_position(record):
+    return record.timestamp, record.pk
+
+
+def encode_cursor(timestamp, pk, reverse=False):
+    """Build an opaque cursor pointing at a ``(timestamp, id)`` position.
+
+    Args:
+        timestamp (datetime): Timestamp of the boundary record.
+        pk (int): Primary key of the boundary record.
+        reverse (bool): Whether the cursor walks towards newer records.
+    Returns:
+        str: A URL-safe cursor string.
+    """
+    position = {"t": timestamp.isoformat(), "i": pk}
+    if reverse:
+        position["r"] = 1
+    return base64.urlsafe_b64encode(
+        json.dumps(position, separators=(",", ":")).encode("utf-8")
+    ).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into ``(timestamp, id, reverse)``.
+
+    Raises:
+        InvalidCursor: If the cursor was not produced by ``encode_cursor``.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = parse_datetime(position["t"])
+        pk = int(position["i"])
+    except (
+        binascii.Error,
+        KeyError,
+        TypeError,
+        UnicodeDecodeError,
+        ValueError,
+    ):
+        raise InvalidCursor("Invalid cursor")
+    if timestamp is None:
+        raise InvalidCursor("Invalid cursor")
+    return timestamp, pk, bool(position.get("r"))
+
+
+def seek(queryset, timestamp, pk, reverse=False):
+    """Order ``queryset`` and restrict it to rows past a position.
+
+    The boundary is expressed as a range condition on ``timestamp`` so
+    the database walks the index from the position instead of counting
+    or skipping the preceding rows; ``id`` only breaks ties.
+
+    Args:
+        queryset (QuerySet): The filtered ``SensorRecord`` queryset.
+        timestamp (datetime): Timestamp of the boundary record.
+        pk (int): Primary key of the boundary record.
+        reverse (bool): Walk towards newer records instead of older ones.
+    Returns:
+        QuerySet: The ordered queryset, excluding the boundary record.
+    """
+    if reverse:
+        return (
+            queryset.filter(timestamp__gte=timestamp)
+            .filter(Q(timestamp__gt=timestamp) | Q(id__gt=pk))
+            .order_by(*REVERSE_ORDERING)
+        )
+    return (
+        queryset.filter(timestamp__lte=timestamp)
+        .filter(Q(timestamp__lt=timestamp) | Q(id__lt=pk))
+        .order_by(*ORDERING)
+    )
+
+
+def paginate_by_cursor(queryset, cursor, page_size, position=model_position):
+    """Return one page of ``queryset`` after or before ``cursor``.
+
+    Pages are ordered newest first and located with ``seek``.
+
+    Args:
+        queryset (QuerySet): The filtered ``SensorRecord`` queryset.
+        cursor (str): A cursor from a previous page, or an empty string
+            for the first page.
+        page_size (int): The number of records per page.
+        position (callable): Returns ``(timestamp, id)`` for a row of
+            ``queryset``; the default reads model instances.
+    Returns:
+        tuple: ``(records, next_cursor, prev_cursor)``; a cursor is
+        ``None`` when there is nothing further in that direction.
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be a positive integer.")
+
+    def after(row):
+        return encode_cursor(*position(row))
+
+    def before(row):
+        return encode_cursor(*position(row), reverse=True)
+
+    if not cursor:
+        records = list(queryset.order_by(*ORDERING)[: page_size + 1])
+        has_more = len(records) > page_size
+        records = records[:page_size]
+        return records, after(records[-1]) if has_more else None, None
+
+    timestamp, pk, reverse = decode_cursor(cursor)
+    queryset = seek(queryset, timestamp, pk, reverse=reverse)
+    records = list(queryset[: page_size + 1])
+    has_more = len(records) > page_size
+    if reverse:
+        records = records[:page_size][::-1]
+        if not records:
+            return records, None, None
+        prev_cursor = before(records[0]) if has_more else None
+        return records, after(records[-1]), prev_cursor
+
+    records = records[:page_size]
+    if not records:
+        return records, None, None
+    next_cursor = after(records[-1]) if has_more else None
+    return records, next_cursor, before(records[0])
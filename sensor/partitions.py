@@ -0,0 +1,134 @@
+"""Monthly range partitions of the ``SensorRecord`` table.
+
+Partitions are named ``<table>_pYYYYMM`` and cover one UTC calendar
+month. Rows outside every monthly partition land in ``<table>_default``
+until a partition for their month is created.
+"""
+
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from . import response_cache
+from .models import SensorMinuteRollup, SensorRecord
+from .rollups import rebuild_rollups
+
+TABLE = SensorRecord._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def month_start(value):
+    """Return the UTC start of the month containing ``value``."""
+    value = value.astimezone(dt_timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    """Shift a month start by ``count`` months, in either direction."""
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def list_partitions():
+    """Return the start of every month that has a partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f"{TABLE}_p"
+    return sorted(
+        datetime.strptime(name[len(prefix):], "%Y%m").replace(
+            tzinfo=dt_timezone.utc
+        )
+        for name in names
+        if name.startswith(prefix)
+    )
+
+
+def create_partition(month):
+    """Create and attach the partition for ``month``.
+
+    Rows for that month that already sit in the default partition are
+    moved into the new partition first; Postgres refuses to attach a
+    range that the default partition still holds rows for.
+    """
+    name = partition_name(month)
+    upper = add_months(month, 1)
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} "
+            f"(LIKE {quote(TABLE)} INCLUDING DEFAULTS)"
+        )
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {quote(DEFAULT_PARTITION)}
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING *
+            )
+            INSERT INTO {quote(name)} SELECT * FROM moved
+            """,
+            [month, upper],
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [month, upper],
+        )
+
+
+def expire_partition(month):
+    """Downsample a month into the hourly rollups, then drop its rows.
+
+    The partition holds every raw row of the month, so the hourly
+    rollups are rebuilt from it to guarantee they survive the drop; the
+    minute rollups are discarded along with the raw partition.
+    """
+    upper = add_months(month, 1)
+    rebuild_rollups(
+        month, upper - timedelta(microseconds=1), kinds=["hour"]
+    )
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        SensorMinuteRollup.objects.filter(
+            bucket__gte=month, bucket__lt=upper
+        ).delete()
+        cursor.execute(f"DROP TABLE {quote(partition_name(month))}")
+    response_cache.invalidate_history()
+
+
+def expire_default_rows(cutoff):
+    """Delete rows older than ``cutoff`` from the default partition.
+
+    These are late readings for months whose partition was already
+    dropped, or readings that predate the partitioning. Their hourly
+    rollups were maintained at ingest time and are kept; rebuilding
+    them here would discard the aggregates of the dropped partition.
+
+    Returns:
+        int: The number of raw rows deleted.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        SensorMinuteRollup.objects.filter(bucket__lt=cutoff).delete()
+        cursor.execute(
+            f'DELETE FROM {quote(DEFAULT_PARTITION)} WHERE "timestamp" < %s',
+            [cutoff],
+        )
+        deleted = cursor.rowcount
+    response_cache.invalidate_history()
+    return deleted
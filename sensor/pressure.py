@@ -0,0 +1,256 @@
+"""Adaptive backpressure for database writes.
+
+A ``PressureGate`` bounds the writes in flight in one process and
+adapts that bound to the database's latency: every write slower than
+the target (or failing with a transient database error) halves the
+limit, at most once per write latency, and every fast one raises it
+again by one over the limit, up to its maximum.
+
+The push endpoints refuse a write that does not fit with
+``Overloaded``, answered as 429 while the limit is at its maximum and
+as 503 once the database's latency lowered it, both with a
+``Retry-After`` header, so that Pub/Sub backs off instead of piling
+retries on a slow database. The subscriber instead blocks its
+streaming pull callback until its messages fit, so Pub/Sub flow
+control stops delivering.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+
+from . import metrics
+
+# Errors worth retrying: the database is unreachable or restarting.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+# Weight of the newest latency sample in the moving average.
+_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """A write was refused because the gate is full.
+
+    Attributes:
+        status (int): 503 when the database is slow, else 429.
+        retry_after (int): Seconds the client should wait.
+    """
+
+    def __init__(self, gate):
+        self.status = 503 if gate.degraded else 429
+        self.retry_after = gate.retry_after()
+        reason = "slow" if gate.degraded else "busy"
+        super().__init__(
+            f"The database is {reason}: {gate.in_flight} writes in "
+            f"flight. Retry in {self.retry_after}s."
+        )
+
+
+class PressureGate:
+    """Bound concurrent writes, adapting the bound to their latency.
+
+    Args:
+        name (str): Label of the gate in metrics and the state report.
+        max_in_flight (int): Upper bound of the limit.
+        target_latency (float): Seconds a write may take before the
+            limit is lowered.
+        min_limit (int): Lower bound of the limit.
+    """
+
+    def __init__(self, name, max_in_flight, target_latency, min_limit=1):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.target_latency = target_latency
+        self.min_limit = min(min_limit, max_in_flight)
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self.latency = 0.0
+        self.shed = 0
+        self._decreased = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def degraded(self):
+        """Whether latency lowered the limit below its maximum."""
+        return self.limit < self.max_in_flight
+
+    def _fits(self, count):
+        # An empty gate admits anything, so a batch larger than the
+        # limit is not blocked forever.
+        return not self.in_flight or self.in_flight + count <= self.limit
+
+    def try_acquire(self, count=1):
+        """Take ``count`` slots if they fit, without waiting."""
+        with self._condition:
+            if not self._fits(count):
+                self.shed += count
+                return False
+            self.in_flight += count
+            return True
+
+    def acquire(self, count=1, timeout=None):
+        """Wait up to ``timeout`` seconds for ``count`` slots.
+
+        Returns:
+            bool: Whether the slots were taken.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._fits(count), timeout
+            ):
+                return False
+            self.in_flight += count
+            return True
+
+    def release(self, count=1, latency=None, failed=False):
+        """Give back ``count`` slots and adapt the limit.
+
+        Args:
+            count (int): Slots taken for the write.
+            latency (float, optional): Seconds the write took. Without
+                it, and unless ``failed``, the limit is left as is.
+            failed (bool): The write failed with a transient error.
+        """
+        with self._condition:
+            self.in_flight -= count
+            if failed:
+                latency = max(latency or 0.0, 2 * self.target_latency)
+            if latency is not None:
+                self._adapt(count, latency)
+            self._condition.notify_all()
+
+    def _adapt(self, count, latency):
+        self.latency += _SMOOTHING * (latency - self.latency)
+        now = time.monotonic()
+        if latency > self.target_latency:
+            # Writes that were already in flight report the same
+            # slowdown; only react to it once.
+            if now - self._decreased >= latency:
+                self.limit = max(self.limit / 2, self.min_limit)
+                self._decreased = now
+        else:
+            self.limit = min(
+                self.limit + count / self.limit, self.max_in_flight
+            )
+
+    @contextmanager
+    def write(self):
+        """Run a write in one slot, or raise ``Overloaded``."""
+        if not self.try_acquire():
+            raise Overloaded(self)
+        started = time.perf_counter()
+        try:
+            yield
+        except TRANSIENT_ERRORS:
+            self.release(failed=True)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.release(latency=time.perf_counter() - started)
+
+    def retry_after(self):
+        """Seconds a refused client should wait, from recent latency."""
+        wait = self.latency * max(self.in_flight, 1) / max(self.limit, 1)
+        return min(max(math.ceil(wait), 1), settings.SENSOR_RETRY_AFTER_MAX)
+
+    def state(self):
+        with self._condition:
+            if self.in_flight >= self.limit:
+                level = "shedding"
+            elif self.degraded:
+                level = "degraded"
+            else:
+                level = "ok"
+            return {
+                "state": level,
+                "in_flight": self.in_flight,
+                "limit": round(self.limit, 2),
+                "max_in_flight": self.max_in_flight,
+                "latency_ms": round(self.latency * 1000, 3),
+                "target_latency_ms": round(self.target_latency * 1000, 3),
+                "shed": self.shed,
+            }
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def _register(gate):
+    labels = {"gate": gate.name}
+    metrics.WRITE_LIMIT.labels(**labels).set_function(lambda: gate.limit)
+    metrics.WRITES_IN_FLIGHT.labels(**labels).set_function(
+        lambda: gate.in_flight
+    )
+    metrics.WRITES_SHED.labels(**labels).set_function(lambda: gate.shed)
+    return gate
+
+
+def gate(name):
+    """Return the process's gate of a push endpoint, creating it.
+
+    ``http`` guards ``SensorRecordView`` and ``SensorRecordBatchView``;
+    ``async`` guards ``SensorRecordAsyncView``, whose writes wait in a
+    queue rather than hold a thread.
+    """
+    with _gates_lock:
+        if name not in _gates:
+            if name == "async":
+                max_in_flight = settings.SENSOR_ASYNC_QUEUE_SIZE
+            else:
+                max_in_flight = settings.SENSOR_MAX_IN_FLIGHT_WRITES
+            _gates[name] = _register(
+                PressureGate(
+                    name,
+                    max_in_flight,
+                    settings.SENSOR_WRITE_LATENCY_TARGET,
+                )
+            )
+        return _gates[name]
+
+
+def subscriber_gate(max_messages, min_messages):
+    """Build the gate throttling a subscriber's outstanding messages.
+
+    Args:
+        max_messages (int): The Pub/Sub flow control limit.
+        min_messages (int): The least it is throttled to, typically
+            one batch.
+    """
+    return _register(
+        PressureGate(
+            "subscriber",
+            max_messages,
+            settings.SENSOR_BATCH_LATENCY_TARGET,
+            min_limit=min_messages,
+        )
+    )
+
+
+LEVELS = ("ok", "degraded", "shedding")
+
+
+def state():
+    """Report the pressure on the gates of this process.
+
+    Returns:
+        dict: ``state``, the worst level of any gate, and ``gates``, the
+        state of each gate by name.
+    """
+    gate("http")
+    gate("async")
+    with _gates_lock:
+        gates = {name: _gates[name].state() for name in sorted(_gates)}
+    worst = max(gates.values(), key=lambda g: LEVELS.index(g["state"]))
+    return {"state": worst["state"], "gates": gates}
+
+
+def reset():
+    """Forget every gate, e.g. after changing their settings."""
+    with _gates_lock:
+        _gates.clear()
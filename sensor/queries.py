@@ -0,0 +1,282 @@
+"""Query shapes shared by the sensor read endpoints."""
+
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import Trunc
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .downsample import METHODS, downsample
+from .models import (
+    PresenceSession,
+    SensorHourRollup,
+    SensorMinuteRollup,
+    SensorRecord,
+)
+from .pagination import ORDERING, seek
+
+
+def filter_records(params, queryset=None):
+    """Apply the ``sensor_id``/``start_time``/``end_time`` filters.
+
+    Args:
+        params (django.http.QueryDict): The request query parameters.
+        queryset (QuerySet, optional): The queryset to narrow down.
+            Defaults to every ``SensorRecord``.
+    Returns:
+        QuerySet: The filtered queryset.
+    """
+    if queryset is None:
+        queryset = SensorRecord.objects.all()
+    sensor_id = params.get("sensor_id")
+    start_time = params.get("start_time")
+    end_time = params.get("end_time")
+
+    if sensor_id:
+        queryset = queryset.filter(sensor_id=sensor_id)
+    if start_time and end_time:
+        queryset = queryset.filter(timestamp__range=[start_time, end_time])
+    return queryset
+
+
+BUCKETS = ("minute", "hour", "day")
+SOURCES = ("raw", "rollup")
+
+
+def parse_sensor_ids(params):
+    """Read a sensor set from repeated or comma-separated ``sensor_id``.
+
+    Raises:
+        ValueError: If a sensor id is not an integer.
+    """
+    sensor_ids = []
+    for value in params.getlist("sensor_id"):
+        for part in value.split(","):
+            if part.strip():
+                try:
+                    sensor_ids.append(int(part))
+                except ValueError:
+                    raise ValueError(f"Invalid sensor_id: {part!r}")
+    return sensor_ids
+
+
+def aggregate_records(params):
+    """Aggregate readings per sensor and time bucket in the database.
+
+    Query parameters:
+        - bucket (optional): ``minute``, ``hour`` (default) or ``day``;
+        - source (optional): ``raw`` (default) scans ``SensorRecord``,
+          ``rollup`` reads the pre-aggregated rollup tables;
+        - sensor_id (optional): One or more sensor IDs;
+        - start_time / end_time (optional): Bounds on the timestamp, or
+          on the bucket start when reading rollups.
+    Args:
+        params (django.http.QueryDict): The request query parameters.
+    Returns:
+        list[dict]: One row per sensor and bucket, ordered by both.
+    Raises:
+        ValueError: If a parameter is invalid.
+    """
+    bucket = params.get("bucket", "hour")
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}.")
+    source = params.get("source", "raw")
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}.")
+
+    if source == "rollup":
+        model = SensorMinuteRollup if bucket == "minute" else SensorHourRollup
+        time_field = "bucket"
+        aggregates = {
+            "total": Sum("readings"),
+            "total_present": Sum("present"),
+            "avg_dwell": Sum("dwell_time_sum") / Sum("readings"),
+            "max_dwell": Max("dwell_time_max"),
+        }
+    else:
+        model = SensorRecord
+        time_field = "timestamp"
+        aggregates = {
+            "total": Count("id"),
+            "total_present": Count("id", filter=Q(human_presence=True)),
+            "avg_dwell": Avg("dwell_time"),
+            "max_dwell": Max("dwell_time"),
+        }
+
+    queryset = model.objects.all()
+    sensor_ids = parse_sensor_ids(params)
+    if sensor_ids:
+        queryset = queryset.filter(sensor_id__in=sensor_ids)
+    if params.get("start_time"):
+        queryset = queryset.filter(
+            **{f"{time_field}__gte": params["start_time"]}
+        )
+    if params.get("end_time"):
+        queryset = queryset.filter(
+            **{f"{time_field}__lte": params["end_time"]}
+        )
+
+    rows = (
+        queryset.annotate(
+            period=Trunc(time_field, bucket, tzinfo=dt_timezone.utc)
+        )
+        .values("sensor_id", "period")
+        .annotate(**aggregates)
+        .order_by("sensor_id", "period")
+    )
+    return [
+        {
+            "sensor_id": row["sensor_id"],
+            "bucket": row["period"],
+            "readings": row["total"],
+            "presence_ratio": row["total_present"] / row["total"],
+            "avg_dwell_time": row["avg_dwell"],
+            "max_dwell_time": row["max_dwell"],
+        }
+        for row in rows
+    ]
+
+
+_BOOLEANS = {"true": True, "1": True, "false": False, "0": False}
+
+
+def filter_sessions(params):
+    """Select presence sessions.
+
+    Query parameters:
+        - sensor_id (optional): One or more sensor IDs;
+        - start_time / end_time (optional): Keep sessions overlapping
+          this range;
+        - open (optional): ``true`` for visits still in progress,
+          ``false`` for finished ones.
+    Args:
+        params (django.http.QueryDict): The request query parameters.
+    Returns:
+        QuerySet: The matching ``PresenceSession`` rows, oldest first.
+    Raises:
+        ValueError: If a parameter is invalid.
+    """
+    queryset = PresenceSession.objects.all()
+    sensor_ids = parse_sensor_ids(params)
+    if sensor_ids:
+        queryset = queryset.filter(sensor_id__in=sensor_ids)
+    if params.get("start_time"):
+        queryset = queryset.filter(end__gte=params["start_time"])
+    if params.get("end_time"):
+        queryset = queryset.filter(start__lte=params["end_time"])
+    if params.get("open"):
+        value = params["open"].lower()
+        if value not in _BOOLEANS:
+            raise ValueError("open must be true or false.")
+        queryset = queryset.filter(open=_BOOLEANS[value])
+    return queryset.order_by("start", "sensor_id")
+
+
+def _required_time(params, name):
+    value = params.get(name)
+    if not value:
+        raise ValueError(f"{name} is required.")
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name}: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def downsample_series(params):
+    """Downsample one sensor's readings over a time range for charting.
+
+    The readings are streamed from a server-side cursor, so memory and
+    response size stay bounded by ``points`` whatever the range holds.
+
+    Query parameters:
+        - sensor_id: The sensor;
+        - start_time / end_time: The range;
+        - points (optional): Target points per series, up to
+          ``SENSOR_SERIES_MAX_POINTS``. Defaults to 1000;
+        - method (optional): ``lttb`` (default) or ``minmax``, for
+          ``dwell_time``.
+    Args:
+        params (django.http.QueryDict): The request query parameters.
+    Returns:
+        dict: The parameters used and the result of ``downsample``.
+    Raises:
+        ValueError: If a parameter is missing or invalid.
+    """
+    sensor_ids = parse_sensor_ids(params)
+    if len(sensor_ids) != 1:
+        raise ValueError("sensor_id must name exactly one sensor.")
+    start = _required_time(params, "start_time")
+    end = _required_time(params, "end_time")
+    if end <= start:
+        raise ValueError("end_time must be after start_time.")
+    try:
+        points = int(params.get("points", 1000))
+    except ValueError:
+        raise ValueError(f"Invalid points: {params['points']!r}")
+    if not 3 <= points <= settings.SENSOR_SERIES_MAX_POINTS:
+        raise ValueError(
+            "points must be between 3 and "
+            f"{settings.SENSOR_SERIES_MAX_POINTS}."
+        )
+    method = params.get("method", "lttb")
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+
+    rows = (
+        SensorRecord.objects.filter(
+            sensor_id=sensor_ids[0], timestamp__range=[start, end]
+        )
+        .order_by("timestamp", "id")
+        .values_list("timestamp", "dwell_time", "human_presence")
+    )
+    return {
+        "sensor_id": sensor_ids[0],
+        "start_time": start,
+        "end_time": end,
+        "method": method,
+        "points": points,
+        **downsample(
+            rows.iterator(settings.SENSOR_EXPORT_CHUNK_SIZE),
+            start,
+            end,
+            points,
+            method,
+        ),
+    }
+
+
+def query_shapes():
+    """Representative queries issued by ``SensorRecordView.get``.
+
+    Used by ``manage.py check_query_plans`` to verify that each shape is
+    served by an index.
+
+    Returns:
+        dict: Query shape name mapped to an unevaluated queryset.
+    """
+    end = timezone.now()
+    start = end - timedelta(days=1)
+    sensor = QueryDict(mutable=True)
+    sensor["sensor_id"] = "1"
+    sensor_range = sensor.copy()
+    sensor_range["start_time"] = start.isoformat()
+    sensor_range["end_time"] = end.isoformat()
+    time_range = sensor_range.copy()
+    del time_range["sensor_id"]
+
+    return {
+        "latest": filter_records(QueryDict()).order_by(*ORDERING)[:21],
+        "sensor_latest": filter_records(sensor).order_by(*ORDERING)[:21],
+        "sensor_range": filter_records(sensor_range).order_by(*ORDERING)[
+            :21
+        ],
+        "time_range": filter_records(time_range).order_by(*ORDERING)[:21],
+        "cursor": seek(filter_records(QueryDict()), end, 1)[:21],
+        "sensor_cursor": seek(filter_records(sensor), end, 1)[:21],
+    }
@@ -0,0 +1,151 @@
+"""Renderers for the sensor export and read formats."""
+
+import csv
+import io
+import json
+
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+RECORD_FIELDS = (
+    "id",
+    "sensor_id",
+    "human_presence",
+    "dwell_time",
+    "timestamp",
+)
+
+
+def format_timestamp(value):
+    """Format a datetime the way ``SensorRecordSerializer`` does."""
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def rows_to_records(rows):
+    """Lay out ``values_list(*RECORD_FIELDS)`` rows as serializer dicts."""
+    return [
+        {
+            "id": row_id,
+            "sensor_id": sensor_id,
+            "human_presence": presence,
+            "dwell_time": dwell_time,
+            "timestamp": format_timestamp(timestamp),
+        }
+        for row_id, sensor_id, presence, dwell_time, timestamp in rows
+    ]
+
+
+def rows_to_columns(rows):
+    """Lay out ``values_list(*RECORD_FIELDS)`` rows as one list per field."""
+    columns = {field: [] for field in RECORD_FIELDS}
+    if rows:
+        for field, values in zip(RECORD_FIELDS, zip(*rows)):
+            columns[field] = list(values)
+        columns["timestamp"] = [
+            format_timestamp(value) for value in columns["timestamp"]
+        ]
+    return columns
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON with record lists laid out column by column.
+
+    Views check ``columnar`` on the accepted renderer and pass
+    ``rows_to_columns`` output instead of a list of records.
+    """
+
+    media_type = "application/vnd.sensor.columnar+json"
+    format = "columnar"
+    columnar = True
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Columnar layout encoded as MessagePack."""
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=str)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON, one object per line."""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+    @staticmethod
+    def stream(rows, chunk_size):
+        """Yield ``values_list`` rows as NDJSON, ``chunk_size`` at a time."""
+        lines = []
+        for row_id, sensor_id, presence, dwell_time, timestamp in rows:
+            lines.append(
+                f'{{"id":{row_id},"sensor_id":{sensor_id},'
+                f'"human_presence":{"true" if presence else "false"},'
+                f'"dwell_time":{json.dumps(dwell_time)},'
+                f'"timestamp":"{format_timestamp(timestamp)}"}}\n'
+            )
+            if len(lines) >= chunk_size:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+
+class CSVRenderer(BaseRenderer):
+    """Comma-separated values with a header row."""
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
+
+    @staticmethod
+    def stream(rows, chunk_size):
+        """Yield ``values_list`` rows as CSV, ``chunk_size`` at a time."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(RECORD_FIELDS)
+        count = 0
+        for row_id, sensor_id, presence, dwell_time, timestamp in rows:
+            writer.writerow(
+                (
+                    row_id,
+                    sensor_id,
+                    "true" if presence else "false",
+                    repr(dwell_time),
+                    format_timestamp(timestamp),
+                )
+            )
+            count += 1
+            if count >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                count = 0
+        yield buffer.getvalue()
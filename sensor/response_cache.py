@@ -0,0 +1,266 @@
+"""Response cache for the range-query read endpoints.
+
+Rendered ``GET`` responses are cached under a key built from the
+request path, the negotiated media type, the normalized query
+parameters and a set of generation counters. Writes never delete
+entries; they bump the counters, so stale entries simply stop being
+addressed and age out of the cache.
+
+The ingest high-water mark (the newest committed reading) splits
+requests in two:
+
+- closed ranges that end before the watermark are keyed by the
+  ``history`` generation only and kept for
+  ``SENSOR_RESPONSE_CACHE_HISTORY_TIMEOUT`` seconds. That generation is
+  bumped when a late reading lands below the watermark, or when past
+  data is rewritten by the maintenance commands;
+- every other request also carries the generation of each sensor it
+  filters on, or of ``all`` sensors, and is invalidated by the next
+  write for one of them.
+
+Counters are bumped by whichever process writes, so the cache must be
+shared by every process; ``core.serving.shared_cache`` refuses to start
+several on a per-process one.
+"""
+
+import functools
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from rest_framework import status
+
+from . import metrics
+from .models import SensorRecord
+from .queries import parse_sensor_ids
+
+WATERMARK_KEY = "sensor:response:watermark"
+GENERATION_KEY = "sensor:response:gen:{}"
+ENTRY_KEY = "sensor:response:{}"
+HISTORY = "history"
+ALL_SENSORS = "all"
+
+_TIME_PARAMS = ("start_time", "end_time")
+
+
+def _cache():
+    return caches[settings.SENSOR_RESPONSE_CACHE]
+
+
+def _parse_time(value):
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _load_watermark():
+    return SensorRecord.objects.aggregate(last=Max("timestamp"))["last"]
+
+
+def watermark():
+    """Return the timestamp of the newest committed reading, or ``None``."""
+    cache = _cache()
+    value = cache.get(WATERMARK_KEY)
+    if value is None:
+        value = _load_watermark()
+        if value is not None:
+            cache.add(WATERMARK_KEY, value, None)
+    return value
+
+
+def _generations(cache, names):
+    """Read generation counters, seeding the missing ones.
+
+    Counters start at the current time in nanoseconds rather than zero,
+    so a counter that was evicted never comes back with a value an
+    older entry was stored under.
+    """
+    keys = [GENERATION_KEY.format(name) for name in names]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(cache, names):
+    for name in names:
+        key = GENERATION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate(records):
+    """Invalidate the cached responses that ``records`` may change.
+
+    Called once the transaction that wrote ``records`` has committed.
+
+    Args:
+        records (Iterable[SensorRecord]): The records just written.
+    """
+    records = list(records)
+    if not records:
+        return
+    cache = _cache()
+    current = watermark()
+    names = {ALL_SENSORS}
+    names.update(record.sensor_id for record in records)
+    newest = max(record.timestamp for record in records)
+    if current is not None and min(
+        record.timestamp for record in records
+    ) < current:
+        names.add(HISTORY)
+    _bump(cache, sorted(names, key=str))
+    if current is None or newest > current:
+        cache.set(WATERMARK_KEY, newest, None)
+
+
+def invalidate_history():
+    """Invalidate every cached response, including closed ranges.
+
+    Used when past readings or rollups are rewritten in place.
+    """
+    cache = _cache()
+    cache.delete(WATERMARK_KEY)
+    _bump(cache, [HISTORY])
+
+
+def _range_end(params):
+    """Return the newest timestamp a closed range can read, or ``None``.
+
+    A range is closed when both bounds are given. Rollup buckets are
+    filtered on their start, so they can hold readings up to an hour
+    past ``end_time``.
+    """
+    if not (params.get("start_time") and params.get("end_time")):
+        return None
+    end = _parse_time(params["end_time"])
+    if end is not None and params.get("source") == "rollup":
+        end += timedelta(hours=1)
+    return end
+
+
+def _normalize(params):
+    items = []
+    for name in sorted(params):
+        values = params.getlist(name)
+        if name in _TIME_PARAMS:
+            values = [
+                parsed.isoformat() if parsed is not None else value
+                for value, parsed in (
+                    (value, _parse_time(value)) for value in values
+                )
+            ]
+        items.append((name, values))
+    return items
+
+
+def response_key(request):
+    """Build the cache key and timeout of a read request.
+
+    Args:
+        request (rest_framework.request.Request): The HTTP request object,
+            after content negotiation.
+    Returns:
+        tuple: ``(key, timeout)``.
+    Raises:
+        ValueError: If the sensor filter is malformed.
+    """
+    params = request.GET
+    sensor_ids = sorted(set(parse_sensor_ids(params)))
+    cache = _cache()
+    end = _range_end(params)
+    current = watermark() if end is not None else None
+
+    if current is not None and end < current:
+        names = [HISTORY]
+        timeout = settings.SENSOR_RESPONSE_CACHE_HISTORY_TIMEOUT
+    else:
+        names = [HISTORY, *(sensor_ids or [ALL_SENSORS])]
+        timeout = settings.SENSOR_RESPONSE_CACHE_TIMEOUT
+    versions = _generations(cache, names)
+
+    digest = hashlib.sha1(
+        repr(
+            (
+                request.path,
+                request.accepted_media_type,
+                _normalize(params),
+                list(zip(names, versions)),
+            )
+        ).encode("utf-8")
+    ).hexdigest()
+    return ENTRY_KEY.format(digest), timeout
+
+
+def _etag(content):
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def _not_modified(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+def cache_response(method):
+    """Cache the successful responses of an ``APIView.get`` method.
+
+    Responses carry an ``ETag``; a request whose ``If-None-Match``
+    matches it is answered with ``304 Not Modified``.
+    """
+
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        try:
+            key, timeout = response_key(request)
+        except ValueError:
+            return method(view, request, *args, **kwargs)
+
+        cache = _cache()
+        with metrics.CACHE.time():
+            entry = cache.get(key)
+        if entry is None:
+            metrics.CACHE_MISS.inc()
+            with metrics.QUERY.time():
+                response = method(view, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            with metrics.RENDER.time():
+                response.accepted_renderer = request.accepted_renderer
+                response.accepted_media_type = request.accepted_media_type
+                response.renderer_context = view.get_renderer_context()
+                response.render()
+            entry = (
+                _etag(response.content),
+                response["Content-Type"],
+                response.content,
+            )
+            cache.set(key, entry, timeout)
+        else:
+            metrics.CACHE_HIT.inc()
+            response = HttpResponse(entry[2], content_type=entry[1])
+
+        etag = entry[0]
+        if _not_modified(request, etag):
+            response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    return wrapper
@@ -0,0 +1,171 @@
+"""Incrementally maintained per-minute and per-hour reading rollups."""
+
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from . import response_cache
+from .models import SensorHourRollup, SensorMinuteRollup, SensorRecord
+
+ROLLUPS = {
+    "minute": SensorMinuteRollup,
+    "hour": SensorHourRollup,
+}
+
+_COLUMNS = (
+    "sensor_id",
+    "bucket",
+    "readings",
+    "present",
+    "dwell_time_sum",
+    "dwell_time_max",
+)
+
+_UPSERT = """
+    INSERT INTO {table} AS t ({columns}) VALUES {values}
+    ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+        readings = t.readings + EXCLUDED.readings,
+        present = t.present + EXCLUDED.present,
+        dwell_time_sum = t.dwell_time_sum + EXCLUDED.dwell_time_sum,
+        dwell_time_max = GREATEST(t.dwell_time_max, EXCLUDED.dwell_time_max)
+"""
+
+_REBUILD = """
+    INSERT INTO {table} ({columns})
+    SELECT
+        sensor_id,
+        date_trunc(%s, "timestamp" AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+        COUNT(*),
+        COUNT(*) FILTER (WHERE human_presence),
+        SUM(dwell_time),
+        MAX(dwell_time)
+    FROM {source}
+    WHERE "timestamp" >= %s AND "timestamp" < %s
+    GROUP BY 1, 2
+    ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+        readings = EXCLUDED.readings,
+        present = EXCLUDED.present,
+        dwell_time_sum = EXCLUDED.dwell_time_sum,
+        dwell_time_max = EXCLUDED.dwell_time_max
+"""
+
+
+def truncate(timestamp, kind):
+    """Floor an aware datetime to the start of its UTC bucket."""
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if kind == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def apply_rollups(records):
+    """Fold newly written records into every rollup table.
+
+    Readings are first summed per ``(sensor_id, bucket)`` in memory, then
+    upserted with one statement per table. Must run in the transaction
+    that inserted ``records`` so the rollups never drift from the raw
+    table.
+
+    Args:
+        records (Iterable[SensorRecord]): Records that were just inserted.
+    """
+    records = list(records)
+    if not records:
+        return
+    for kind, model in ROLLUPS.items():
+        deltas = {}
+        for record in records:
+            key = (record.sensor_id, truncate(record.timestamp, kind))
+            delta = deltas.get(key)
+            if delta is None:
+                deltas[key] = [
+                    1,
+                    int(record.human_presence),
+                    record.dwell_time,
+                    record.dwell_time,
+                ]
+            else:
+                delta[0] += 1
+                delta[1] += record.human_presence
+                delta[2] += record.dwell_time
+                delta[3] = max(delta[3], record.dwell_time)
+
+        # A stable key order keeps concurrent upserts from deadlocking.
+        params = []
+        for key in sorted(deltas):
+            params.extend(key)
+            params.extend(deltas[key])
+        placeholder = "(" + ", ".join(["%s"] * len(_COLUMNS)) + ")"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _UPSERT.format(
+                    table=model._meta.db_table,
+                    columns=", ".join(_COLUMNS),
+                    values=", ".join([placeholder] * len(deltas)),
+                ),
+                params,
+            )
+
+
+def rebuild_rollups(
+    start=None, end=None, window=timedelta(days=1), kinds=None
+):
+    """Recompute the rollup tables from raw ``SensorRecord`` rows.
+
+    The range is widened to whole hours and processed in ``window``
+    sized transactions, each replacing the rollup rows it covers. A
+    bucket that live ingest upserted again since the DELETE is
+    overwritten rather than failing the rebuild on its unique key.
+
+    Args:
+        start (datetime, optional): Defaults to the oldest reading.
+        end (datetime, optional): Defaults to the newest reading.
+        window (timedelta): Time span rebuilt per transaction.
+        kinds (Iterable[str], optional): The ``ROLLUPS`` to rebuild.
+            Defaults to all of them.
+    Returns:
+        int: The number of windows rebuilt.
+    """
+    if start is None or end is None:
+        bounds = SensorRecord.objects.aggregate(
+            first=Min("timestamp"), last=Max("timestamp")
+        )
+        if bounds["first"] is None:
+            return 0
+        start = start or bounds["first"]
+        end = end or bounds["last"]
+    start = truncate(start, "hour")
+    end = truncate(end, "hour") + timedelta(hours=1)
+
+    rollups = {kind: ROLLUPS[kind] for kind in (kinds or ROLLUPS)}
+    windows = 0
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for kind, model in rollups.items():
+                model.objects.filter(
+                    bucket__gte=window_start, bucket__lt=window_end
+                ).delete()
+                cursor.execute(
+                    _REBUILD.format(
+                        table=model._meta.db_table,
+                        columns=", ".join(_COLUMNS),
+                        source=SensorRecord._meta.db_table,
+                    ),
+                    [kind, window_start, window_end],
+                )
+        window_start = window_end
+        windows += 1
+    response_cache.invalidate_history()
+    return windows
+
+
+def parse_bound(value):
+    """Parse an ISO 8601 command-line bound into an aware datetime."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
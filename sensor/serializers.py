@@ -2,10 +2,30 @@
 
 from rest_framework import serializers
 
-from .models import SensorRecord
+from .models import PresenceSession, SensorRecord
 
 
 class SensorRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = SensorRecord
-        fields = "__all__"
+        exclude = ["message_id"]
+
+
+class PresenceSessionSerializer(serializers.ModelSerializer):
+    duration = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PresenceSession
+        fields = [
+            "sensor_id",
+            "start",
+            "end",
+            "duration",
+            "readings",
+            "peak_dwell",
+            "open",
+        ]
+
+    def get_duration(self, session):
+        """Seconds from the first to the last reading of the session."""
+        return (session.end - session.start).total_seconds()
@@ -0,0 +1,253 @@
+"""Presence sessions derived incrementally from sensor readings.
+
+A session is a maximal run of a sensor's readings, in timestamp order,
+that all detected presence. ``SessionState`` keeps, per sensor, the
+timestamp of the newest reading folded in and the session it left
+open, so new readings extend or close that session without reading
+the raw table.
+
+A reading older than the newest one folded in can split, merge or
+extend the sessions around it. Those sessions are then replayed from
+raw readings, starting at the last session that began at or before the
+late reading: the sessions before it ended with an absent reading that
+the late one cannot change. The replay stops at the first later
+timestamp whose last reading is absent, which closes every session
+before it; the sessions after it are left as they are.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import PresenceSession, SensorRecord, SessionState
+
+_UPDATE_FIELDS = ["end", "readings", "peak_dwell", "open"]
+
+# Walks the readings after %s in order and stops at the first timestamp
+# whose last reading, by id, detected no presence.
+_CLOSED_AFTER = """
+    SELECT "timestamp" FROM (
+        SELECT DISTINCT ON ("timestamp") "timestamp", human_presence
+        FROM {table}
+        WHERE sensor_id = %s AND "timestamp" > %s
+        ORDER BY "timestamp", id DESC
+    ) AS last
+    WHERE NOT human_presence
+    LIMIT 1
+"""
+
+
+class SessionBuilder:
+    """Fold the time-ordered readings of one sensor into sessions.
+
+    Args:
+        sensor_id (int): The sensor the readings belong to.
+        current (PresenceSession, optional): The sensor's open session,
+            continued by the first present reading.
+    """
+
+    def __init__(self, sensor_id, current=None):
+        self.sensor_id = sensor_id
+        self.current = current
+        self.last_timestamp = None
+        self.sessions = []
+
+    def add(self, timestamp, present, dwell_time):
+        self.last_timestamp = timestamp
+        if present:
+            if self.current is None:
+                self.current = PresenceSession(
+                    sensor_id=self.sensor_id,
+                    start=timestamp,
+                    end=timestamp,
+                    readings=0,
+                    peak_dwell=dwell_time,
+                )
+            if not self.sessions or self.sessions[-1] is not self.current:
+                self.sessions.append(self.current)
+            self.current.end = timestamp
+            self.current.readings += 1
+            self.current.peak_dwell = max(self.current.peak_dwell, dwell_time)
+        elif self.current is not None:
+            self.current.open = False
+            if not self.sessions or self.sessions[-1] is not self.current:
+                self.sessions.append(self.current)
+            self.current = None
+
+    def save(self, keep_current=False):
+        """Write the sessions touched so far.
+
+        Args:
+            keep_current (bool): Keep the open session in memory for
+                further readings instead of writing it now.
+        """
+        sessions = self.sessions
+        self.sessions = []
+        if keep_current and sessions and sessions[-1] is self.current:
+            self.sessions = [sessions.pop()]
+        save_sessions(sessions)
+
+
+def save_sessions(sessions):
+    """Insert the new and update the existing ``sessions``."""
+    PresenceSession.objects.bulk_create(
+        [session for session in sessions if session.pk is None]
+    )
+    PresenceSession.objects.bulk_update(
+        [session for session in sessions if session.pk is not None],
+        _UPDATE_FIELDS,
+    )
+
+
+def _lock_states(sensor_ids):
+    """Return the locked ``SessionState`` of every sensor, by sensor id."""
+    sensor_ids = sorted(sensor_ids)
+    SessionState.objects.bulk_create(
+        [SessionState(sensor_id=sensor_id) for sensor_id in sensor_ids],
+        ignore_conflicts=True,
+    )
+    return {
+        state.sensor_id: state
+        for state in SessionState.objects.select_for_update(of=("self",))
+        .select_related("session")
+        .filter(sensor_id__in=sensor_ids)
+        .order_by("sensor_id")
+    }
+
+
+def _closed_after(sensor_id, timestamp):
+    """Return the first timestamp after ``timestamp`` closing a session.
+
+    Every session that starts at or before it has ended by its last
+    reading, so readings up to ``timestamp`` cannot change the sessions
+    that start after it.
+
+    Returns:
+        datetime: Or ``None`` if no reading after ``timestamp`` closes
+        one.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _CLOSED_AFTER.format(table=SensorRecord._meta.db_table),
+            [sensor_id, timestamp],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def replay(state, since=None, until=None, chunk_size=None):
+    """Rebuild a sensor's sessions from its raw readings.
+
+    Must run in a transaction holding the lock on ``state``.
+
+    Args:
+        state (SessionState): The sensor's state, updated in place.
+        since (datetime, optional): The oldest timestamp that may have
+            changed. Defaults to replaying every reading.
+        until (datetime, optional): The newest timestamp that may have
+            changed. The replay stops at the first session closed after
+            it instead of running up to the newest reading.
+        chunk_size (int, optional): Readings fetched per round trip.
+            Defaults to ``SENSOR_EXPORT_CHUNK_SIZE``.
+    Returns:
+        int: The number of readings replayed.
+    """
+    sensor_id = state.sensor_id
+    sessions = PresenceSession.objects.filter(sensor_id=sensor_id)
+    readings = SensorRecord.objects.filter(sensor_id=sensor_id)
+    if since is not None:
+        previous = sessions.filter(start__lte=since).order_by("-start").first()
+        since = previous.start if previous is not None else since
+        sessions = sessions.filter(start__gte=since)
+        readings = readings.filter(timestamp__gte=since)
+    closed = _closed_after(sensor_id, until) if until is not None else None
+    if closed is not None:
+        sessions = sessions.filter(start__lte=closed)
+        readings = readings.filter(timestamp__lte=closed)
+    sessions.delete()
+
+    builder = SessionBuilder(sensor_id)
+    chunk_size = chunk_size or settings.SENSOR_EXPORT_CHUNK_SIZE
+    rows = readings.order_by("timestamp", "id").values_list(
+        "timestamp", "human_presence", "dwell_time"
+    )
+    replayed = 0
+    for timestamp, present, dwell_time in rows.iterator(chunk_size):
+        builder.add(timestamp, present, dwell_time)
+        replayed += 1
+        if len(builder.sessions) > chunk_size:
+            builder.save(keep_current=True)
+    builder.save()
+    if closed is None:
+        # The replay ran up to the newest reading.
+        if builder.last_timestamp is not None:
+            state.last_timestamp = builder.last_timestamp
+        state.session = builder.current
+    return replayed
+
+
+def apply_sessions(records):
+    """Fold newly written records into the presence sessions.
+
+    Must run in the transaction that inserted ``records``. The state of
+    every sensor involved is locked, in sensor order, so concurrent
+    writers apply their readings one after the other.
+
+    Args:
+        records (Iterable[SensorRecord]): Records that were just inserted.
+    """
+    by_sensor = defaultdict(list)
+    for record in records:
+        by_sensor[record.sensor_id].append(record)
+    if not by_sensor:
+        return
+
+    states = _lock_states(by_sensor)
+    builders = []
+    for sensor_id, readings in sorted(by_sensor.items()):
+        state = states[sensor_id]
+        readings.sort(key=lambda record: (record.timestamp, record.pk))
+        if (
+            state.last_timestamp is not None
+            and readings[0].timestamp < state.last_timestamp
+        ):
+            replay(
+                state,
+                since=readings[0].timestamp,
+                until=readings[-1].timestamp,
+            )
+            continue
+        builder = SessionBuilder(sensor_id, state.session)
+        for record in readings:
+            builder.add(
+                record.timestamp, record.human_presence, record.dwell_time
+            )
+        builders.append(builder)
+        state.last_timestamp = builder.last_timestamp
+        state.session = builder.current
+
+    save_sessions(
+        [session for builder in builders for session in builder.sessions]
+    )
+    SessionState.objects.bulk_update(
+        states.values(), ["last_timestamp", "session"]
+    )
+
+
+def rebuild_sessions(sensor_id, since=None, chunk_size=None):
+    """Replay the stored readings of one sensor in its own transaction.
+
+    Args:
+        sensor_id (int): The sensor to rebuild.
+        since (datetime, optional): Only replay from the session open at
+            this time, e.g. after bulk loading readings from then on.
+            Defaults to every reading.
+        chunk_size (int, optional): Readings fetched per round trip.
+    """
+    with transaction.atomic():
+        state = _lock_states([sensor_id])[sensor_id]
+        if since is None:
+            state.last_timestamp = None
+        replay(state, since=since, chunk_size=chunk_size)
+        state.save()
@@ -0,0 +1,271 @@
+"""Message sources of the streaming subscriber.
+
+A source delivers messages shaped like Pub/Sub streaming pull messages
+(``data``, ``message_id``, ``ack()`` and ``nack()``) to a callback on a
+background thread. ``subscribe`` returns a future that is done once the
+source has nothing more to deliver; ``cancel`` stops the delivery.
+
+``PubSubSource`` pulls from the subscription and only imports and
+builds the Google client when subscribing, so importing this module
+needs neither the library nor credentials. ``ReplaySource`` feeds
+captured push envelopes through the same pipeline, as fast as possible
+or at a multiple of the pace they were published at, for load tests
+and profiling without a live subscription.
+"""
+
+import itertools
+import json
+import threading
+import time
+from datetime import datetime
+
+from django.db import connections
+
+from core.constants import PROJECT_ID, SUBSCRIPTION_ID
+
+
+class Source:
+    """Base class of subscriber message sources.
+
+    Attributes:
+        max_messages (int): Flow control: the most messages delivered
+            but not yet acked or nacked.
+    """
+
+    max_messages = 1000
+
+    def subscribe(self, callback):
+        """Start delivering messages to ``callback``.
+
+        Returns:
+            A future with ``done()``, ``cancel()`` and ``result()``.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the source's resources once delivery has stopped."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PubSubSource(Source):
+    """Stream messages from a Pub/Sub subscription.
+
+    Args:
+        project_id (str): Google Cloud project of the subscription.
+        subscription_id (str): The subscription to pull from.
+        max_messages (int): Flow control: outstanding message limit.
+        max_bytes (int): Flow control: outstanding bytes limit.
+    """
+
+    def __init__(
+        self,
+        project_id=PROJECT_ID,
+        subscription_id=SUBSCRIPTION_ID,
+        max_messages=1000,
+        max_bytes=100 * 1024 * 1024,
+    ):
+        self.project_id = project_id
+        self.subscription_id = subscription_id
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._client = None
+
+    def __str__(self):
+        return (
+            f"projects/{self.project_id}/subscriptions/"
+            f"{self.subscription_id}"
+        )
+
+    def subscribe(self, callback):
+        from google.cloud import pubsub_v1
+
+        if self._client is None:
+            self._client = pubsub_v1.SubscriberClient()
+        flow_control = pubsub_v1.types.FlowControl(
+            max_messages=self.max_messages, max_bytes=self.max_bytes
+        )
+        return self._client.subscribe(
+            self._client.subscription_path(
+                self.project_id, self.subscription_id
+            ),
+            callback=callback,
+            flow_control=flow_control,
+        )
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class ReplayMessage:
+    """A replayed message, settled in memory instead of in Pub/Sub.
+
+    Records when it was received and when it was acked or nacked, so a
+    replay or benchmark can measure end-to-end latency per message.
+
+    Args:
+        data (bytes): The push envelope, as Pub/Sub delivers it.
+        message_id (str, optional): Defaults to the envelope's.
+        on_settle (callable, optional): Called with the message once it
+            is acked or nacked.
+    """
+
+    def __init__(self, data, message_id=None, on_settle=None):
+        self.data = data
+        self.message_id = message_id
+        self.on_settle = on_settle
+        self.received = time.perf_counter()
+        self.settled = None
+        self.acked = False
+        self.nacked = False
+
+    def _settle(self):
+        self.settled = time.perf_counter()
+        if self.on_settle is not None:
+            self.on_settle(self)
+
+    def ack(self):
+        self.acked = True
+        self._settle()
+
+    def nack(self):
+        self.nacked = True
+        self._settle()
+
+
+class ReplayFuture:
+    """Handle of a running replay, like a streaming pull future."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._done = threading.Event()
+        self._error = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def result(self, timeout=None):
+        self._done.wait(timeout)
+        if self._error is not None:
+            raise self._error
+
+
+class ReplaySource(Source):
+    """Replay captured push envelopes.
+
+    Nacked messages are counted but not redelivered.
+
+    Args:
+        envelopes (Iterable[bytes | str]): Push envelopes, one JSON
+            document each, e.g. the lines of an archive.
+        speed (float, optional): Multiple of real time to replay at,
+            following the envelopes' ``publishTime``. Defaults to as fast
+            as the pipeline settles them.
+        max_messages (int): Flow control: messages delivered but not yet
+            acked or nacked, as Pub/Sub's flow control limits them.
+        shard (tuple[int, int]): ``(index, count)``: replay only every
+            ``count``-th envelope, starting at ``index``, so that several
+            subscriber processes can share one capture.
+    """
+
+    def __init__(self, envelopes, speed=None, max_messages=1000, shard=(0, 1)):
+        self.envelopes = envelopes
+        self.speed = speed
+        self.shard = shard
+        self.max_messages = max_messages
+        self.delivered = self.acked = self.nacked = 0
+        self.latencies = []
+        self.started = self.finished = None
+        self._window = threading.BoundedSemaphore(max_messages)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, paths, **kwargs):
+        """Replay NDJSON archives, optionally gzipped, in order."""
+        from .backfill import open_archive
+
+        def lines():
+            for path in paths:
+                with open_archive(path) as f:
+                    for line in f:
+                        if line.strip():
+                            yield line
+
+        return cls(lines(), **kwargs)
+
+    def __str__(self):
+        pace = f"{self.speed:g}x real time" if self.speed else "full speed"
+        return f"replay at {pace}"
+
+    @property
+    def elapsed(self):
+        """Seconds from the first delivery to the last settlement."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def subscribe(self, callback):
+        future = ReplayFuture()
+        threading.Thread(
+            target=self._run, args=(callback, future), daemon=True
+        ).start()
+        return future
+
+    def _settled(self, message):
+        with self._lock:
+            if message.acked:
+                self.acked += 1
+            else:
+                self.nacked += 1
+            self.latencies.append(message.settled - message.received)
+            self.finished = message.settled
+        self._window.release()
+
+    def _run(self, callback, future):
+        index, count = self.shard
+        first = None
+        try:
+            envelopes = itertools.islice(self.envelopes, index, None, count)
+            for data in envelopes:
+                if isinstance(data, str):
+                    data = data.encode("utf-8")
+                if self.started is None:
+                    self.started = time.perf_counter()
+                published = _publish_time(data) if self.speed else None
+                if published is not None:
+                    first = first or published
+                    due = (published - first).total_seconds() / self.speed
+                    elapsed = time.perf_counter() - self.started
+                    future.cancelled.wait(max(due - elapsed, 0))
+                # Block while the pipeline holds max_messages unsettled.
+                while not self._window.acquire(timeout=0.1):
+                    if future.cancelled.is_set():
+                        return
+                if future.cancelled.is_set():
+                    self._window.release()
+                    return
+                self.delivered += 1
+                callback(ReplayMessage(data, on_settle=self._settled))
+        except Exception as e:
+            future._error = e
+        finally:
+            # The callback may have written from this thread.
+            connections.close_all()
+            future._done.set()
+
+
+def _publish_time(data):
+    try:
+        published = json.loads(data)["message"]["publishTime"]
+        return datetime.fromisoformat(published.replace("Z", "+00:00"))
+    except (KeyError, TypeError, ValueError):
+        return None
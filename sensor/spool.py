@@ -0,0 +1,525 @@
+"""Local write-ahead spool for readings the database cannot take.
+
+When ``SENSOR_SPOOL_DIR`` is set, a push or Pub/Sub message whose
+write is refused under backpressure or fails with a transient database
+error is appended to the spool instead, and acknowledged once it is on
+disk, so Pub/Sub does not redeliver it while the database is struggling.
+A drainer later loads the spooled readings through ``save_records``, in
+the order they were spooled.
+
+The spool is a directory of append-only segment files, one record per
+line as ``<crc32> <json>``. Each process appends to its own active
+``.open`` segment, named after its creation time and pid and held
+under an exclusive ``flock``; it is created and locked under a
+``.new`` name first, so an ``.open`` segment is never seen unlocked
+while its process lives. Appends are group-committed: concurrent
+writers share one ``fsync``. A segment is sealed, renamed to ``.seg``,
+once it reaches ``SENSOR_SPOOL_SEGMENT_BYTES`` or has been open for
+``SENSOR_SPOOL_SEAL_AGE`` seconds.
+
+The drainer loads sealed segments oldest first, one transaction each,
+and deletes a segment only after its transaction committed; a crash in
+between loads it again, and the unique constraint on ``message_id``
+skips what was already stored. An ``.open`` segment whose lock is free
+belonged to a process that died: its torn last line, if any, is
+truncated and it is sealed, so nothing acknowledged is lost.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from . import metrics
+from .ingest import save_records
+from .models import DeadLetter, SensorRecord
+from .pressure import TRANSIENT_ERRORS
+
+CREATING = ".new"
+OPEN = ".open"
+SEALED = ".seg"
+_DRAIN_LOCK = "drain.lock"
+
+
+class SpoolFull(Exception):
+    """The spool holds ``SENSOR_SPOOL_MAX_BYTES`` already."""
+
+
+def encode(record):
+    """Serialize a record as one checksummed spool line."""
+    payload = json.dumps(
+        [
+            record.sensor_id,
+            record.human_presence,
+            record.dwell_time,
+            record.timestamp.isoformat(),
+            record.message_id,
+        ],
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def decode(line):
+    """Parse a spool line back into an unsaved record.
+
+    Returns:
+        SensorRecord: The record, or ``None`` if the line is torn or
+        corrupt.
+    """
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        sensor_id, presence, dwell, timestamp, message_id = json.loads(payload)
+    except ValueError:
+        return None
+    return SensorRecord(
+        sensor_id=sensor_id,
+        human_presence=presence,
+        dwell_time=dwell,
+        timestamp=datetime.fromisoformat(timestamp),
+        message_id=message_id,
+    )
+
+
+def read_segment(path):
+    """Read the records of a segment up to its first invalid line.
+
+    Returns:
+        tuple[list[SensorRecord], int]: The records and the length of
+        the valid prefix, in bytes.
+    """
+    records = []
+    valid = 0
+    with open(path, "rb") as f:
+        for line in f:
+            record = decode(line)
+            if record is None:
+                break
+            records.append(record)
+            valid += len(line)
+    return records, valid
+
+
+def _sync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _same_file(fd, path):
+    """Whether ``path`` still names the file open as ``fd``."""
+    try:
+        return os.stat(path).st_ino == os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _try_lock(fd):
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class _Segment:
+    def __init__(self, directory):
+        name = os.path.join(
+            directory, f"{time.time_ns():020d}-{os.getpid()}"
+        )
+        self.path = name + OPEN
+        self.fd = os.open(
+            name + CREATING,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND,
+        )
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        os.rename(name + CREATING, self.path)
+        self.size = 0
+        self.opened = time.monotonic()
+
+
+class Spool:
+    """A directory of segment files that readings are appended to.
+
+    Args:
+        directory (str): Where segments are kept; created if missing.
+        segment_bytes (int): Size at which the active segment is sealed.
+        seal_age (float): Seconds after which ``seal`` closes a
+            non-empty active segment.
+        max_bytes (int): Size of the spool at which appends are refused.
+    """
+
+    def __init__(self, directory, segment_bytes, seal_age, max_bytes):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.seal_age = seal_age
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._segment = None
+        self._written = 0
+        self._durable = 0
+        self._syncing = False
+        self._used = 0
+        self._measured = -1.0
+        self._condition = threading.Condition()
+        self.recover()
+
+    def append(self, records):
+        """Append records and return once they are synced to disk.
+
+        Raises:
+            SpoolFull: The spool reached ``max_bytes``.
+            OSError: The records could not be written.
+        """
+        data = b"".join(encode(record) for record in records)
+        if not data:
+            return
+        with metrics.SPOOL.time(), self._condition:
+            self._reserve(len(data))
+            segment = self._segment
+            if segment and (
+                segment.size + len(data) > self.segment_bytes
+                or time.monotonic() - segment.opened >= self.seal_age
+            ):
+                self._seal()
+            if self._segment is None:
+                self._segment = _Segment(self.directory)
+                _sync_directory(self.directory)
+            os.write(self._segment.fd, data)
+            self._segment.size += len(data)
+            self._written += 1
+            self._wait_durable(self._written)
+
+    def _reserve(self, size):
+        # Other processes share the directory: measure it again at
+        # most once a second, and count our appends in between.
+        now = time.monotonic()
+        if now - self._measured >= 1.0:
+            self._used = self.size()
+            self._measured = now
+        if self._used + size > self.max_bytes:
+            raise SpoolFull(f"The spool holds {self._used} bytes already.")
+        self._used += size
+
+    def _wait_durable(self, ticket):
+        # Whoever finds no sync running syncs everything written so
+        # far; the writers that arrive meanwhile wait for it, then one
+        # of them syncs what they wrote.
+        while self._durable < ticket:
+            if self._syncing:
+                self._condition.wait()
+                continue
+            self._syncing = True
+            target, fd = self._written, self._segment.fd
+            self._condition.release()
+            try:
+                os.fsync(fd)
+            finally:
+                self._condition.acquire()
+                self._syncing = False
+                self._condition.notify_all()
+            self._durable = max(self._durable, target)
+
+    def _seal(self):
+        while self._syncing:
+            self._condition.wait()
+        if self._segment is None:
+            # Another writer sealed it meanwhile.
+            return
+        segment, self._segment = self._segment, None
+        os.fsync(segment.fd)
+        self._durable = self._written
+        os.rename(segment.path, segment.path[: -len(OPEN)] + SEALED)
+        os.close(segment.fd)
+        _sync_directory(self.directory)
+
+    def seal(self, force=False):
+        """Seal the active segment if it has been open for ``seal_age``.
+
+        Returns:
+            bool: Whether a segment was sealed.
+        """
+        with self._condition:
+            segment = self._segment
+            if segment is None or not segment.size:
+                return False
+            if not force and time.monotonic() - segment.opened < self.seal_age:
+                return False
+            self._seal()
+            return True
+
+    def recover(self):
+        """Seal the open segments of processes that died.
+
+        Segments a process died creating are empty and only removed
+        once they are ``seal_age`` old: until it takes the lock, a live
+        process holds its new segment unlocked.
+
+        Returns:
+            int: The number of segments recovered.
+        """
+        recovered = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(CREATING):
+                self._remove_abandoned(path)
+                continue
+            if not name.endswith(OPEN):
+                continue
+            if self._segment is not None and path == self._segment.path:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                # Sealed by its process meanwhile.
+                continue
+            try:
+                if not _try_lock(fd) or not _same_file(fd, path):
+                    continue
+                records, valid = read_segment(path)
+                if valid < os.fstat(fd).st_size:
+                    print(
+                        f"Truncating {path} to {valid} bytes: its last "
+                        "write was interrupted."
+                    )
+                    os.ftruncate(fd, valid)
+                os.fsync(fd)
+                os.rename(path, path[: -len(OPEN)] + SEALED)
+                recovered += 1
+            finally:
+                os.close(fd)
+        if recovered:
+            _sync_directory(self.directory)
+        return recovered
+
+    def _remove_abandoned(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            if (
+                time.time() - os.fstat(fd).st_mtime >= self.seal_age
+                and _try_lock(fd)
+                and _same_file(fd, path)
+            ):
+                os.remove(path)
+        finally:
+            os.close(fd)
+
+    def segments(self):
+        """Return the paths of the sealed segments, oldest first."""
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if name.endswith(SEALED)
+        ]
+
+    def size(self):
+        """Return the bytes held by the spool's segments."""
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((OPEN, SEALED)):
+                total += entry.stat().st_size
+        return total
+
+    def depth(self):
+        """Return the number of segments not yet drained."""
+        return sum(
+            name.endswith((OPEN, SEALED))
+            for name in os.listdir(self.directory)
+        )
+
+    def close(self):
+        """Seal the active segment, e.g. before the process exits."""
+        self.seal(force=True)
+
+
+class SpoolDrainer:
+    """Load sealed segments into ``SensorRecord``, oldest first.
+
+    Only one process drains a spool at a time; the others skip their
+    turn while it holds the drain lock.
+
+    Args:
+        spool (Spool): The spool to drain.
+        interval (float): Seconds between drains of the background
+            thread.
+        batch_size (int, optional): Rows per INSERT statement.
+    """
+
+    def __init__(self, spool, interval=1.0, batch_size=None):
+        self.spool = spool
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def drain(self):
+        """Seal what is due and load every sealed segment.
+
+        Transient database errors propagate, leaving the segment being
+        loaded and those after it for the next drain.
+
+        Returns:
+            int: The number of records created.
+        """
+        self.spool.seal()
+        lock = os.open(
+            os.path.join(self.spool.directory, _DRAIN_LOCK),
+            os.O_WRONLY | os.O_CREAT,
+        )
+        try:
+            if not _try_lock(lock):
+                return 0
+            self.spool.recover()
+            return sum(self.load(path) for path in self.spool.segments())
+        finally:
+            os.close(lock)
+
+    def load(self, path):
+        """Load one segment in a transaction, then delete it.
+
+        Returns:
+            int: The number of records created.
+        """
+        records, valid = read_segment(path)
+        if valid < os.path.getsize(path):
+            print(f"Ignoring the corrupt tail of {path} after {valid} bytes.")
+        try:
+            created = len(save_records(records, batch_size=self.batch_size))
+        except TRANSIENT_ERRORS:
+            raise
+        except DatabaseError:
+            created = self._load_one_by_one(records)
+        os.remove(path)
+        _sync_directory(self.spool.directory)
+        metrics.SPOOL_DRAINED.labels().inc(len(records))
+        metrics.SPOOL_MESSAGES["accepted"].inc(created)
+        metrics.SPOOL_MESSAGES["duplicate"].inc(len(records) - created)
+        return created
+
+    def _load_one_by_one(self, records):
+        # A row itself is bad: keep the others and dead-letter it.
+        created = 0
+        for record in records:
+            try:
+                created += len(save_records([record]))
+            except TRANSIENT_ERRORS:
+                raise
+            except DatabaseError as e:
+                DeadLetter.objects.create(
+                    message_id=record.message_id,
+                    reason=DeadLetter.WRITE_FAILED,
+                    payload=encode(record).decode("utf-8"),
+                    error=str(e),
+                )
+                metrics.SPOOL_MESSAGES["error"].inc()
+        return created
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Error draining the spool: {e}")
+        connections.close_all()
+
+
+_spool = None
+_drainer = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """Return this process's spool, or ``None`` when it is disabled.
+
+    The first call opens it, recovering the segments of dead
+    processes, and starts a background drainer unless
+    ``SENSOR_SPOOL_DRAIN_INTERVAL`` is 0, which leaves draining to
+    ``manage.py drain_spool``.
+    """
+    global _spool, _drainer
+    if not settings.SENSOR_SPOOL_DIR:
+        return None
+    with _spool_lock:
+        if (
+            _spool is not None
+            and _spool.directory != settings.SENSOR_SPOOL_DIR
+        ):
+            _close()
+        if _spool is None:
+            _spool = Spool(
+                settings.SENSOR_SPOOL_DIR,
+                settings.SENSOR_SPOOL_SEGMENT_BYTES,
+                settings.SENSOR_SPOOL_SEAL_AGE,
+                settings.SENSOR_SPOOL_MAX_BYTES,
+            )
+            if settings.SENSOR_SPOOL_DRAIN_INTERVAL:
+                _drainer = SpoolDrainer(
+                    _spool, settings.SENSOR_SPOOL_DRAIN_INTERVAL
+                )
+                _drainer.start()
+        return _spool
+
+
+metrics.SPOOL_BYTES.labels().set_function(
+    lambda: _spool.size() if _spool is not None else 0
+)
+metrics.SPOOL_SEGMENTS.labels().set_function(
+    lambda: _spool.depth() if _spool is not None else 0
+)
+
+
+def spool_records(records):
+    """Append records to the spool, if one is configured.
+
+    Returns:
+        bool: Whether the records are durable in the spool. ``False``
+        when it is disabled, full or cannot be written; the caller then
+        reports the original failure.
+    """
+    try:
+        spool = get_spool()
+        if spool is None:
+            return False
+        spool.append(records)
+    except (OSError, SpoolFull) as e:
+        print(f"Error spooling {len(records)} records: {e}")
+        return False
+    return True
+
+
+def _close():
+    global _spool, _drainer
+    if _drainer is not None:
+        _drainer.stop()
+    if _spool is not None:
+        _spool.close()
+    _spool = _drainer = None
+
+
+def reset():
+    """Stop the drainer and seal the spool, e.g. after a test."""
+    with _spool_lock:
+        _close()
@@ -0,0 +1,128 @@
+"""Process supervisor for running several subscriber workers.
+
+Each worker is a forked process running its own streaming pull, so
+decoding and database writes are spread over as many interpreters (and
+GILs) as there are workers. Pub/Sub load-balances the messages of one
+subscription across all of its open streams, which is what shards the
+work between them.
+"""
+
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.db import connections
+
+
+def _worker_main(target, index, args):
+    # The parent closed its connections before forking; drop the copies
+    # so the worker opens its own.
+    connections.close_all()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    target(index, *args)
+
+
+class Supervisor:
+    """Keep ``workers`` processes running ``target(index, *args)``.
+
+    A worker that exits is restarted, at most once every
+    ``restart_delay`` seconds per slot so that a crash loop does not
+    spin. On ``stop`` (or SIGTERM/SIGINT when ``run`` handles signals)
+    every worker receives SIGTERM and gets ``shutdown_timeout`` seconds
+    to drain before it is killed.
+
+    With ``finite`` workers, such as replays, a worker that exits with
+    code 0 is done and not restarted, and ``run`` returns once all of
+    them are.
+    """
+
+    def __init__(
+        self,
+        target,
+        workers,
+        args=(),
+        restart_delay=1.0,
+        shutdown_timeout=30.0,
+        finite=False,
+    ):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.restart_delay = restart_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.finite = finite
+        self.restarts = 0
+        self._context = multiprocessing.get_context("fork")
+        self._processes = [None] * workers
+        self._started = [0.0] * workers
+        self._finished = set()
+        self._stopping = threading.Event()
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.target, index, self.args),
+            name=f"sensor-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+
+    def run(self, handle_signals=True):
+        """Start the workers and supervise them until stopped."""
+        if handle_signals:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        connections.close_all()
+        for index in range(self.workers):
+            self._spawn(index)
+        print(
+            f"Started {self.workers} workers: "
+            f"{', '.join(str(p.pid) for p in self._processes)}"
+        )
+
+        while not self._stopping.wait(0.2):
+            if len(self._finished) == self.workers:
+                break
+            for index, process in enumerate(self._processes):
+                if index in self._finished or process.is_alive():
+                    continue
+                if self.finite and process.exitcode == 0:
+                    process.join()
+                    self._finished.add(index)
+                    continue
+                if time.monotonic() - self._started[index] < (
+                    self.restart_delay
+                ):
+                    continue
+                process.join()
+                print(
+                    f"Worker {index} (pid {process.pid}) exited with code "
+                    f"{process.exitcode}; restarting."
+                )
+                self.restarts += 1
+                self._spawn(index)
+        self.shutdown()
+
+    def shutdown(self):
+        """Ask every worker to drain and exit, killing stragglers."""
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                print(
+                    f"Worker {index} (pid {process.pid}) did not drain in "
+                    f"{self.shutdown_timeout}s; killing it."
+                )
+                process.kill()
+                process.join()
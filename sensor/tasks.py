@@ -1,53 +1,219 @@
-import base64
 import json
+import signal
+import threading
 
 from celery import shared_task
-from google.cloud import pubsub_v1
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils.dateparse import parse_datetime
 
-from core.constants import PROJECT_ID, SUBSCRIPTION_ID
-from sensor.serializers import SensorRecordSerializer
-
-subscriber = pubsub_v1.SubscriberClient()
-subscription_path = subscriber.subscription_path(PROJECT_ID, SUBSCRIPTION_ID)
+from sensor import metrics, pressure, spool
+from sensor.batching import MessageBatcher, ack, nack
+from sensor.decoder import InvalidRecord, decode_envelope, error_detail
+from sensor.ingest import save_records
+from sensor.models import DeadLetter, SensorRecord
+from sensor.pressure import TRANSIENT_ERRORS
+from sensor.sources import PubSubSource
 
 
 @shared_task
+@metrics.PUBSUB_HANDLER.time()
 def process_sensor_data(message):
     try:
-        data = json.loads(message.data.decode("utf-8"))
-        decoded_data = base64.b64decode(data["message"]["data"]).decode(
-            "utf-8"
-        )
-        sensor_data = json.loads(decoded_data)
-
-        serializer = SensorRecordSerializer(
-            data={
-                "sensor_id": sensor_data["v0"],
-                "human_presence": bool(sensor_data["v11"]),
-                "dwell_time": sensor_data["v18"],
-                "timestamp": sensor_data["Time"],
-            }
-        )
-        if serializer.is_valid():
-            serializer.save()
-            message.ack()
+        row = decode_envelope(message.data)
+    except (InvalidRecord, KeyError, TypeError, ValueError) as e:
+        # Redelivering it would fail the same way: keep it and ack it.
+        print(f"Invalid data: {error_detail(e)}")
+        metrics.PUBSUB_MESSAGES["invalid"].inc()
+        try:
+            store_dead_letter(
+                message.data.decode("utf-8", errors="replace"),
+                error_detail(e),
+                getattr(message, "message_id", None),
+            )
+        except DatabaseError as e:
+            print(f"Error dead-lettering message: {e}")
+            nack(message)
         else:
-            print(f"Invalid data: {serializer.errors}")
-            message.nack()
+            ack(message)
+        return
+
+    try:
+        row["message_id"] = message.message_id or row["message_id"]
+        record = SensorRecord(**row)
+        save_records([record])
+        metrics.record_saved(metrics.PUBSUB_MESSAGES, [record])
+        ack(message)
 
+    except TRANSIENT_ERRORS as e:
+        if spool.spool_records([record]):
+            metrics.PUBSUB_MESSAGES["spooled"].inc()
+            ack(message)
+            return
+        print(f"Error processing message: {e}")
+        metrics.PUBSUB_MESSAGES["error"].inc()
+        nack(message)
     except Exception as e:
         print(f"Error processing message: {e}")
-        message.nack()
+        metrics.PUBSUB_MESSAGES["error"].inc()
+        nack(message)
+
+
+def record_to_row(record):
+    """Convert an unsaved record into a JSON-serializable task argument."""
+    return {
+        "sensor_id": record.sensor_id,
+        "human_presence": record.human_presence,
+        "dwell_time": record.dwell_time,
+        "timestamp": record.timestamp.isoformat(),
+        "message_id": record.message_id,
+    }
+
+
+def row_to_record(row):
+    return SensorRecord(
+        **{**row, "timestamp": parse_datetime(row["timestamp"])}
+    )
+
+
+@shared_task(bind=True)
+def write_sensor_batch(self, rows):
+    """Write a batch of decoded readings enqueued by the subscriber.
+
+    Transient database errors are retried with exponential backoff,
+    up to ``SENSOR_WRITE_MAX_RETRIES`` times. Any other database error
+    means a row itself is bad: the rows are then written one at a time
+    and those that still fail are dead-lettered.
+
+    Args:
+        rows (list[dict]): Rows built by ``record_to_row``.
+    Returns:
+        int: The number of records created.
+    """
+    failed = 0
+    try:
+        created = len(save_records([row_to_record(row) for row in rows]))
+    except TRANSIENT_ERRORS as e:
+        if self.request.retries >= settings.SENSOR_WRITE_MAX_RETRIES:
+            store_dead_letters(rows, DeadLetter.WRITE_FAILED, str(e))
+            metrics.CELERY_MESSAGES["error"].inc(len(rows))
+            return 0
+        raise self.retry(
+            exc=e,
+            countdown=get_exponential_backoff_interval(
+                factor=1,
+                retries=self.request.retries,
+                maximum=60,
+                full_jitter=True,
+            ),
+        )
+    except DatabaseError:
+        created = 0
+        for row in rows:
+            try:
+                created += len(save_records([row_to_record(row)]))
+            except DatabaseError as e:
+                store_dead_letters([row], DeadLetter.WRITE_FAILED, str(e))
+                failed += 1
+        metrics.CELERY_MESSAGES["error"].inc(failed)
+    metrics.CELERY_MESSAGES["accepted"].inc(created)
+    metrics.CELERY_MESSAGES["duplicate"].inc(len(rows) - created - failed)
+    return created
+
 
+def store_dead_letters(rows, reason, error):
+    DeadLetter.objects.bulk_create(
+        DeadLetter(
+            message_id=row["message_id"],
+            reason=reason,
+            payload=json.dumps(row),
+            error=error,
+        )
+        for row in rows
+    )
+
+
+@shared_task
+def store_dead_letter(payload, error, message_id=None):
+    """Keep an undecodable Pub/Sub payload instead of redelivering it."""
+    DeadLetter.objects.create(
+        message_id=message_id,
+        reason=DeadLetter.INVALID,
+        payload=payload,
+        error=error,
+    )
+
+
+def enqueue_records(records):
+    """``MessageBatcher`` writer that hands a batch to the Celery workers."""
+    write_sensor_batch.delay([record_to_row(record) for record in records])
 
-def start_subscriber():
-    streaming_pull = subscriber.subscribe(
-        subscription_path, callback=process_sensor_data
+
+def dead_letter_message(message, error):
+    """``MessageBatcher`` hook that dead-letters an undecodable message."""
+    store_dead_letter.delay(
+        message.data.decode("utf-8", errors="replace"),
+        error_detail(error),
+        getattr(message, "message_id", None),
     )
-    print(f"Started subscribing to {subscription_path}")
 
-    with subscriber:
+
+def start_subscriber(
+    source=None, max_batch_size=500, max_latency=1.0, pipeline="inline"
+):
+    """Stream messages from ``source`` until SIGTERM or SIGINT.
+
+    With the ``inline`` pipeline the subscriber writes each batch
+    itself. With ``celery`` it only decodes, enqueues every batch as a
+    ``write_sensor_batch`` task and dead-letters undecodable messages,
+    so a slow database delays the write workers, not the pull.
+
+    Args:
+        source (Source, optional): Where messages come from. Defaults
+            to the Pub/Sub subscription. A replay source stops the
+            subscriber once it is exhausted.
+    Returns:
+        Source: The source, to report on once it is drained.
+    """
+    if source is None:
+        source = PubSubSource()
+    # Hold fewer messages than flow control allows while batches are
+    # slow to write, down to one batch.
+    gate = pressure.subscriber_gate(
+        source.max_messages, min(max_batch_size, source.max_messages)
+    )
+    if pipeline == "celery":
+        batcher = MessageBatcher(
+            max_batch_size=max_batch_size,
+            max_latency=max_latency,
+            write=enqueue_records,
+            on_invalid=dead_letter_message,
+            gate=gate,
+        )
+    else:
+        batcher = MessageBatcher(
+            max_batch_size=max_batch_size, max_latency=max_latency, gate=gate
+        )
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+
+    # Recover and drain what earlier runs left in the spool.
+    spool.get_spool()
+    batcher.start()
+    streaming_pull = source.subscribe(batcher)
+    print(f"Started subscribing to {source}")
+
+    with source:
         try:
-            streaming_pull.result()
-        except TimeoutError:
+            while not stop.is_set() and not streaming_pull.done():
+                stop.wait(0.1)
+        finally:
+            # Drain while the stream is still open so that the acks of
+            # the last batch reach Pub/Sub; later messages are nacked.
+            batcher.stop()
             streaming_pull.cancel()
+            streaming_pull.result()
+            spool.reset()
+    return source
@@ -1,16 +1,108 @@
+import asyncio
 import base64
+import fcntl
+import gzip
 import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+import msgpack
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DataError, OperationalError, connection
+from django.db.backends.utils import CursorWrapper
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from .models import SensorRecord
+from core.celery import app as celery_app
+from core.metrics import CONTENT_TYPE, Counter, Histogram, Registry
+from core.serving import (
+    connection_budget,
+    on_threads,
+    shared_cache,
+    warm_up,
+)
+
+from . import (
+    async_ingest,
+    benchmarks,
+    latest,
+    metrics,
+    partitions,
+    pressure,
+    spool,
+    tasks,
+)
+from .batching import MessageBatcher
+from .decoder import InvalidRecord, decode_envelope, validate_reading
+from .dedupe import RecentKeys, recent_messages
+from .downsample import downsample
+from .ingest import save_records
+from .loadgen import SensorFleet
+from .models import (
+    DeadLetter,
+    PresenceSession,
+    SensorHourRollup,
+    SensorMinuteRollup,
+    SensorRecord,
+    SessionState,
+)
+from .pressure import PressureGate
+from .rollups import apply_rollups, rebuild_rollups
+from .serializers import SensorRecordSerializer
+from .sources import ReplaySource
+from .spool import Spool, SpoolDrainer, read_segment
+from .supervisor import Supervisor
+
+
+def make_envelope(sensor_id=100013, presence=0, dwell=2.72, time=None):
+    """Build a Pub/Sub push envelope around a single sensor reading."""
+    sensor_data = {
+        "serial": "000100000100",
+        "Time": time or "2022-11-08T04:00:04.317801",
+        "v0": sensor_id,
+        "v11": presence,
+        "v18": dwell,
+    }
+    return {
+        "message": {
+            "data": base64.b64encode(
+                json.dumps(sensor_data).encode("utf-8")
+            ).decode("utf-8"),
+            "messageId": f"{sensor_id}-{sensor_data['Time']}",
+        },
+        "subscription": "projects/myproject/subscriptions/mysubscription",
+    }
+
+
+def reset_caches():
+    """Forget state that outlives the test database transaction."""
+    caches["default"].clear()
+    recent_messages.clear()
+    pressure.reset()
+    spool.reset()
 
 
 class SensorRecordViewTest(TestCase):
     def setUp(self):
+        reset_caches()
         self.client = APIClient()
         sensor_data = {
             "serial": "000100000100",
@@ -83,6 +175,15 @@ class SensorRecordViewTest(TestCase):
         self.assertEqual(SensorRecord.objects.count(), 0)
         self.assertIn("error", response.data)
 
+    def test_post_malformed_envelope(self):
+        for body in ({}, {"message": {}}, []):
+            response = self.client.post("/api/sensor/", body, format="json")
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, body
+            )
+            self.assertIn("error", response.data)
+        self.assertEqual(SensorRecord.objects.count(), 0)
+
     def test_get_sensor_data(self):
         SensorRecord.objects.create(
             sensor_id=1,
@@ -146,3 +247,1808 @@ class SensorRecordViewTest(TestCase):
         response = self.client.get("/api/sensor/?page=abc")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("error", response.data)
+
+
+class FakeMessage:
+    """Stand-in for a streaming pull message that records ack/nack."""
+
+    def __init__(self, envelope):
+        self.data = json.dumps(envelope).encode("utf-8")
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+
+class SensorRecordBatchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_post_batch_valid(self):
+        envelopes = [make_envelope(sensor_id=i) for i in range(5)]
+        response = self.client.post(
+            "/api/sensor/batch/?batch_size=2", envelopes, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 5)
+        self.assertEqual(SensorRecord.objects.count(), 5)
+
+    def test_post_batch_partial(self):
+        envelopes = [
+            make_envelope(sensor_id=1),
+            {"message": {"data": "invalid_base64"}},
+            make_envelope(sensor_id="not-a-number"),
+            make_envelope(sensor_id=2),
+        ]
+        response = self.client.post(
+            "/api/sensor/batch/", envelopes, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [item["status"] for item in response.data["results"]],
+            ["created", "invalid", "invalid", "created"],
+        )
+        self.assertIn("sensor_id", response.data["results"][2]["error"])
+        self.assertEqual(SensorRecord.objects.count(), 2)
+
+    def test_post_batch_all_invalid(self):
+        response = self.client.post(
+            "/api/sensor/batch/",
+            [{"message": {"data": "invalid_base64"}}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(SensorRecord.objects.count(), 0)
+
+    def test_post_batch_not_a_list(self):
+        response = self.client.post(
+            "/api/sensor/batch/", make_envelope(), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("error", response.data)
+
+    def test_post_batch_invalid_batch_size(self):
+        response = self.client.post(
+            "/api/sensor/batch/?batch_size=0", [make_envelope()], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MessageBatcherTest(TransactionTestCase):
+    def setUp(self):
+        reset_caches()
+
+    def test_flush_on_batch_size(self):
+        batcher = MessageBatcher(max_batch_size=3, max_latency=60)
+        messages = [FakeMessage(make_envelope(sensor_id=i)) for i in range(4)]
+        for message in messages:
+            batcher(message)
+
+        self.assertEqual(SensorRecord.objects.count(), 3)
+        self.assertTrue(all(m.acked for m in messages[:3]))
+        self.assertFalse(messages[3].acked)
+
+        self.assertEqual(batcher.flush(), 1)
+        self.assertTrue(messages[3].acked)
+        self.assertEqual(SensorRecord.objects.count(), 4)
+
+    def test_flush_on_latency(self):
+        batcher = MessageBatcher(max_batch_size=100, max_latency=0)
+        message = FakeMessage(make_envelope())
+        batcher(message)
+        self.assertFalse(message.acked)
+
+        self.assertEqual(batcher.flush_if_due(), 1)
+        self.assertTrue(message.acked)
+
+    def test_gate_throttles_held_messages(self):
+        gate = PressureGate("subscriber", 2, target_latency=60)
+        batcher = MessageBatcher(max_batch_size=10, max_latency=60, gate=gate)
+        messages = [FakeMessage(make_envelope(sensor_id=i)) for i in range(3)]
+        batcher(messages[0])
+        batcher(messages[1])
+        third = threading.Thread(target=batcher, args=(messages[2],))
+        third.start()
+        third.join(0.2)
+        self.assertTrue(third.is_alive())
+
+        self.assertEqual(batcher.flush(), 2)
+        third.join(5)
+        self.assertFalse(third.is_alive())
+        self.assertEqual(gate.in_flight, 1)
+        batcher.stop()
+        self.assertTrue(all(m.acked for m in messages))
+        self.assertEqual(gate.in_flight, 0)
+
+    def test_invalid_message_nacked(self):
+        batcher = MessageBatcher(max_batch_size=2, max_latency=60)
+        invalid = FakeMessage(make_envelope(sensor_id="abc"))
+        valid = FakeMessage(make_envelope())
+        batcher(invalid)
+        batcher(valid)
+        batcher.flush()
+
+        self.assertTrue(invalid.nacked)
+        self.assertFalse(invalid.acked)
+        self.assertTrue(valid.acked)
+        self.assertEqual(SensorRecord.objects.count(), 1)
+
+    def test_messages_after_stop_nacked(self):
+        batcher = MessageBatcher(max_batch_size=100, max_latency=60)
+        pending = FakeMessage(make_envelope(sensor_id=1))
+        batcher(pending)
+        batcher.stop()
+        late = FakeMessage(make_envelope(sensor_id=2))
+        batcher(late)
+
+        self.assertTrue(pending.acked)
+        self.assertTrue(late.nacked)
+        self.assertEqual(SensorRecord.objects.count(), 1)
+
+    def test_failed_write_nacks_batch(self):
+        batcher = MessageBatcher(max_batch_size=100, max_latency=60)
+        messages = [FakeMessage(make_envelope(sensor_id=i)) for i in range(2)]
+        for message in messages:
+            batcher(message)
+        with mock.patch(
+            "sensor.batching.save_records", side_effect=Exception("db down")
+        ):
+            self.assertEqual(batcher.flush(), 0)
+
+        self.assertTrue(all(m.nacked and not m.acked for m in messages))
+
+
+class DecoderTest(TestCase):
+    def test_matches_serializer(self):
+        readings = [
+            {"v0": 1, "v11": 1, "v18": 2.5, "Time": "2022-11-08T04:00:04"},
+            {"v0": "7.0", "v11": 0, "v18": "3", "Time": "2022-11-08"},
+            {"v0": 1.5, "v11": 0, "v18": "x", "Time": "yesterday"},
+            {"v0": 2**31, "v11": 0, "v18": None, "Time": 1667880004},
+            {"v0": -(2**31) - 1, "v11": 0, "v18": 1, "Time": None},
+            {"v0": True, "v11": 1, "v18": 1, "Time": "2022-11-08T04:00Z"},
+            {"v0": "9" * 1001, "v11": 1, "v18": "1" * 1001},
+        ]
+        for reading in readings:
+            with self.subTest(reading=reading):
+                serializer = SensorRecordSerializer(
+                    data={
+                        "sensor_id": reading.get("v0"),
+                        "human_presence": bool(reading.get("v11")),
+                        "dwell_time": reading.get("v18"),
+                        "timestamp": reading.get("Time"),
+                    }
+                )
+                if "Time" not in reading:
+                    del serializer.initial_data["timestamp"]
+                try:
+                    row = validate_reading(reading)
+                except InvalidRecord as e:
+                    self.assertFalse(serializer.is_valid())
+                    self.assertEqual(e.errors, serializer.errors)
+                    for field, details in e.errors.items():
+                        self.assertEqual(
+                            [d.code for d in details],
+                            [d.code for d in serializer.errors[field]],
+                        )
+                else:
+                    self.assertTrue(serializer.is_valid(), serializer.errors)
+                    self.assertEqual(row, dict(serializer.validated_data))
+
+    def test_decode_raw_bytes(self):
+        envelope = make_envelope(sensor_id=5, presence=1, dwell=1.5)
+        row = decode_envelope(json.dumps(envelope).encode("utf-8"))
+        self.assertEqual(row["sensor_id"], 5)
+        self.assertIs(row["human_presence"], True)
+        self.assertEqual(row["dwell_time"], 1.5)
+        self.assertEqual(row["timestamp"].utcoffset(), timedelta(0))
+
+    def test_post_missing_field(self):
+        envelope = make_envelope()
+        envelope["message"]["data"] = base64.b64encode(
+            json.dumps({"v0": 1}).encode("utf-8")
+        ).decode("utf-8")
+        response = APIClient().post("/api/sensor/", envelope, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            set(response.data), {"dwell_time", "timestamp", "human_presence"}
+        )
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=i % 3,
+                human_presence=True,
+                dwell_time=i,
+                # Pairs of readings share a timestamp to exercise the id
+                # tie-breaker.
+                timestamp=base + timedelta(minutes=i // 2),
+            )
+            for i in range(25)
+        )
+        self.expected = list(
+            SensorRecord.objects.order_by("-timestamp", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_walk_forward_and_back(self):
+        seen = []
+        pages = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(
+                "/api/sensor/", {"cursor": cursor, "page_size": 10}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            seen.extend(item["id"] for item in response.data["data"])
+            cursor = response.data["next"]
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(p["data"]) for p in pages], [10, 10, 5])
+        self.assertIsNone(pages[0]["prev"])
+
+        response = self.client.get(
+            "/api/sensor/", {"cursor": pages[2]["prev"], "page_size": 10}
+        )
+        self.assertEqual(
+            [item["id"] for item in response.data["data"]],
+            self.expected[10:20],
+        )
+        self.assertIsNotNone(response.data["prev"])
+
+    def test_cursor_with_filter(self):
+        response = self.client.get(
+            "/api/sensor/", {"cursor": "", "page_size": 4, "sensor_id": 1}
+        )
+        response = self.client.get(
+            "/api/sensor/",
+            {"cursor": response.data["next"], "page_size": 4, "sensor_id": 1},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            all(item["sensor_id"] == 1 for item in response.data["data"])
+        )
+        self.assertEqual(len(response.data["data"]), 4)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/sensor/?cursor=abc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("error", response.data)
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/sensor/", {"cursor": ""})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("COUNT", queries[0]["sql"])
+
+
+class QueryPlanTest(TestCase):
+    def test_query_shapes_use_indexes(self):
+        out = StringIO()
+        call_command("check_query_plans", "--disable-seqscan", stdout=out)
+        self.assertIn("All query shapes use indexes.", out.getvalue())
+
+
+class SensorAggregateViewTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        base = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+        readings = [
+            (1, True, 4.0, base),
+            (1, False, 0.0, base + timedelta(minutes=10)),
+            (1, True, 8.0, base + timedelta(minutes=20)),
+            (1, True, 2.0, base + timedelta(hours=1)),
+            (2, False, 0.0, base + timedelta(minutes=5)),
+        ]
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=sensor_id,
+                human_presence=presence,
+                dwell_time=dwell,
+                timestamp=timestamp,
+            )
+            for sensor_id, presence, dwell, timestamp in readings
+        )
+
+    def test_hourly_buckets(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/sensor/aggregate/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("DATE_TRUNC", queries[0]["sql"].upper())
+        self.assertIn("GROUP BY", queries[0]["sql"])
+
+        data = response.data["data"]
+        self.assertEqual(
+            [(row["sensor_id"], row["readings"]) for row in data],
+            [(1, 3), (1, 1), (2, 1)],
+        )
+        self.assertAlmostEqual(data[0]["presence_ratio"], 2 / 3)
+        self.assertAlmostEqual(data[0]["avg_dwell_time"], 4.0)
+        self.assertEqual(data[0]["max_dwell_time"], 8.0)
+        self.assertEqual(data[2]["presence_ratio"], 0)
+
+    def test_filters_and_day_bucket(self):
+        response = self.client.get(
+            "/api/sensor/aggregate/",
+            {
+                "bucket": "day",
+                "sensor_id": "1,3",
+                "start_time": "2024-01-01T10:15:00Z",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["data"]), 1)
+        self.assertEqual(response.data["data"][0]["readings"], 2)
+
+    def test_invalid_parameters(self):
+        response = self.client.get("/api/sensor/aggregate/?bucket=week")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/sensor/aggregate/?sensor_id=a")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RollupTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.base = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+
+    def post_batch(self, readings):
+        envelopes = [
+            make_envelope(
+                sensor_id=sensor_id,
+                presence=presence,
+                dwell=dwell,
+                time=(self.base + offset).isoformat(),
+            )
+            for sensor_id, presence, dwell, offset in readings
+        ]
+        self.client.post("/api/sensor/batch/", envelopes, format="json")
+
+    def test_ingest_updates_rollups(self):
+        self.post_batch(
+            [
+                (1, 1, 4.0, timedelta(seconds=5)),
+                (1, 0, 1.0, timedelta(seconds=30)),
+                (1, 1, 6.0, timedelta(minutes=2)),
+            ]
+        )
+        self.client.post(
+            "/api/sensor/",
+            make_envelope(
+                sensor_id=1,
+                presence=1,
+                dwell=9.0,
+                time=(self.base + timedelta(seconds=50)).isoformat(),
+            ),
+            format="json",
+        )
+
+        minute = SensorMinuteRollup.objects.get(sensor_id=1, bucket=self.base)
+        self.assertEqual((minute.readings, minute.present), (3, 2))
+        self.assertEqual(minute.dwell_time_sum, 14.0)
+        self.assertEqual(minute.dwell_time_max, 9.0)
+        hour = SensorHourRollup.objects.get(sensor_id=1, bucket=self.base)
+        self.assertEqual((hour.readings, hour.present), (4, 3))
+        self.assertEqual(SensorMinuteRollup.objects.count(), 2)
+
+    def test_rollup_source_matches_raw(self):
+        self.post_batch(
+            [
+                (sensor_id, i % 2, float(i), timedelta(minutes=7 * i))
+                for i in range(30)
+                for sensor_id in (1, 2)
+            ]
+        )
+        for bucket in ("minute", "hour", "day"):
+            raw = self.client.get(
+                "/api/sensor/aggregate/", {"bucket": bucket}
+            ).data["data"]
+            rollup = self.client.get(
+                "/api/sensor/aggregate/",
+                {"bucket": bucket, "source": "rollup"},
+            ).data["data"]
+            self.assertEqual(len(raw), len(rollup))
+            for raw_row, rollup_row in zip(raw, rollup):
+                for key, value in raw_row.items():
+                    if isinstance(value, float):
+                        self.assertAlmostEqual(value, rollup_row[key])
+                    else:
+                        self.assertEqual(value, rollup_row[key])
+
+    def test_rebuild_command(self):
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=3,
+                human_presence=True,
+                dwell_time=i,
+                timestamp=self.base + timedelta(hours=i),
+            )
+            for i in range(30)
+        )
+        self.assertEqual(SensorHourRollup.objects.count(), 0)
+
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(SensorHourRollup.objects.count(), 30)
+        self.assertEqual(SensorMinuteRollup.objects.count(), 30)
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(SensorHourRollup.objects.count(), 30)
+
+    def test_rebuild_overwrites_concurrent_upserts(self):
+        record = SensorRecord(
+            sensor_id=3,
+            human_presence=True,
+            dwell_time=2.0,
+            timestamp=self.base,
+        )
+        save_records([record])
+
+        upserted = []
+
+        def ingest_after_delete(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith("DELETE") and not upserted:
+                # Live ingest upserting the buckets of a reading that
+                # the rebuild also counts, right after its DELETE.
+                upserted.append(sql)
+                apply_rollups([record])
+            return result
+
+        with connection.execute_wrapper(ingest_after_delete):
+            rebuild_rollups(self.base, self.base)
+        self.assertEqual(SensorHourRollup.objects.get().readings, 1)
+        self.assertEqual(SensorMinuteRollup.objects.get().readings, 1)
+
+
+class PartitionTest(TestCase):
+    def partition_of(self, record):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM sensor_sensorrecord "
+                "WHERE id = %s",
+                [record.pk],
+            )
+            return cursor.fetchone()[0]
+
+    def test_upcoming_partitions_are_created(self):
+        call_command("manage_partitions", "--ahead", "4", stdout=StringIO())
+        current = partitions.month_start(datetime.now(timezone.utc))
+        months = partitions.list_partitions()
+        for offset in range(5):
+            self.assertIn(partitions.add_months(current, offset), months)
+
+        record = SensorRecord.objects.create(
+            sensor_id=1,
+            human_presence=True,
+            dwell_time=1,
+            timestamp=partitions.add_months(current, 4) + timedelta(days=3),
+        )
+        self.assertEqual(
+            self.partition_of(record),
+            partitions.partition_name(partitions.add_months(current, 4)),
+        )
+
+    def test_create_partition_moves_default_rows(self):
+        month = datetime(2021, 3, 1, tzinfo=timezone.utc)
+        record = SensorRecord.objects.create(
+            sensor_id=1,
+            human_presence=True,
+            dwell_time=1,
+            timestamp=month + timedelta(days=10),
+        )
+        self.assertEqual(
+            self.partition_of(record), partitions.DEFAULT_PARTITION
+        )
+
+        partitions.create_partition(month)
+        self.assertEqual(
+            self.partition_of(record), partitions.partition_name(month)
+        )
+
+    def test_retention_downsamples_and_drops(self):
+        month = datetime(2021, 3, 1, tzinfo=timezone.utc)
+        partitions.create_partition(month)
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=1,
+                human_presence=bool(i % 2),
+                dwell_time=i,
+                timestamp=month + timedelta(minutes=20 * i),
+            )
+            for i in range(6)
+        )
+        SensorRecord.objects.create(
+            sensor_id=1,
+            human_presence=True,
+            dwell_time=1,
+            timestamp=datetime(2019, 1, 1, tzinfo=timezone.utc),
+        )
+
+        call_command(
+            "manage_partitions", "--retention-months", "1", stdout=StringIO()
+        )
+
+        self.assertNotIn(month, partitions.list_partitions())
+        self.assertFalse(
+            SensorRecord.objects.filter(timestamp__year__lt=2022).exists()
+        )
+        hours = SensorHourRollup.objects.filter(bucket__gte=month).order_by(
+            "bucket"
+        )
+        self.assertEqual([h.readings for h in hours], [3, 3])
+        self.assertEqual([h.present for h in hours], [1, 2])
+        self.assertFalse(
+            SensorMinuteRollup.objects.filter(bucket__gte=month).exists()
+        )
+
+
+class SensorExportViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=i % 2,
+                human_presence=bool(i % 3),
+                dwell_time=i / 2,
+                timestamp=base + timedelta(minutes=i),
+            )
+            for i in range(7)
+        )
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    @override_settings(SENSOR_EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_export(self):
+        response = self.client.get("/api/sensor/export/?sensor_id=0")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("application/x-"))
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row["dwell_time"] for row in rows], [0, 1, 2, 3])
+        expected = SensorRecordSerializer(
+            SensorRecord.objects.order_by("timestamp").first()
+        ).data
+        self.assertEqual(rows[0], dict(expected))
+
+    @override_settings(SENSOR_EXPORT_CHUNK_SIZE=3)
+    def test_csv_export(self):
+        response = self.client.get("/api/sensor/export/?format=csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = self.read(response).splitlines()
+        self.assertEqual(
+            lines[0], "id,sensor_id,human_presence,dwell_time,timestamp"
+        )
+        self.assertEqual(len(lines), 8)
+        self.assertTrue(lines[1].endswith(",0,false,0.0,2024-01-01T00:00:00Z"))
+
+    def test_invalid_filter(self):
+        response = self.client.get("/api/sensor/export/?sensor_id=abc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResponseFormatTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        base = datetime(2024, 1, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=i,
+                human_presence=bool(i % 2),
+                dwell_time=i * 1.5,
+                timestamp=base + timedelta(seconds=i),
+            )
+            for i in range(5)
+        )
+
+    def test_json_matches_serializer(self):
+        response = self.client.get("/api/sensor/")
+        expected = SensorRecordSerializer(
+            SensorRecord.objects.all(), many=True
+        ).data
+        self.assertEqual(
+            json.loads(response.content)["data"],
+            json.loads(json.dumps(expected)),
+        )
+
+    def test_columnar(self):
+        response = self.client.get(
+            "/api/sensor/?page_size=3",
+            HTTP_ACCEPT="application/vnd.sensor.columnar+json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)["data"]
+        self.assertEqual(data["sensor_id"], [4, 3, 2])
+        self.assertEqual(data["human_presence"], [False, True, False])
+        self.assertEqual(data["timestamp"][0], "2024-01-01T12:30:19.250000Z")
+
+    def test_msgpack_with_cursor(self):
+        response = self.client.get(
+            "/api/sensor/", {"format": "msgpack", "cursor": "", "page_size": 2}
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        body = msgpack.unpackb(response.content)
+        self.assertEqual(body["data"]["dwell_time"], [6.0, 4.5])
+        self.assertIsNotNone(body["next"])
+
+    def test_empty_columnar(self):
+        response = self.client.get("/api/sensor/?sensor_id=99&format=columnar")
+        data = json.loads(response.content)["data"]
+        self.assertEqual(data["id"], [])
+
+
+class SensorLatestViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_caches()
+        self.base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=sensor_id,
+                human_presence=bool(i % 2),
+                dwell_time=i,
+                timestamp=self.base + timedelta(minutes=i),
+            )
+            for i in range(4)
+            for sensor_id in (1, 2)
+        )
+
+    def post(self, sensor_id, presence, dwell, minutes):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/api/sensor/",
+                make_envelope(
+                    sensor_id=sensor_id,
+                    presence=presence,
+                    dwell=dwell,
+                    time=(self.base + timedelta(minutes=minutes)).isoformat(),
+                ),
+                format="json",
+            )
+
+    def test_warm_from_database(self):
+        response = self.client.get("/api/sensor/latest/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual(
+            [(row["sensor_id"], row["dwell_time"]) for row in data],
+            [(1, 3), (2, 3)],
+        )
+        self.assertTrue(data[0]["human_presence"])
+
+    def test_write_through(self):
+        self.client.get("/api/sensor/latest/")
+        self.post(sensor_id=2, presence=0, dwell=7.5, minutes=10)
+        self.post(sensor_id=3, presence=1, dwell=1.0, minutes=10)
+        # Late reading: must not replace the newer state.
+        self.post(sensor_id=2, presence=1, dwell=9.0, minutes=5)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/sensor/latest/?sensor_id=2,3")
+        data = response.data["data"]
+        self.assertEqual([row["sensor_id"] for row in data], [2, 3])
+        self.assertEqual(data[0]["dwell_time"], 7.5)
+        self.assertFalse(data[0]["human_presence"])
+        self.assertEqual(
+            data[0]["timestamp"], self.base + timedelta(minutes=10)
+        )
+
+        response = self.client.get("/api/sensor/latest/")
+        self.assertEqual(len(response.data["data"]), 3)
+
+    def test_load_per_sensor(self):
+        # A tie on the timestamp goes to the last row written.
+        SensorRecord.objects.create(
+            sensor_id=2,
+            human_presence=False,
+            dwell_time=8,
+            timestamp=self.base + timedelta(minutes=3),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            states = latest.warm()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("DISTINCT", queries[0]["sql"])
+        self.assertEqual(states[1][1:], (3, self.base + timedelta(minutes=3)))
+        self.assertEqual(states[2][:2], (False, 8))
+        self.assertEqual(list(latest._load([2, 42])), [2])
+
+    def test_unknown_sensor(self):
+        response = self.client.get("/api/sensor/latest/?sensor_id=42")
+        self.assertEqual(response.data["data"], [])
+        response = self.client.get("/api/sensor/latest/?sensor_id=x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=sensor_id,
+                human_presence=True,
+                dwell_time=i,
+                timestamp=self.base + timedelta(minutes=i),
+            )
+            for i in range(4)
+            for sensor_id in (1, 2)
+        )
+
+    def at(self, minutes):
+        return (self.base + timedelta(minutes=minutes)).isoformat()
+
+    def post(self, sensor_id, minutes):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/sensor/",
+                make_envelope(sensor_id=sensor_id, time=self.at(minutes)),
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_closed_range_and_etag(self):
+        url = "/api/sensor/aggregate/"
+        params = {"start_time": self.at(0), "end_time": self.at(1.5)}
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        etag = first["ETag"]
+
+        # Newer readings do not touch ranges below the watermark.
+        self.post(sensor_id=1, minutes=10)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, params)
+        self.assertEqual(second["ETag"], etag)
+        self.assertEqual(second.json(), first.json())
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        # A late reading inside the range does.
+        self.post(sensor_id=1, minutes=0.5)
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        data = response.json()["data"]
+        readings = {row["sensor_id"]: row["readings"] for row in data}
+        self.assertEqual(readings, {1: 3, 2: 2})
+
+    def test_open_range_invalidated_per_sensor(self):
+        url = "/api/sensor/?sensor_id=1"
+        self.assertEqual(len(self.client.get(url).json()["data"]), 4)
+
+        self.post(sensor_id=2, minutes=10)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(url).json()["data"]), 4)
+
+        self.post(sensor_id=1, minutes=11)
+        self.assertEqual(len(self.client.get(url).json()["data"]), 5)
+        response = self.client.get("/api/sensor/")
+        self.assertEqual(len(response.json()["data"]), 10)
+
+    def test_normalized_parameters(self):
+        self.client.get(
+            "/api/sensor/",
+            {"start_time": self.at(0), "end_time": self.at(2)},
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/sensor/",
+                {
+                    "end_time": "2024-01-01T00:02:00Z",
+                    "start_time": "2024-01-01T00:00:00",
+                },
+            )
+        self.assertEqual(len(response.json()["data"]), 6)
+
+    def test_errors_are_not_cached(self):
+        url = "/api/sensor/?page=99"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertNotIn("ETag", self.client.get(url))
+
+
+class SensorRecordAsyncViewTest(TransactionTestCase):
+    def setUp(self):
+        reset_caches()
+
+    async def post_many(self, envelopes):
+        return await asyncio.gather(
+            *(
+                self.async_client.post(
+                    "/api/sensor/async/",
+                    envelope,
+                    content_type="application/json",
+                )
+                for envelope in envelopes
+            )
+        )
+
+    async def test_concurrent_posts_share_batches(self):
+        envelopes = [make_envelope(sensor_id=i) for i in range(20)]
+        with mock.patch(
+            "sensor.async_ingest.save_records", wraps=save_records
+        ) as save:
+            responses = await self.post_many(envelopes)
+        self.assertEqual(
+            {response.status_code for response in responses},
+            {status.HTTP_201_CREATED},
+        )
+        self.assertLess(save.call_count, len(envelopes))
+        count = await SensorRecord.objects.acount()
+        self.assertEqual(count, len(envelopes))
+
+    async def test_invalid_payload(self):
+        envelope = make_envelope()
+        envelope["message"]["data"] = base64.b64encode(
+            json.dumps({"v0": "x", "v11": 1, "v18": 1.0}).encode()
+        ).decode()
+        (response,) = await self.post_many([envelope])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "sensor_id": ["A valid integer is required."],
+                "timestamp": ["This field is required."],
+            },
+        )
+
+    def test_wsgi_requests_share_the_writer(self):
+        # Over WSGI every request runs on a loop of its own.
+        writer = async_ingest.get_writer()
+        for i in range(3):
+            response = self.client.post(
+                "/api/sensor/async/",
+                make_envelope(sensor_id=i),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIs(async_ingest.get_writer(), writer)
+        self.assertEqual(
+            sum(
+                thread.name.startswith("sensor-writer")
+                for thread in threading.enumerate()
+            ),
+            2,
+        )
+        self.assertEqual(SensorRecord.objects.count(), 3)
+
+    async def test_failed_write(self):
+        with mock.patch(
+            "sensor.async_ingest.save_records", side_effect=Exception("down")
+        ):
+            responses = await self.post_many([make_envelope()] * 3)
+        self.assertEqual(
+            [response.status_code for response in responses],
+            [status.HTTP_500_INTERNAL_SERVER_ERROR] * 3,
+        )
+        self.assertEqual(responses[0].json(), {"error": "down"})
+
+
+class DeduplicationTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def post(self, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data, format="json")
+
+    def test_redelivery_skipped_by_filter(self):
+        envelope = make_envelope()
+        first = self.post("/api/sensor/", envelope)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(0):
+            second = self.post("/api/sensor/", envelope)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(SensorRecord.objects.count(), 1)
+        self.assertEqual(
+            SensorRecord.objects.get().message_id,
+            envelope["message"]["messageId"],
+        )
+        self.assertEqual(recent_messages.stats()["hits"], 1)
+
+    def test_redelivery_skipped_by_constraint(self):
+        envelope = make_envelope()
+        self.post("/api/sensor/", envelope)
+        recent_messages.clear()
+        response = self.post("/api/sensor/", envelope)
+        self.assertEqual(
+            response.data, {"message": "Duplicate message ignored."}
+        )
+        self.assertEqual(SensorRecord.objects.count(), 1)
+        self.assertEqual(SensorMinuteRollup.objects.get().readings, 1)
+
+    def test_batch_statuses(self):
+        stored, new = make_envelope(sensor_id=1), make_envelope(sensor_id=2)
+        self.post("/api/sensor/", stored)
+        recent_messages.clear()
+        response = self.post("/api/sensor/batch/", [new, new, stored])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "duplicate", "duplicate"],
+        )
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["duplicate"], 2)
+        self.assertEqual(SensorRecord.objects.count(), 2)
+
+    def test_returning_order_ignored(self):
+        stored = SensorRecord(**decode_envelope(make_envelope(sensor_id=1)))
+        save_records([stored])
+        recent_messages.clear()
+        records = [
+            SensorRecord(**decode_envelope(make_envelope(sensor_id=i)))
+            for i in range(5)
+        ]
+        # RETURNING order is not guaranteed; hand the rows back reversed.
+        with mock.patch.object(
+            CursorWrapper,
+            "fetchall",
+            lambda cursor: cursor.cursor.fetchall()[::-1],
+            create=True,
+        ):
+            created = save_records(records)
+        self.assertEqual(
+            [record.sensor_id for record in created], [0, 2, 3, 4]
+        )
+        for record in created:
+            self.assertEqual(
+                SensorRecord.objects.get(pk=record.pk).sensor_id,
+                record.sensor_id,
+            )
+        self.assertIsNone(records[1].pk)
+
+    def test_recent_keys(self):
+        keys = RecentKeys(capacity=2)
+        keys.add_many(["a", "b"])
+        self.assertTrue(keys.seen("a"))
+        keys.add_many(["c"])
+        self.assertFalse(keys.seen("b"))
+        self.assertTrue(keys.seen("a"))
+        self.assertEqual(keys.stats(), {"hits": 2, "misses": 1, "size": 2})
+
+
+def crash_once_worker(index, directory):
+    """Supervisor target: worker 0 crashes on its first start."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    path = os.path.join(directory, f"{index}.starts")
+    with open(path, "a") as f:
+        f.write("x")
+    if index == 0 and os.path.getsize(path) == 1:
+        os._exit(1)
+    while not stop.wait(0.01):
+        pass
+    open(os.path.join(directory, f"{index}.drained"), "w").close()
+
+
+class SupervisorTest(SimpleTestCase):
+    def test_restart_and_graceful_shutdown(self):
+        with tempfile.TemporaryDirectory() as directory:
+            supervisor = Supervisor(
+                crash_once_worker,
+                2,
+                args=(directory,),
+                restart_delay=0,
+                shutdown_timeout=5,
+            )
+            thread = threading.Thread(
+                target=supervisor.run, kwargs={"handle_signals": False}
+            )
+            thread.start()
+
+            def starts(index):
+                path = os.path.join(directory, f"{index}.starts")
+                return os.path.getsize(path) if os.path.exists(path) else 0
+
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                if starts(0) == 2 and starts(1) == 1:
+                    break
+                time.sleep(0.05)
+            supervisor.stop()
+            thread.join(10)
+
+            self.assertEqual(supervisor.restarts, 1)
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                ["0.drained", "0.starts", "1.drained", "1.starts"],
+            )
+
+    def test_finite_workers_are_not_restarted(self):
+        supervisor = Supervisor(lambda index: None, 2, finite=True)
+        supervisor.run(handle_signals=False)
+        self.assertEqual(supervisor.restarts, 0)
+
+
+class CeleryPipelineTest(TransactionTestCase):
+    def setUp(self):
+        reset_caches()
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    def test_subscriber_enqueues_and_dead_letters(self):
+        batcher = MessageBatcher(
+            max_batch_size=10,
+            max_latency=60,
+            write=tasks.enqueue_records,
+            on_invalid=tasks.dead_letter_message,
+        )
+        messages = [
+            FakeMessage(make_envelope(sensor_id=1)),
+            FakeMessage(make_envelope(sensor_id="abc")),
+            FakeMessage(make_envelope(sensor_id=2)),
+        ]
+        for message in messages:
+            batcher(message)
+        self.assertEqual(batcher.flush(), 2)
+
+        self.assertTrue(all(m.acked and not m.nacked for m in messages))
+        self.assertEqual(SensorRecord.objects.count(), 2)
+        dead = DeadLetter.objects.get()
+        self.assertEqual(dead.reason, DeadLetter.INVALID)
+        self.assertEqual(
+            dead.error, {"sensor_id": ["A valid integer is required."]}
+        )
+        self.assertEqual(json.loads(dead.payload), make_envelope("abc"))
+
+    def rows(self, *sensor_ids):
+        return [
+            tasks.record_to_row(
+                SensorRecord(**decode_envelope(make_envelope(sensor_id=i)))
+            )
+            for i in sensor_ids
+        ]
+
+    def test_transient_error_retried(self):
+        calls = []
+
+        def flaky(records):
+            calls.append(len(records))
+            if len(calls) == 1:
+                raise OperationalError("connection refused")
+            return save_records(records)
+
+        with mock.patch("sensor.tasks.save_records", side_effect=flaky):
+            result = tasks.write_sensor_batch.delay(self.rows(1, 2))
+        self.assertEqual(result.get(), 2)
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(SensorRecord.objects.count(), 2)
+
+    @override_settings(SENSOR_WRITE_MAX_RETRIES=1)
+    def test_retries_exhausted(self):
+        with mock.patch(
+            "sensor.tasks.save_records",
+            side_effect=OperationalError("connection refused"),
+        ):
+            result = tasks.write_sensor_batch.delay(self.rows(1))
+        self.assertEqual(result.get(), 0)
+        self.assertEqual(
+            DeadLetter.objects.get().reason, DeadLetter.WRITE_FAILED
+        )
+
+    def test_bad_row_isolated(self):
+        def reject_sensor_13(records):
+            if any(record.sensor_id == 13 for record in records):
+                raise DataError("value out of range")
+            return save_records(records)
+
+        with mock.patch(
+            "sensor.tasks.save_records", side_effect=reject_sensor_13
+        ):
+            result = tasks.write_sensor_batch.delay(self.rows(1, 13, 2))
+        self.assertEqual(result.get(), 2)
+        self.assertEqual(
+            sorted(SensorRecord.objects.values_list("sensor_id", flat=True)),
+            [1, 2],
+        )
+        dead = DeadLetter.objects.get()
+        self.assertEqual(json.loads(dead.payload)["sensor_id"], 13)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        reset_caches()
+
+    def test_fleet_is_reproducible(self):
+        first = list(SensorFleet(sensors=5, seed=1).envelopes(20))
+        second = list(SensorFleet(sensors=5, seed=1).envelopes(20))
+        self.assertEqual(first, second)
+
+    def test_fleet_readings_decode(self):
+        fleet = SensorFleet(sensors=3)
+        rows = [
+            decode_envelope(json.dumps(envelope))
+            for envelope in fleet.envelopes(30)
+        ]
+        self.assertEqual(
+            {row["sensor_id"] for row in rows}, set(fleet.sensor_ids)
+        )
+        for row in rows:
+            if not row["human_presence"]:
+                self.assertEqual(row["dwell_time"], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {
+            "a": {"p95_ms": 10, "p99_ms": 20, "throughput": 100},
+            "b": {"p95_ms": 10, "p99_ms": 20, "throughput": 100},
+        }
+        results = {
+            "a": {"p95_ms": 11, "p99_ms": 21, "throughput": 95},
+            "b": {"p95_ms": 10, "p99_ms": 20, "throughput": 70},
+            "c": {"p95_ms": 99, "p99_ms": 99, "throughput": 1},
+        }
+        rows = benchmarks.compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            [(row["name"], row["metric"]) for row in rows if row["regressed"]],
+            [("b", "throughput")],
+        )
+
+    def test_workloads(self):
+        fleet = SensorFleet(sensors=4)
+        summary = benchmarks.bench_process_sensor_data(fleet, 10)
+        self.assertEqual(summary["count"], 10)
+        self.assertEqual(summary["errors"], 0)
+        self.assertEqual(SensorRecord.objects.count(), 10)
+
+        benchmarks.seed(fleet, 50)
+        self.assertEqual(SensorRecord.objects.count(), 50)
+        for path, params in benchmarks.query_shapes(fleet).values():
+            summary = benchmarks.bench_query(path, params, repeat=2)
+            self.assertEqual(summary["errors"], 0, path)
+        self.assertLessEqual(summary["p50_ms"], summary["p99_ms"])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def test_render(self):
+        registry = Registry()
+        counter = Counter("c_total", "A counter.", ["kind"], registry=registry)
+        histogram = Histogram(
+            "h_seconds", "A histogram.", buckets=(0.1, 1), registry=registry
+        )
+        counter.labels(kind='say "hi"').inc(2)
+        for value in (0.05, 0.5, 5):
+            histogram.labels().observe(value)
+        self.assertEqual(
+            registry.render().splitlines(),
+            [
+                "# HELP c_total A counter.",
+                "# TYPE c_total counter",
+                'c_total{kind="say \\"hi\\""} 2',
+                "# HELP h_seconds A histogram.",
+                "# TYPE h_seconds histogram",
+                'h_seconds_bucket{le="0.1"} 1',
+                'h_seconds_bucket{le="1"} 2',
+                'h_seconds_bucket{le="+Inf"} 3',
+                "h_seconds_sum 5.55",
+                "h_seconds_count 3",
+            ],
+        )
+
+    def test_endpoint(self):
+        accepted = metrics.HTTP_MESSAGES["accepted"]
+        invalid = metrics.HTTP_MESSAGES["invalid"]
+        before = accepted.get(), invalid.get(), sum(metrics.WRITE.counts)
+        self.client.post("/api/sensor/", make_envelope(), format="json")
+        self.client.post(
+            "/api/sensor/", make_envelope(sensor_id="x"), format="json"
+        )
+        self.assertEqual(accepted.get(), before[0] + 1)
+        self.assertEqual(invalid.get(), before[1] + 1)
+        self.assertEqual(sum(metrics.WRITE.counts), before[2] + 1)
+
+        response = self.client.get("/metrics/")
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn(
+            'sensor_messages_total{source="http",outcome="accepted"} '
+            f"{int(accepted.get())}",
+            body,
+        )
+        self.assertIn('sensor_stage_seconds_count{stage="decode"}', body)
+        self.assertIn('sensor_queue_depth{queue="batcher"}', body)
+
+    def test_process_sensor_data(self):
+        acked, nacked = metrics.ACKED.get(), metrics.NACKED.get()
+        invalid = metrics.PUBSUB_MESSAGES["invalid"].get()
+        for sensor_id in (1, "x"):
+            message = FakeMessage(make_envelope(sensor_id=sensor_id))
+            message.message_id = str(sensor_id)
+            tasks.process_sensor_data(message)
+        # Malformed envelopes are dead-lettered, not redelivered.
+        for envelope in ({}, {"message": {}}, []):
+            message = FakeMessage(envelope)
+            message.message_id = None
+            tasks.process_sensor_data(message)
+        self.assertEqual(metrics.ACKED.get(), acked + 5)
+        self.assertEqual(metrics.NACKED.get(), nacked)
+        self.assertEqual(
+            metrics.PUBSUB_MESSAGES["invalid"].get(), invalid + 4
+        )
+        self.assertEqual(
+            DeadLetter.objects.filter(reason=DeadLetter.INVALID).count(), 4
+        )
+
+
+class BackfillTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = os.path.join(directory.name, "sensor.ndjson.gz")
+        self.checkpoint = os.path.join(directory.name, "checkpoint.json")
+        envelopes = [
+            make_envelope(sensor_id=i, time=f"2022-11-08T04:00:0{i}+00:00")
+            for i in range(1, 4)
+        ]
+        with gzip.open(self.archive, "wt") as f:
+            for envelope in envelopes:
+                f.write(json.dumps(envelope) + "\n")
+            f.write("\n{}\n")
+        row = decode_envelope(envelopes[0])
+        save_records([SensorRecord(**row)])
+
+    def backfill(self, **options):
+        call_command(
+            "backfill",
+            self.archive,
+            workers=1,
+            chunk_size=2,
+            checkpoint=self.checkpoint,
+            stdout=StringIO(),
+            **options,
+        )
+
+    def test_load(self):
+        self.backfill()
+        self.assertEqual(
+            sorted(SensorRecord.objects.values_list("sensor_id", flat=True)),
+            [1, 2, 3],
+        )
+        self.assertEqual(DeadLetter.objects.get().payload, "{}\n")
+        self.assertEqual(SensorMinuteRollup.objects.count(), 3)
+        with open(self.checkpoint) as f:
+            self.assertEqual(list(json.load(f)["files"].values()), [5])
+
+        # Resuming from a complete checkpoint loads nothing again.
+        self.backfill()
+        self.assertEqual(SensorRecord.objects.count(), 3)
+        self.assertEqual(DeadLetter.objects.count(), 1)
+
+    def test_defer_indexes(self):
+        def indexes():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = %s",
+                    [SensorRecord._meta.db_table],
+                )
+                return sorted(row[0] for row in cursor.fetchall())
+
+        before = indexes()
+        self.backfill(defer_indexes=True)
+        self.assertEqual(indexes(), before)
+        self.assertEqual(SensorRecord.objects.count(), 3)
+
+
+class PresenceSessionTest(TestCase):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def setUp(self):
+        reset_caches()
+
+    def ingest(self, *readings, sensor_id=1):
+        """Save ``(second, present, dwell)`` readings in one batch."""
+        save_records(
+            [
+                SensorRecord(
+                    sensor_id=sensor_id,
+                    human_presence=present,
+                    dwell_time=dwell,
+                    timestamp=self.start + timedelta(seconds=second),
+                )
+                for second, present, dwell in readings
+            ]
+        )
+
+    def sessions(self):
+        return [
+            (
+                session.sensor_id,
+                (session.start - self.start).total_seconds(),
+                (session.end - self.start).total_seconds(),
+                session.readings,
+                session.peak_dwell,
+                session.open,
+            )
+            for session in PresenceSession.objects.order_by(
+                "sensor_id", "start"
+            )
+        ]
+
+    def test_incremental(self):
+        self.ingest((0, True, 1.0), (10, True, 5.0))
+        self.ingest((20, False, 0.0), (30, True, 2.0))
+        self.ingest((40, True, 3.0))
+        self.assertEqual(
+            self.sessions(),
+            [(1, 0, 10, 2, 5.0, False), (1, 30, 40, 2, 3.0, True)],
+        )
+        state = SessionState.objects.get(sensor_id=1)
+        self.assertEqual(state.session.start, self.start + timedelta(0, 30))
+
+    def test_late_readings(self):
+        self.ingest((0, True, 1.0), (20, True, 2.0), (40, True, 3.0))
+        # A late absence splits the visit.
+        self.ingest((30, False, 0.0))
+        self.assertEqual(
+            self.sessions(),
+            [(1, 0, 20, 2, 2.0, False), (1, 40, 40, 1, 3.0, True)],
+        )
+        # A late presence in the gap joins the visit that follows it.
+        self.ingest((35, True, 9.0))
+        self.assertEqual(
+            self.sessions(),
+            [(1, 0, 20, 2, 2.0, False), (1, 35, 40, 2, 9.0, True)],
+        )
+
+    @override_settings(SENSOR_EXPORT_CHUNK_SIZE=5)
+    def test_late_readings_replay_one_session(self):
+        visits = [(20 * i, True, 1.0) for i in range(200)]
+        gaps = [(20 * i + 10, False, 0.0) for i in range(200)]
+        self.ingest(*sorted(visits + gaps))
+        self.ingest(*sorted(visits[:2] + gaps[:2]), sensor_id=2)
+        untouched = PresenceSession.objects.filter(
+            sensor_id=1, start__gte=self.start + timedelta(seconds=2000)
+        )
+        pks = sorted(untouched.values_list("pk", flat=True))
+        with CaptureQueriesContext(connection) as short:
+            self.ingest((5, True, 2.0), sensor_id=2)
+
+        # However long the history, a late reading only replays the
+        # visit it falls in.
+        for i in range(100):
+            present = i % 2 == 0
+            with self.assertNumQueries(len(short)):
+                self.ingest((20 * i + 5, present, 2.0 if present else 0.0))
+        self.assertEqual(
+            self.sessions()[:3],
+            [
+                (1, 0, 5, 2, 2.0, False),
+                (1, 20, 20, 1, 1.0, False),
+                (1, 40, 45, 2, 2.0, False),
+            ],
+        )
+        self.assertEqual(
+            sorted(untouched.values_list("pk", flat=True)), pks
+        )
+
+    def test_matches_rebuild(self):
+        records = list(SensorFleet(sensors=3, mean_stay=4).records(300))
+        blocks = [records[i:i + 20] for i in range(0, len(records), 20)]
+        random.Random(0).shuffle(blocks)
+        for block in blocks:
+            save_records(block)
+        incremental = self.sessions()
+        self.assertTrue(incremental)
+
+        call_command("rebuild_sessions", stdout=StringIO())
+        self.assertEqual(self.sessions(), incremental)
+
+    def test_endpoint(self):
+        self.ingest((0, True, 1.0), (10, False, 0.0), (20, True, 2.0))
+        self.ingest((0, True, 1.0), sensor_id=2)
+        response = APIClient().get(
+            "/api/sensor/sessions/", {"sensor_id": "1", "open": "false"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["data"][0]["duration"], 0.0)
+        response = APIClient().get("/api/sensor/sessions/", {"open": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ServingTest(TestCase):
+    def test_connection_budget(self):
+        with self.settings(SERVE_MAX_DB_CONNECTIONS=16):
+            self.assertEqual(connection_budget(4, 4), 16)
+            with self.assertRaises(ValueError):
+                connection_budget(5, 4)
+
+    def test_shared_cache(self):
+        locmem = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+            }
+        }
+        with self.settings(CACHES=locmem):
+            shared_cache(1)
+            with self.assertRaisesRegex(ValueError, "default cache"):
+                shared_cache(2)
+        database = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                "LOCATION": "sensor_cache",
+            }
+        }
+        with self.settings(CACHES=database):
+            shared_cache(4)
+
+    def test_warm_up_opens_a_connection_per_thread(self):
+        max_age = connection.settings_dict["CONN_MAX_AGE"]
+        self.addCleanup(
+            connection.settings_dict.__setitem__, "CONN_MAX_AGE", max_age
+        )
+        with ThreadPoolExecutor(3) as executor:
+            connection.settings_dict["CONN_MAX_AGE"] = 0
+            self.assertEqual(warm_up(executor, 3), 0)
+
+            connection.settings_dict["CONN_MAX_AGE"] = 60
+            self.assertEqual(warm_up(executor, 3), 3)
+            opened = on_threads(
+                executor, 3, lambda: connection.connection is not None
+            )
+            self.assertEqual(opened, [True] * 3)
+            on_threads(executor, 3, lambda: connection.close())
+
+
+class ReplaySourceTest(TransactionTestCase):
+    def setUp(self):
+        reset_caches()
+
+    def replay(self, source):
+        """Run ``source`` to the end, acking every message."""
+        messages = []
+
+        def callback(message):
+            messages.append(message)
+            message.ack()
+
+        source.subscribe(callback).result(timeout=10)
+        return messages
+
+    def test_subscriber_replays_to_the_end(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        envelopes = [
+            json.dumps(envelope)
+            for envelope in SensorFleet(sensors=5).envelopes(50)
+        ]
+        envelopes.insert(10, json.dumps(make_envelope(sensor_id="abc")))
+        source = ReplaySource(envelopes, max_messages=8)
+
+        tasks.start_subscriber(source, max_batch_size=20, max_latency=0.01)
+
+        self.assertEqual(SensorRecord.objects.count(), 50)
+        self.assertEqual(
+            (source.delivered, source.acked, source.nacked), (51, 50, 1)
+        )
+        self.assertEqual(len(source.latencies), 51)
+
+    def test_speed_and_shard(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        envelopes = [
+            json.dumps(
+                {
+                    "message": {
+                        "data": "",
+                        "messageId": str(i),
+                        "publishTime": str(start + timedelta(seconds=2 * i)),
+                    }
+                }
+            )
+            for i in range(4)
+        ]
+        source = ReplaySource(envelopes, speed=20, shard=(1, 2))
+        messages = self.replay(source)
+        self.assertEqual(
+            [json.loads(m.data)["message"]["messageId"] for m in messages],
+            ["1", "3"],
+        )
+        # Published two seconds apart, replayed at 20x.
+        self.assertGreaterEqual(source.elapsed, 0.09)
+        self.assertEqual(len(self.replay(ReplaySource(envelopes))), 4)
+
+    def test_tasks_import_without_pubsub(self):
+        code = (
+            "import sys, django; django.setup(); import sensor.tasks; "
+            "print('google.cloud.pubsub_v1' in sys.modules)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(output.strip(), "False")
+
+
+class DownsampleTest(TestCase):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def rows(self, count):
+        """A presence reading every minute: 50 min on, 50 min off, with a
+        one-minute dropout at minute 20 of each visit and a dwell spike.
+        """
+        for i in range(count):
+            present = i % 100 < 50 and i % 100 != 20
+            dwell = 500.0 if i == 1234 else float(i % 100 if present else 0)
+            yield self.start + timedelta(minutes=i), dwell, present
+
+    def test_bounded_and_shape_preserving(self):
+        end = self.start + timedelta(minutes=10000)
+        for method in ("lttb", "minmax"):
+            result = downsample(self.rows(10000), self.start, end, 100, method)
+            self.assertEqual(result["readings"], 10000)
+            dwell = result["dwell_time"]
+            self.assertLessEqual(len(dwell), 100)
+            self.assertEqual(dwell, sorted(dwell))
+            self.assertIn((self.start + timedelta(minutes=1234), 500.0), dwell)
+        self.assertEqual(dwell[0][0], self.start)
+        presence = result["human_presence"]
+        self.assertLessEqual(len(presence), 100)
+
+        # With buckets shorter than a visit, every visit starts and
+        # ends on time; the one-minute dropouts may be dropped.
+        result = downsample(self.rows(10000), self.start, end, 1000)
+        presence = result["human_presence"]
+        self.assertLessEqual(len(presence), 1000)
+        values = [value for _, value in presence]
+        self.assertEqual(values, [True, False] * (len(values) // 2))
+        timestamps = {timestamp for timestamp, _ in presence}
+        for visit in range(100):
+            minute = visit * 100
+            self.assertIn(self.start + timedelta(minutes=minute), timestamps)
+            self.assertIn(
+                self.start + timedelta(minutes=minute + 50), timestamps
+            )
+
+    def test_short_range_is_not_reduced(self):
+        end = self.start + timedelta(minutes=30)
+        result = downsample(self.rows(30), self.start, end, 100)
+        self.assertEqual(len(result["dwell_time"]), 30)
+        self.assertEqual(
+            [value for _, value in result["human_presence"]],
+            [True, False, True],
+        )
+
+    def test_endpoint(self):
+        SensorRecord.objects.bulk_create(
+            SensorRecord(
+                sensor_id=1,
+                timestamp=timestamp,
+                dwell_time=dwell,
+                human_presence=present,
+            )
+            for timestamp, dwell, present in self.rows(3000)
+        )
+        params = {
+            "sensor_id": 1,
+            "start_time": self.start.isoformat(),
+            "end_time": (self.start + timedelta(days=3)).isoformat(),
+            "points": 200,
+        }
+        response = self.client.get("/api/sensor/series/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["readings"], 3000)
+        self.assertLessEqual(len(response.data["dwell_time"]), 200)
+        self.assertLessEqual(len(response.data["human_presence"]), 200)
+
+        for invalid in (
+            {"points": 2},
+            {"method": "mean"},
+            {"sensor_id": "1,2"},
+            {"end_time": ""},
+        ):
+            response = self.client.get(
+                "/api/sensor/series/", {**params, **invalid}
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, invalid
+            )
+
+
+class BackpressureTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.url = "/api/sensor/"
+
+    def post(self, **kwargs):
+        return self.client.post(
+            self.url, make_envelope(**kwargs), format="json"
+        )
+
+    def test_limit_adapts_to_latency(self):
+        gate = PressureGate("test", 8, target_latency=0.1)
+        with gate.write():
+            pass
+        self.assertEqual(gate.state()["state"], "ok")
+
+        for _ in range(3):
+            self.assertTrue(gate.try_acquire())
+        # Writes already in flight report the same slowdown once.
+        gate.release(latency=0.5)
+        gate.release(latency=0.5)
+        self.assertEqual(gate.limit, 4)
+        gate.release(latency=0.01)
+        self.assertEqual(gate.limit, 4.25)
+        self.assertEqual(gate.state()["state"], "degraded")
+
+    @override_settings(SENSOR_MAX_IN_FLIGHT_WRITES=2)
+    def test_busy_then_slow(self):
+        gate = pressure.gate("http")
+        gate.try_acquire(2)
+        response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+        # A slow write lowers the limit to the one still in flight.
+        gate.release(latency=10)
+        response = self.post()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(SensorRecord.objects.count(), 0)
+        self.assertEqual(gate.state()["shed"], 2)
+
+        gate.release()
+        self.assertEqual(self.post().status_code, 201)
+
+    def test_database_error_is_retryable(self):
+        with mock.patch(
+            "sensor.views.save_records",
+            side_effect=OperationalError("server closed the connection"),
+        ):
+            response = self.client.post(
+                "/api/sensor/batch/", [make_envelope()], format="json"
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(pressure.gate("http").in_flight, 0)
+
+    @override_settings(SENSOR_WRITE_LATENCY_TARGET=0.05)
+    def test_slow_database_degrades(self):
+        with benchmarks.slow_database(0.1, match="INSERT"):
+            self.assertEqual(self.post().status_code, 201)
+        response = self.client.get("/api/sensor/pressure/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["state"], "degraded")
+        http = response.data["gates"]["http"]
+        self.assertEqual(http["in_flight"], 0)
+        self.assertLess(http["limit"], http["max_in_flight"])
+        self.assertEqual(response.data["gates"]["async"]["state"], "ok")
+
+
+class SpoolTest(TestCase):
+    def setUp(self):
+        reset_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def open_spool(self, segment_bytes=4096):
+        return Spool(
+            self.directory, segment_bytes, seal_age=60, max_bytes=10**6
+        )
+
+    def records(self, count, start=0):
+        return [
+            SensorRecord(**decode_envelope(make_envelope(sensor_id=i)))
+            for i in range(start, start + count)
+        ]
+
+    def test_drain_in_order(self):
+        spool_ = self.open_spool(segment_bytes=500)
+        records = self.records(40)
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda r: spool_.append([r]), records))
+        spool_.close()
+        segments = spool_.segments()
+        self.assertGreater(len(segments), 1)
+        spooled = [r for path in segments for r in read_segment(path)[0]]
+        self.assertCountEqual(
+            [r.sensor_id for r in spooled], [r.sensor_id for r in records]
+        )
+
+        drained = metrics.SPOOL_DRAINED.labels().get()
+        self.assertEqual(SpoolDrainer(spool_).drain(), 40)
+        self.assertEqual(SensorRecord.objects.count(), 40)
+        self.assertEqual(spool_.segments(), [])
+        self.assertEqual(metrics.SPOOL_DRAINED.labels().get(), drained + 40)
+        # A segment loaded again after a crash only holds duplicates.
+        spool_.append(records[:5])
+        spool_.close()
+        self.assertEqual(SpoolDrainer(spool_).drain(), 0)
+
+    def test_recovers_segments_of_dead_processes(self):
+        live = self.open_spool()
+        live.append(self.records(2, start=100))
+        dead = self.open_spool()
+        dead.append(self.records(3))
+        # Die halfway through a write: the lock goes with the process.
+        segment = dead._segment
+        os.write(segment.fd, spool.encode(self.records(1, start=3)[0])[:20])
+        os.close(segment.fd)
+
+        recovered = self.open_spool()
+        self.assertEqual(len(recovered.segments()), 1)
+        self.assertEqual(SpoolDrainer(recovered).drain(), 3)
+        self.assertEqual(
+            sorted(SensorRecord.objects.values_list("sensor_id", flat=True)),
+            [0, 1, 2],
+        )
+        live.close()
+        self.assertEqual(SpoolDrainer(recovered).drain(), 2)
+
+    def test_recover_while_creating_a_segment(self):
+        writer = self.open_spool()
+        other = self.open_spool()
+        flock = fcntl.flock
+        races = []
+
+        def recover_first(fd, operation):
+            # Another process recovers and drains before the lock is
+            # taken.
+            if operation == fcntl.LOCK_EX and not races:
+                races.append(other.recover())
+                SpoolDrainer(other).drain()
+            flock(fd, operation)
+
+        with mock.patch("sensor.spool.fcntl.flock", recover_first):
+            writer.append(self.records(3))
+        self.assertEqual(races, [0])
+        self.assertEqual(other.recover(), 0)
+        writer.close()
+        self.assertEqual(SpoolDrainer(other).drain(), 3)
+
+        # A process that died creating a segment leaves it empty.
+        abandoned = os.path.join(self.directory, "0-1" + spool.CREATING)
+        open(abandoned, "w").close()
+        other.recover()
+        self.assertTrue(os.path.exists(abandoned))
+        os.utime(abandoned, (0, 0))
+        other.recover()
+        self.assertFalse(os.path.exists(abandoned))
+
+    def test_push_spooled_while_database_unavailable(self):
+        with self.settings(
+            SENSOR_SPOOL_DIR=self.directory, SENSOR_SPOOL_DRAIN_INTERVAL=0
+        ), mock.patch(
+            "sensor.views.save_records",
+            side_effect=OperationalError("server closed the connection"),
+        ):
+            response = APIClient().post(
+                "/api/sensor/", make_envelope(), format="json"
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(metrics.SPOOL_SEGMENTS.labels().get(), 1)
+            spool.reset()
+
+            out = StringIO()
+            call_command("drain_spool", once=True, stdout=out)
+        self.assertIn("1 records created", out.getvalue())
+        self.assertEqual(SensorRecord.objects.count(), 1)
@@ -2,8 +2,58 @@
 
 from django.urls import path
 
-from .views import SensorRecordView
+from .views import (
+    SensorAggregateView,
+    SensorExportView,
+    SensorLatestView,
+    SensorPressureView,
+    SensorRecordAsyncView,
+    SensorRecordBatchView,
+    SensorRecordView,
+    SensorSeriesView,
+    SensorSessionView,
+)
 
 urlpatterns = [
     path("sensor/", SensorRecordView.as_view(), name="sensor"),
+    path(
+        "sensor/async/",
+        SensorRecordAsyncView.as_view(),
+        name="sensor-async",
+    ),
+    path(
+        "sensor/batch/",
+        SensorRecordBatchView.as_view(),
+        name="sensor-batch",
+    ),
+    path(
+        "sensor/aggregate/",
+        SensorAggregateView.as_view(),
+        name="sensor-aggregate",
+    ),
+    path(
+        "sensor/export/",
+        SensorExportView.as_view(),
+        name="sensor-export",
+    ),
+    path(
+        "sensor/latest/",
+        SensorLatestView.as_view(),
+        name="sensor-latest",
+    ),
+    path(
+        "sensor/pressure/",
+        SensorPressureView.as_view(),
+        name="sensor-pressure",
+    ),
+    path(
+        "sensor/series/",
+        SensorSeriesView.as_view(),
+        name="sensor-series",
+    ),
+    path(
+        "sensor/sessions/",
+        SensorSessionView.as_view(),
+        name="sensor-sessions",
+    ),
 ]
@@ -1,22 +1,102 @@
 """Sensor data views."""
 
-import base64
 import binascii
 import json
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.http import Http404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from core.constants import DEFAULT_SWAGGER_DATA_VALUE
 
+from . import latest, metrics, pressure, spool
+from .async_ingest import write
+from .decoder import InvalidRecord, decode_envelope, decode_many, error_detail
+from .downsample import METHODS
+from .ingest import save_records
 from .models import SensorRecord
-from .serializers import SensorRecordSerializer
+from .pagination import paginate_by_cursor
+from .pressure import TRANSIENT_ERRORS, Overloaded
+from .queries import (
+    BUCKETS,
+    SOURCES,
+    aggregate_records,
+    downsample_series,
+    filter_records,
+    filter_sessions,
+    parse_sensor_ids,
+)
+from .renderers import (
+    RECORD_FIELDS,
+    ColumnarJSONRenderer,
+    CSVRenderer,
+    MessagePackRenderer,
+    NDJSONRenderer,
+    rows_to_columns,
+    rows_to_records,
+)
+from .response_cache import cache_response
+from .serializers import PresenceSessionSerializer
+
+ENVELOPE_SCHEMA = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "message": openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "attributes": openapi.Schema(type=openapi.TYPE_OBJECT),
+                "data": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    default=DEFAULT_SWAGGER_DATA_VALUE,
+                ),
+                "messageId": openapi.Schema(type=openapi.TYPE_STRING),
+                "message_id": openapi.Schema(type=openapi.TYPE_STRING),
+                "publishTime": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    format=openapi.FORMAT_DATETIME,
+                ),
+                "publish_time": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    format=openapi.FORMAT_DATETIME,
+                ),
+            },
+            required=["data"],
+        ),
+        "subscription": openapi.Schema(type=openapi.TYPE_STRING),
+    },
+    required=["message"],
+)
+
+
+SPOOLED = {"message": "Data spooled; it will be saved shortly."}
+
+
+def retry_later(error, status_code, retry_after, response_class=Response):
+    """Refuse a push for now, telling Pub/Sub when to redeliver it.
+
+    Pub/Sub backs off on 429 and 503; ``Retry-After`` tells other
+    clients how long to wait.
+    """
+    return response_class(
+        {"error": str(error)},
+        status=status_code,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def row_position(row):
+    """Return ``(timestamp, id)`` of a ``values_list(*RECORD_FIELDS)`` row."""
+    return row[4], row[0]
 
 
 class SensorRecordView(APIView):
@@ -26,93 +106,86 @@ class SensorRecordView(APIView):
     data.
     """
 
-    @swagger_auto_schema(
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            properties={
-                "message": openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        "attributes": openapi.Schema(type=openapi.TYPE_OBJECT),
-                        "data": openapi.Schema(
-                            type=openapi.TYPE_STRING,
-                            default=DEFAULT_SWAGGER_DATA_VALUE,
-                        ),
-                        "messageId": openapi.Schema(type=openapi.TYPE_STRING),
-                        "message_id": openapi.Schema(type=openapi.TYPE_STRING),
-                        "publishTime": openapi.Schema(
-                            type=openapi.TYPE_STRING,
-                            format=openapi.FORMAT_DATETIME,
-                        ),
-                        "publish_time": openapi.Schema(
-                            type=openapi.TYPE_STRING,
-                            format=openapi.FORMAT_DATETIME,
-                        ),
-                    },
-                    required=["data"],
-                ),
-                "subscription": openapi.Schema(type=openapi.TYPE_STRING),
-            },
-            required=["message"],
-        ),
-    )
+    renderer_classes = [
+        *api_settings.DEFAULT_RENDERER_CLASSES,
+        ColumnarJSONRenderer,
+        MessagePackRenderer,
+    ]
+
+    @swagger_auto_schema(request_body=ENVELOPE_SCHEMA)
+    @metrics.POST_HANDLER.time()
     def post(self, request):
         """Create new sensor data records.
 
         Decodes base64-encoded sensor data from the request,
-        validates it, and saves it to the database.
+        validates it, and saves it to the database. Validation errors
+        are reported per field, as ``SensorRecordSerializer`` does.
+        A redelivered message is acknowledged with 200 without being
+        stored again. A reading the database cannot take right now is
+        spooled, if a spool is configured, and acknowledged with 202.
         Args:
             request (rest_framework.request.Request): The HTTP request object.
         Returns:
             rest_framework.response.Response:
             A response indicating success or failure.
         """
+        gate = pressure.gate("http")
         try:
-            data = request.data
-            decoded_data = base64.b64decode(data["message"]["data"]).decode(
-                "utf-8"
-            )
-            sensor_data = json.loads(decoded_data)
-
-            serializer = SensorRecordSerializer(
-                data={
-                    "sensor_id": sensor_data["v0"],
-                    "human_presence": bool(sensor_data["v11"]),
-                    "dwell_time": sensor_data["v18"],
-                    "timestamp": sensor_data["Time"],
-                }
+            record = SensorRecord(**decode_envelope(request.data))
+            with gate.write():
+                save_records([record])
+            metrics.record_saved(metrics.HTTP_MESSAGES, [record])
+            if record.pk is None:
+                return Response({"message": "Duplicate message ignored."})
+            return Response(
+                {"message": "Data saved successfully!"},
+                status=status.HTTP_201_CREATED,
             )
-            if serializer.is_valid():
-                # validated_data.append(serializer.validated_data)
-                serializer.save()
-                return Response(
-                    {"message": "Data saved successfully!"},
-                    status=status.HTTP_201_CREATED,
-                )
-            else:
-                return Response(
-                    serializer.errors, status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # SensorRecord.objects.bulk_create(
-            #     [SensorRecord(**data) for data in validated_data]
-            # )
 
+        except InvalidRecord as e:
+            metrics.HTTP_MESSAGES["invalid"].inc()
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
         except json.JSONDecodeError as e:
+            metrics.HTTP_MESSAGES["invalid"].inc()
             return Response(
                 {"error": f"Invalid JSON data: {e}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         except binascii.Error as e:
+            metrics.HTTP_MESSAGES["invalid"].inc()
             return Response(
                 {"error": f"Invalid base64-encoded string: {e}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        except (KeyError, TypeError, ValueError) as e:
+            # A malformed envelope: redelivering it cannot succeed.
+            metrics.HTTP_MESSAGES["invalid"].inc()
+            return Response(
+                {"error": error_detail(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Overloaded as e:
+            if spool.spool_records([record]):
+                metrics.HTTP_MESSAGES["spooled"].inc()
+                return Response(SPOOLED, status=status.HTTP_202_ACCEPTED)
+            metrics.HTTP_MESSAGES["shed"].inc()
+            return retry_later(e, e.status, e.retry_after)
+        except TRANSIENT_ERRORS as e:
+            if spool.spool_records([record]):
+                metrics.HTTP_MESSAGES["spooled"].inc()
+                return Response(SPOOLED, status=status.HTTP_202_ACCEPTED)
+            metrics.HTTP_MESSAGES["error"].inc()
+            return retry_later(
+                e, status.HTTP_503_SERVICE_UNAVAILABLE, gate.retry_after()
+            )
         except Exception as e:
+            metrics.HTTP_MESSAGES["error"].inc()
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @metrics.GET_HANDLER.time()
+    @cache_response
     def get(self, request):
         """Retrieve sensor data.
 
@@ -122,7 +195,17 @@ class SensorRecordView(APIView):
                                         (ISO 8601 format);
             - end_time (optional): Filter by end timestamp (ISO 8601 format);
             - page (optional): Page number for pagination;
-            - page_size (optional): Number of items per page.
+            - page_size (optional): Number of items per page;
+            - cursor (optional): Switches to keyset pagination. Pass an
+                                 empty value for the first page, then the
+                                 ``next``/``prev`` cursor of a response.
+
+        Besides JSON, the data can be requested in a columnar layout
+        (``{"sensor_id": [...], ...}``) as
+        ``application/vnd.sensor.columnar+json`` or
+        ``application/msgpack``, through the Accept header or
+        ``?format=columnar|msgpack``. Responses are cached and carry
+        an ``ETag``; see ``sensor.response_cache``.
         Args:
             request (rest_framework.request.Request): The HTTP request object.
         Returns:
@@ -130,31 +213,38 @@ class SensorRecordView(APIView):
             A response containing paginated sensor data.
         """
         try:
-            sensor_id = request.GET.get("sensor_id")
-            start_time = request.GET.get("start_time")
-            end_time = request.GET.get("end_time")
-            page = int(request.GET.get("page", 1))
             page_size = int(request.GET.get("page_size", 20))
+            queryset = filter_records(request.GET).values_list(*RECORD_FIELDS)
+            if getattr(request.accepted_renderer, "columnar", False):
+                layout = rows_to_columns
+            else:
+                layout = rows_to_records
 
-            queryset = SensorRecord.objects.all()
-
-            if sensor_id:
-                queryset = queryset.filter(sensor_id=sensor_id)
-            if start_time and end_time:
-                queryset = queryset.filter(
-                    timestamp__range=[start_time, end_time]
+            if "cursor" in request.GET:
+                rows, next_cursor, prev_cursor = paginate_by_cursor(
+                    queryset,
+                    request.GET["cursor"],
+                    page_size,
+                    position=row_position,
+                )
+                return Response(
+                    {
+                        "data": layout(rows),
+                        "next": next_cursor,
+                        "prev": prev_cursor,
+                    }
                 )
 
+            page = int(request.GET.get("page", 1))
             paginator = Paginator(queryset, page_size)
             try:
                 page_obj = paginator.page(page)
             except Exception:
                 raise Http404("Invalid page number")
 
-            serializer = SensorRecordSerializer(page_obj, many=True)
             return Response(
                 {
-                    "data": serializer.data,
+                    "data": layout(page_obj.object_list),
                 }
             )
 
@@ -174,3 +264,595 @@ class SensorRecordView(APIView):
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class SensorRecordAsyncView(View):
+    """Async variant of ``SensorRecordView.post`` for the ASGI app.
+
+    The envelope is decoded on the event loop and the record is handed
+    to the process's ``AsyncBatchWriter``, so a pending write does not
+    hold a worker thread. The response is only sent once the record has
+    committed, which makes it safe to acknowledge Pub/Sub pushes with.
+    """
+
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        """Create a sensor data record.
+
+        Args:
+            request (django.http.HttpRequest): The HTTP request object.
+        Returns:
+            django.http.JsonResponse:
+            A response indicating success or failure, with the same
+            bodies and status codes as ``SensorRecordView.post``.
+        """
+        with metrics.ASYNC_POST_HANDLER.time():
+            return await self.create(request)
+
+    async def create(self, request):
+        try:
+            record = SensorRecord(**decode_envelope(request.body))
+        except InvalidRecord as e:
+            metrics.ASYNC_MESSAGES["invalid"].inc()
+            return JsonResponse(e.errors, status=status.HTTP_400_BAD_REQUEST)
+        except json.JSONDecodeError as e:
+            metrics.ASYNC_MESSAGES["invalid"].inc()
+            return JsonResponse(
+                {"error": f"Invalid JSON data: {e}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except binascii.Error as e:
+            metrics.ASYNC_MESSAGES["invalid"].inc()
+            return JsonResponse(
+                {"error": f"Invalid base64-encoded string: {e}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            metrics.ASYNC_MESSAGES["invalid"].inc()
+            return JsonResponse(
+                {"error": error_detail(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        gate = pressure.gate("async")
+        try:
+            with gate.write():
+                await write(record)
+        except Overloaded as e:
+            metrics.ASYNC_MESSAGES["shed"].inc()
+            return retry_later(e, e.status, e.retry_after, JsonResponse)
+        except TRANSIENT_ERRORS as e:
+            metrics.ASYNC_MESSAGES["error"].inc()
+            return retry_later(
+                e,
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                gate.retry_after(),
+                JsonResponse,
+            )
+        except Exception as e:
+            metrics.ASYNC_MESSAGES["error"].inc()
+            return JsonResponse(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        metrics.record_saved(metrics.ASYNC_MESSAGES, [record])
+        if record.pk is None:
+            return JsonResponse({"message": "Duplicate message ignored."})
+        return JsonResponse(
+            {"message": "Data saved successfully!"},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class SensorRecordBatchView(APIView):
+    """API view for ingesting many sensor records in one request.
+
+    Every envelope is decoded and validated on its own so that a bad
+    payload only fails its own item; the valid records are written in
+    batched INSERTs that skip redelivered messages.
+    """
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY, items=ENVELOPE_SCHEMA
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "batch_size",
+                openapi.IN_QUERY,
+                description="Number of rows per INSERT statement.",
+                type=openapi.TYPE_INTEGER,
+            )
+        ],
+    )
+    @metrics.BATCH_POST_HANDLER.time()
+    def post(self, request):
+        """Create sensor data records from a list of push envelopes.
+
+        Query parameters:
+            - batch_size (optional): Number of rows written per INSERT.
+        Args:
+            request (rest_framework.request.Request): The HTTP request object.
+        Returns:
+            rest_framework.response.Response:
+            A per-item status report: ``created``, ``duplicate`` or
+            ``invalid``. The status code is 201 when no item was invalid,
+            207 when only some were and 400 when all were.
+        """
+        envelopes = request.data
+        if not isinstance(envelopes, list):
+            return Response(
+                {"error": "Expected a list of push envelopes."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(envelopes) > settings.SENSOR_BATCH_MAX_ITEMS:
+            return Response(
+                {
+                    "error": "A batch may hold at most "
+                    f"{settings.SENSOR_BATCH_MAX_ITEMS} envelopes."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            batch_size = int(
+                request.GET.get(
+                    "batch_size", settings.SENSOR_BULK_CREATE_BATCH_SIZE
+                )
+            )
+            if batch_size < 1:
+                raise ValueError("batch_size must be a positive integer.")
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = []
+        records = []
+        for index, (row, error) in enumerate(decode_many(envelopes)):
+            if error is None:
+                records.append(SensorRecord(**row))
+                results.append({"index": index})
+            else:
+                results.append(
+                    {
+                        "index": index,
+                        "status": "invalid",
+                        "error": error_detail(error),
+                    }
+                )
+
+        metrics.BATCH_MESSAGES["invalid"].inc(len(envelopes) - len(records))
+        gate = pressure.gate("http")
+        try:
+            with gate.write():
+                created = save_records(records, batch_size=batch_size)
+        except Overloaded as e:
+            metrics.BATCH_MESSAGES["shed"].inc(len(records))
+            return retry_later(e, e.status, e.retry_after)
+        except TRANSIENT_ERRORS as e:
+            metrics.BATCH_MESSAGES["error"].inc(len(records))
+            return retry_later(
+                e, status.HTTP_503_SERVICE_UNAVAILABLE, gate.retry_after()
+            )
+        except Exception as e:
+            metrics.BATCH_MESSAGES["error"].inc(len(records))
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        metrics.record_saved(metrics.BATCH_MESSAGES, records)
+        saved = iter(records)
+        for result in results:
+            if "status" not in result:
+                is_new = next(saved).pk is not None
+                result["status"] = "created" if is_new else "duplicate"
+
+        if not records and envelopes:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(records) < len(envelopes):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(
+            {
+                "created": len(created),
+                "duplicate": len(records) - len(created),
+                "invalid": len(envelopes) - len(records),
+                "results": results,
+            },
+            status=response_status,
+        )
+
+
+class SensorAggregateView(APIView):
+    """API view for per-sensor occupancy statistics over time buckets.
+
+    The aggregation runs in the database so only one row per sensor and
+    bucket is transferred.
+    """
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "bucket",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=list(BUCKETS),
+                default="hour",
+            ),
+            openapi.Parameter(
+                "source",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=list(SOURCES),
+                default="raw",
+            ),
+            openapi.Parameter(
+                "sensor_id",
+                openapi.IN_QUERY,
+                description="Comma-separated sensor IDs.",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "start_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+            openapi.Parameter(
+                "end_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+        ]
+    )
+    @cache_response
+    def get(self, request):
+        """Retrieve aggregated sensor data.
+
+        Query parameters:
+            - bucket (optional): minute, hour (default) or day;
+            - source (optional): raw (default) or rollup; rollups are
+                                 cheaper but round the time bounds to
+                                 whole buckets;
+            - sensor_id (optional): Comma-separated sensor IDs;
+            - start_time (optional): Filter by start timestamp
+                                        (ISO 8601 format);
+            - end_time (optional): Filter by end timestamp (ISO 8601 format).
+        Args:
+            request (rest_framework.request.Request): The HTTP request object.
+        Returns:
+            rest_framework.response.Response:
+            Reading count, presence ratio and average/max dwell time per
+            sensor and bucket.
+        """
+        try:
+            return Response(
+                {
+                    "bucket": request.GET.get("bucket", "hour"),
+                    "data": aggregate_records(request.GET),
+                }
+            )
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class SensorSeriesView(APIView):
+    """API view for one sensor's readings downsampled for charting.
+
+    However many readings the range holds, each series is reduced to
+    about ``points`` points in one streaming pass, so the response and
+    the client's rendering stay bounded.
+    """
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "sensor_id",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            openapi.Parameter(
+                "start_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+                required=True,
+            ),
+            openapi.Parameter(
+                "end_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+                required=True,
+            ),
+            openapi.Parameter(
+                "points",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                default=1000,
+            ),
+            openapi.Parameter(
+                "method",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=list(METHODS),
+                default="lttb",
+            ),
+        ]
+    )
+    @cache_response
+    def get(self, request):
+        """Retrieve a downsampled dwell time and presence series.
+
+        Query parameters:
+            - sensor_id: The sensor;
+            - start_time: Start of the range (ISO 8601 format);
+            - end_time: End of the range (ISO 8601 format);
+            - points (optional): Target points per series (default 1000);
+            - method (optional): lttb (default) keeps the shape of the
+                                 dwell time curve, minmax keeps the
+                                 extremes of every bucket.
+        Args:
+            request (rest_framework.request.Request): The HTTP request object.
+        Returns:
+            rest_framework.response.Response:
+            The number of readings in the range, ``[timestamp, value]``
+            pairs of dwell time, and the ``[timestamp, present]`` pairs
+            at which presence changes.
+        """
+        try:
+            return Response(downsample_series(request.GET))
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class SensorSessionView(APIView):
+    """API view for presence sessions, i.e. visits seen by a sensor.
+
+    Sessions are maintained by the ingest paths (see
+    ``sensor.sessions``). They are not served through the response
+    cache: new readings keep extending sessions that started in the
+    past, so no range of them is ever closed.
+    """
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "sensor_id",
+                openapi.IN_QUERY,
+                description="Comma-separated sensor IDs.",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "start_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+            openapi.Parameter(
+                "end_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+            openapi.Parameter(
+                "open", openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN
+            ),
+            openapi.Parameter(
+                "page", openapi.IN_QUERY, type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                "page_size", openapi.IN_QUERY, type=openapi.TYPE_INTEGER
+            ),
+        ]
+    )
+    def get(self, request):
+        """Retrieve presence sessions, oldest first.
+
+        Query parameters:
+            - sensor_id (optional): Comma-separated sensor IDs;
+            - start_time (optional): Keep sessions ending after this
+                                     timestamp (ISO 8601 format);
+            - end_time (optional): Keep sessions starting before this
+                                   timestamp (ISO 8601 format);
+            - open (optional): true for visits still in progress, false
+                               for finished ones;
+            - page (optional): Page number for pagination;
+            - page_size (optional): Number of items per page.
+        Args:
+            request (rest_framework.request.Request): The HTTP request object.
+        Returns:
+            rest_framework.response.Response:
+            Start, end, duration in seconds, reading count, peak dwell
+            time and whether the session is still open, per session.
+        """
+        try:
+            page_size = int(request.GET.get("page_size", 20))
+            paginator = Paginator(filter_sessions(request.GET), page_size)
+            try:
+                page_obj = paginator.page(int(request.GET.get("page", 1)))
+            except Exception:
+                raise Http404("Invalid page number")
+            return Response(
+                {
+                    "count": paginator.count,
+                    "data": PresenceSessionSerializer(
+                        page_obj.object_list, many=True
+                    ).data,
+                }
+            )
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except Http404 as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class SensorLatestView(APIView):
+    """API view for the current state of every sensor.
+
+    Served from the write-through cache maintained by the ingest paths;
+    the database is only queried to warm it.
+    """
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "sensor_id",
+                openapi.IN_QUERY,
+                description="Comma-separated sensor IDs. Defaults to all.",
+                type=openapi.TYPE_STRING,
+            ),
+        ]
+    )
+    def get(self, request):
+        """Retrieve the latest reading of each sensor.
+
+        Query parameters:
+            - sensor_id (optional): Comma-separated sensor IDs.
+        Args:
+            request (rest_framework.request.Request): The HTTP request object.
+        Returns:
+            rest_framework.response.Response:
+            Current presence, last dwell time and last timestamp per
+            sensor.
+        """
+        try:
+            sensor_ids = parse_sensor_ids(request.GET) or None
+            return Response({"data": latest.get_latest(sensor_ids)})
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class SensorExportView(APIView):
+    """API view for streaming bulk exports of sensor readings.
+
+    Rows are read through a server-side cursor and written to the
+    response as they arrive, so memory stays flat and the first bytes
+    are sent before the query has finished.
+    """
+
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "format",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=["ndjson", "csv"],
+                default="ndjson",
+            ),
+            openapi.Parameter(
+                "sensor_id", openapi.IN_QUERY, type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                "start_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+            openapi.Parameter(
+                "end_time",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+        ]
+    )
+    def get(self, request):
+        """Export sensor data, oldest first.
+
+        Query parameters:
+            - format (optional): ndjson (default) or csv, also negotiable
+                                 through the Accept header;
+            - sensor_id (optional): Filter by sensor ID;
+            - start_time (optional): Filter by start timestamp
+                                        (ISO 8601 format);
+            - end_time (optional): Filter by end timestamp (ISO 8601 format).
+        Args:
+            request (rest_framework.request.Request): The HTTP request object.
+        Returns:
+            django.http.StreamingHttpResponse:
+            The matching readings in the requested format.
+        """
+        try:
+            rows = (
+                filter_records(request.GET)
+                .order_by("timestamp", "id")
+                .values_list(*RECORD_FIELDS)
+                .iterator(chunk_size=settings.SENSOR_EXPORT_CHUNK_SIZE)
+            )
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(rows, settings.SENSOR_EXPORT_CHUNK_SIZE),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="sensor-export.{renderer.format}"'
+        )
+        return response
+
+
+class SensorPressureView(APIView):
+    """API view for the write pressure on this process's push endpoints.
+
+    ``ok`` while writes are fast, ``degraded`` once slow writes lowered
+    the in-flight limit, ``shedding`` while a gate is full and pushes
+    are refused. Values are per process, like the metrics.
+    """
+
+    @swagger_auto_schema(
+        responses={200: "The overall state and the state of each gate."}
+    )
+    def get(self, request):
+        return Response(pressure.state())